@@ -1,12 +1,44 @@
 import abc
+import functools
 import inspect
-from typing import Any, Callable, Dict, Iterable, Type, Union
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Type, Union
 
-import openai
-from openai.types.chat import ChatCompletionToolParam
-from openai.types.chat.completion_create_params import Function
 from pydantic import BaseModel, create_model
 
+if TYPE_CHECKING:  # openai is slow to import, so it is only imported when the tools are actually needed
+    from openai.types.chat import ChatCompletionToolParam
+    from openai.types.chat.completion_create_params import Function
+
+
+def _output_size(result: Any) -> int:
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if isinstance(result, str):
+        return len(result.encode("utf-8", errors="replace"))
+    return 0
+
+
+def _instrumented(call: Callable) -> Callable:
+    """
+    Wraps the `__call__` of a capability, so that its latency and output size end up in the metrics. The signature is
+    kept (through `__wrapped__`), as it is used for function calling.
+    """
+    @functools.wraps(call)
+    def wrapper(self, *args, **kwargs):
+        # imported here, as hackingBuddyGPT.utils itself depends on the capabilities
+        from hackingBuddyGPT.utils import metrics
+
+        start = time.perf_counter()
+        result = call(self, *args, **kwargs)
+        name = self.get_name()
+        metrics.capability_duration.labels(name).observe(time.perf_counter() - start)
+        metrics.capability_output_bytes.labels(name).inc(_output_size(result))
+        return result
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
 
 class Capability(abc.ABC):
     """
@@ -31,9 +63,25 @@ class Capability(abc.ABC):
         """
         pass
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        call = cls.__dict__.get("__call__")
+        if call is not None and not getattr(call, "__isabstractmethod__", False) and not getattr(call, "__instrumented__", False):
+            cls.__call__ = _instrumented(call)
+
     def get_name(self) -> str:
         return type(self).__name__
 
+    def checkpoint(self) -> Optional[dict]:
+        """
+        Capabilities that keep state across rounds (eg. the flags that were already submitted) return it here as a json
+        serializable dict, so that it can be restored when a run is resumed.
+        """
+        return None
+
+    def restore(self, checkpoint: dict):  # noqa: B027
+        pass
+
     @abc.abstractmethod
     def __call__(self, *args, **kwargs):
         """
@@ -193,11 +241,13 @@ def capabilities_to_simple_text_handler(
 
 def capabilities_to_functions(
     capabilities: Dict[str, Capability],
-) -> Iterable[openai.types.chat.completion_create_params.Function]:
+) -> Iterable["Function"]:
     """
     This function takes a dictionary of capabilities and returns a dictionary of functions, that can be called with the
     parameters of the respective capabilities.
     """
+    from openai.types.chat.completion_create_params import Function
+
     return [
         Function(name=name, description=capability.describe(), parameters=capability.to_model().model_json_schema())
         for name, capability in capabilities.items()
@@ -206,11 +256,14 @@ def capabilities_to_functions(
 
 def capabilities_to_tools(
     capabilities: Dict[str, Capability],
-) -> Iterable[openai.types.chat.completion_create_params.ChatCompletionToolParam]:
+) -> Iterable["ChatCompletionToolParam"]:
     """
     This function takes a dictionary of capabilities and returns a dictionary of functions, that can be called with the
     parameters of the respective capabilities.
     """
+    from openai.types.chat import ChatCompletionToolParam
+    from openai.types.chat.completion_create_params import Function
+
     return [
         ChatCompletionToolParam(
             type="function",
@@ -12,6 +12,12 @@ class SubmitFlag(Capability):
 
     submitted_valid_flags: Set[str] = field(default_factory=set, init=False)
 
+    def checkpoint(self) -> dict:
+        return {"submitted_valid_flags": sorted(self.submitted_valid_flags)}
+
+    def restore(self, checkpoint: dict):
+        self.submitted_valid_flags = set(checkpoint["submitted_valid_flags"])
+
     def describe(self) -> str:
         return f"Submits a flag, which is the goal of all activities. The flag format is {self.flag_format}. If you find a flag following the that format, that you have not yet submitted, then the most important first step is to submit it, ignoring all other possibilities of further action"
 
@@ -1,17 +1,26 @@
 import argparse
+import functools
 import sys
 
-from hackingBuddyGPT.usecases.base import use_cases
+from hackingBuddyGPT.usecases.base import load_use_case, use_cases
+from hackingBuddyGPT.usecases.manifest import USE_CASES
 from hackingBuddyGPT.utils.configurable import CommandMap, InvalidCommand, Parseable, instantiate
 
 
-def main():
+def use_case_commands() -> CommandMap:
+    # use cases are only imported once they are selected, which keeps the startup fast
     use_case_parsers: CommandMap = {
-        name: Parseable(use_case, description=use_case.description)
-        for name, use_case in use_cases.items()
+        name: Parseable(None, description=description, loader=functools.partial(load_use_case, name))
+        for name, (_, description) in USE_CASES.items()
     }
+    for name, use_case in use_cases.items():
+        use_case_parsers.setdefault(name, Parseable(use_case, description=use_case.description))
+    return use_case_parsers
+
+
+def main():
     try:
-        instance, configuration = instantiate(sys.argv, use_case_parsers)
+        instance, configuration = instantiate(sys.argv, use_case_commands())
     except InvalidCommand as e:
         if len(f"{e}") > 0:
             print(e)
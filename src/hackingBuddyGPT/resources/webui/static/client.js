@@ -104,6 +104,9 @@
           case "ToolCallStreamPart":
             handleToolCallStreamPart(data);
             break;
+          case "HistoryPage":
+            handleHistoryPage(data);
+            break;
           default:
             console.warn("Unknown message type:", type);
         }
@@ -154,82 +157,71 @@
         }
       }
 
-      function addSectionDiv(sectionId) {
-        const messagesDiv = document.getElementById("messages");
-        const template = document.getElementById("section-template");
-        const sectionDiv = template.content
-            .cloneNode(true)
-            .querySelector(".section");
-        sectionDiv.id = `section-${sectionId}`;
-        messagesDiv.appendChild(sectionDiv);
-        return sectionDiv;
+      // The messages of the current run are kept in a model, but only a window of at most MAX_RENDERED_MESSAGES of
+      // them is rendered into the DOM. When scrolling to the top or bottom of the window, it is moved through the
+      // loaded messages, and if the oldest loaded message is reached, the next older page is requested from the server.
+      const MAX_RENDERED_MESSAGES = 200;
+      const RENDER_STEP = 50;
+      const SCROLL_THRESHOLD = 300;
+
+      let runState = newRunState();
+
+      function newRunState() {
+        return {
+          messages: new Map(),
+          messageVersions: new Map(),
+          toolCalls: new Map(),
+          sections: new Map(),
+          loadedFrom: null,
+          latestId: -1,
+          hasOlder: false,
+          loadingOlder: false,
+          windowStart: 0,
+          windowEnd: -1,
+        };
       }
 
-      let sectionColumns = [];
+      function resetRunState() {
+        runState = newRunState();
+        document.getElementById("messages").innerHTML = "";
+        document.documentElement.style.setProperty("--section-column-count", 0);
+      }
 
-      function handleSectionMessage(section) {
-        console.log("handling section message", section);
-        section.from_message += 1;
-        if (section.to_message === null) {
-          section.to_message = 99999;
-        }
-        section.to_message += 1;
-
-        let sectionDiv = document.getElementById(`section-${section.id}`);
-        if (!!sectionDiv) {
-          let columnNumber = sectionDiv.getAttribute("columnNumber");
-          let columnPosition = sectionDiv.getAttribute("columnPosition");
-          sectionColumns[columnNumber].splice(columnPosition - 1, 1);
-          sectionDiv.remove();
-        }
-        sectionDiv = addSectionDiv(section.id);
-        sectionDiv.querySelector(".section-name").textContent =
-            `${section.name} ${section.duration.toFixed(3)}s`;
-
-        let columnNumber = 0;
-        let columnPosition = 0;
-
-        // loop over the existing section Columns (format is a list of lists, whereby the inner list is [from_message, from_message], with end_message possibly being None)
-        let found = false;
-        for (let i = 0; i < sectionColumns.length; i++) {
-          const column = sectionColumns[i];
-          let columnFits = true;
-          for (let j = 0; j < column.length; j++) {
-            const [from_message, to_message] = column[j];
-            if (
-                section.from_message < to_message &&
-                from_message < section.to_message
-            ) {
-              columnFits = false;
-              break;
-            }
-          }
-          if (!columnFits) {
-            continue;
-          }
+      function isRendered(messageId) {
+        return (
+          messageId >= runState.windowStart && messageId <= runState.windowEnd
+        );
+      }
 
-          column.push([section.from_message, section.to_message]);
-          columnNumber = i;
-          columnPosition = column.length;
-          found = true;
-          break;
-        }
-        if (!found) {
-          sectionColumns.push([[section.from_message, section.to_message]]);
-          document.documentElement.style.setProperty(
-              "--section-column-count",
-              sectionColumns.length,
-          );
-          console.log(
-              "added section column",
-              sectionColumns.length,
-              sectionColumns,
-          );
+      function gridRow(messageId) {
+        return messageId - runState.windowStart + 1;
+      }
+
+      function storeMessage(message) {
+        const existing = runState.messages.get(message.id);
+        if (
+          existing &&
+          (!message.content || message.content.length === 0)
+        ) {
+          message = {...message, content: existing.content};
+        }
+        runState.messages.set(message.id, message);
+        if (
+          message.version !== undefined &&
+          message.version > (runState.messageVersions.get(message.id) || 0)
+        ) {
+          runState.messageVersions.set(message.id, message.version);
+        }
+        if (runState.loadedFrom === null || message.id < runState.loadedFrom) {
+          runState.loadedFrom = message.id;
         }
+      }
 
-        sectionDiv.style = `grid-column: ${columnNumber}; grid-row: ${section.from_message} / ${section.to_message};`;
-        sectionDiv.setAttribute("columnNumber", columnNumber);
-        sectionDiv.setAttribute("columnPosition", columnPosition);
+      function storeToolCall(toolCall) {
+        if (!runState.toolCalls.has(toolCall.message_id)) {
+          runState.toolCalls.set(toolCall.message_id, new Map());
+        }
+        runState.toolCalls.get(toolCall.message_id).set(toolCall.id, toolCall);
       }
 
       function addMessageDiv(messageId, role) {
@@ -239,7 +231,6 @@
             .cloneNode(true)
             .querySelector(".message");
         messageDiv.id = `message-${messageId}`;
-        messageDiv.style = `grid-row: ${messageId + 1};`;
         if (role === "system") {
           messageDiv.removeAttribute("open");
         }
@@ -249,14 +240,14 @@
         return messageDiv;
       }
 
-      function handleMessage(message) {
+      function renderMessage(message) {
         let messageDiv = document.getElementById(`message-${message.id}`);
         if (!messageDiv) {
           messageDiv = addMessageDiv(message.id, message.role);
         }
-        if (message.content && message.content.length > 0) {
-          messageDiv.getElementsByTagName("pre")[0].textContent = message.content;
-        }
+        messageDiv.style = `grid-row: ${gridRow(message.id)};`;
+        messageDiv.getElementsByTagName("pre")[0].textContent =
+            message.content || "";
         messageDiv.querySelector(".role").textContent = message.role;
         messageDiv.querySelector(".duration").textContent =
             `${message.duration.toFixed(3)} s`;
@@ -264,14 +255,11 @@
             `${message.tokens_query} qry tokens`;
         messageDiv.querySelector(".tokens-response").textContent =
             `${message.tokens_response} rsp tokens`;
-      }
 
-      function handleMessageStreamPart(part) {
-        let messageDiv = document.getElementById(`message-${part.message_id}`);
-        if (!messageDiv) {
-          messageDiv = addMessageDiv(part.message_id);
+        const toolCalls = runState.toolCalls.get(message.id);
+        if (toolCalls) {
+          toolCalls.forEach(renderToolCall);
         }
-        messageDiv.getElementsByTagName("pre")[0].textContent += part.content;
       }
 
       function addToolCallDiv(messageId, toolCallId, functionName) {
@@ -289,7 +277,10 @@
         return toolCallDiv;
       }
 
-      function handleToolCall(toolCall) {
+      function renderToolCall(toolCall) {
+        if (!document.getElementById(`message-${toolCall.message_id}`)) {
+          return;
+        }
         let toolCallDiv = document.getElementById(
             `message-${toolCall.message_id}-tool-call-${toolCall.id}`,
         );
@@ -310,6 +301,266 @@
             toolCall.result_text;
       }
 
+      function addSectionDiv(sectionId) {
+        const messagesDiv = document.getElementById("messages");
+        const template = document.getElementById("section-template");
+        const sectionDiv = template.content
+            .cloneNode(true)
+            .querySelector(".section");
+        sectionDiv.id = `section-${sectionId}`;
+        messagesDiv.appendChild(sectionDiv);
+        return sectionDiv;
+      }
+
+      // sections are laid out into columns, so that overlapping sections are shown next to each other. Only the parts
+      // of the sections that overlap with the rendered window are shown.
+      function renderSections() {
+        document
+            .querySelectorAll("#messages > .section")
+            .forEach((div) => div.remove());
+
+        const sectionColumns = [];
+        const sections = Array.from(runState.sections.values()).sort(
+            (a, b) => a.id - b.id,
+        );
+        for (const section of sections) {
+          const fromMessage = Math.max(
+              section.from_message,
+              runState.windowStart,
+          );
+          const toMessage = Math.min(
+              section.to_message === null ? Infinity : section.to_message,
+              runState.windowEnd + 1,
+          );
+          if (toMessage <= fromMessage) {
+            continue;
+          }
+
+          let columnNumber = sectionColumns.findIndex((column) =>
+            column.every(
+                ([from, to]) => !(fromMessage < to && from < toMessage),
+            ),
+          );
+          if (columnNumber === -1) {
+            sectionColumns.push([]);
+            columnNumber = sectionColumns.length - 1;
+          }
+          sectionColumns[columnNumber].push([fromMessage, toMessage]);
+
+          const sectionDiv = addSectionDiv(section.id);
+          sectionDiv.querySelector(".section-name").textContent =
+              `${section.conversation ? section.conversation + ": " : ""}${section.name} ${section.duration.toFixed(3)}s`;
+          sectionDiv.style = `grid-column: ${columnNumber + 1}; grid-row: ${gridRow(fromMessage)} / ${gridRow(toMessage)};`;
+        }
+        document.documentElement.style.setProperty(
+            "--section-column-count",
+            sectionColumns.length,
+        );
+      }
+
+      // moves the rendered window to [start, end], while keeping the anchor message at the same position on screen
+      function setWindow(start, end, anchorId) {
+        const content = document.getElementById("main-body");
+        const anchor =
+          anchorId !== undefined ?
+            document.getElementById(`message-${anchorId}`) :
+            null;
+        const anchorTop = anchor ? anchor.getBoundingClientRect().top : 0;
+
+        const oldStart = runState.windowStart;
+        const oldEnd = runState.windowEnd;
+        runState.windowStart = start;
+        runState.windowEnd = end;
+
+        for (let id = oldStart; id <= oldEnd; id++) {
+          if (!isRendered(id)) {
+            const div = document.getElementById(`message-${id}`);
+            if (div) {
+              div.remove();
+            }
+          }
+        }
+        for (let id = start; id <= end; id++) {
+          const message = runState.messages.get(id);
+          if (message) {
+            renderMessage(message);
+          }
+        }
+        renderSections();
+
+        if (anchor && anchor.isConnected) {
+          content.scrollTop += anchor.getBoundingClientRect().top - anchorTop;
+        }
+      }
+
+      function scrollWindowUp() {
+        if (runState.windowStart > runState.loadedFrom) {
+          const start = Math.max(
+              runState.loadedFrom,
+              runState.windowStart - RENDER_STEP,
+          );
+          const end = Math.min(
+              runState.windowEnd,
+              start + MAX_RENDERED_MESSAGES - 1,
+          );
+          setWindow(start, end, runState.windowStart);
+        } else if (runState.hasOlder && !runState.loadingOlder) {
+          runState.loadingOlder = true;
+          send("MessageRequest", {
+            follow_run: currentRun,
+            before_message: runState.loadedFrom,
+          });
+        }
+      }
+
+      function scrollWindowDown() {
+        if (runState.windowEnd < runState.latestId) {
+          const end = Math.min(
+              runState.latestId,
+              runState.windowEnd + RENDER_STEP,
+          );
+          const start = Math.max(
+              runState.windowStart,
+              end - MAX_RENDERED_MESSAGES + 1,
+          );
+          setWindow(start, end, runState.windowEnd);
+        }
+      }
+
+      document.getElementById("main-body").addEventListener(
+          "scroll",
+          debounce(() => {
+            const content = document.getElementById("main-body");
+            if (content.scrollTop < SCROLL_THRESHOLD) {
+              scrollWindowUp();
+            } else if (
+              content.scrollHeight - content.scrollTop - content.clientHeight <
+              SCROLL_THRESHOLD
+            ) {
+              scrollWindowDown();
+            }
+          }, 50),
+      );
+
+      // a new message was added at the end of the run, if the end of the run is currently rendered, the window follows it
+      function followLatest(messageId) {
+        const followingTail = runState.windowEnd >= runState.latestId;
+        runState.latestId = Math.max(runState.latestId, messageId);
+        if (followingTail && messageId > runState.windowEnd) {
+          const start = Math.max(
+              runState.windowStart,
+              messageId - MAX_RENDERED_MESSAGES + 1,
+          );
+          setWindow(start, messageId, runState.windowEnd);
+        }
+      }
+
+      function handleHistoryPage(page) {
+        if (page.run_id !== currentRun) {
+          return;
+        }
+        const isSnapshot = runState.loadedFrom === null;
+        const previousLoadedFrom = runState.loadedFrom;
+
+        page.messages.forEach(storeMessage);
+        page.tool_calls.forEach(storeToolCall);
+        page.sections.forEach((section) =>
+          runState.sections.set(section.id, section),
+        );
+        runState.hasOlder = page.has_more;
+        runState.loadingOlder = false;
+
+        if (runState.loadedFrom === null) {
+          return;
+        }
+        if (isSnapshot) {
+          runState.latestId = Math.max(
+              runState.latestId,
+              ...page.messages.map((message) => message.id),
+          );
+          setWindow(
+              Math.max(
+                  runState.loadedFrom,
+                  runState.latestId - MAX_RENDERED_MESSAGES + 1,
+              ),
+              runState.latestId,
+          );
+          scrollUpdate(true);
+        } else if (runState.loadedFrom < previousLoadedFrom) {
+          scrollWindowUp();
+        }
+      }
+
+      function handleSectionMessage(section) {
+        console.log("handling section message", section);
+        runState.sections.set(section.id, section);
+        renderSections();
+      }
+
+      function handleMessage(message) {
+        storeMessage(message);
+        if (isRendered(message.id)) {
+          renderMessage(runState.messages.get(message.id));
+        }
+        followLatest(message.id);
+      }
+
+      function handleMessageStreamPart(part) {
+        // the id of a stream part is the version of the message it results in, so parts that are already contained in
+        // the loaded history can be skipped
+        let content = part.content;
+        if (typeof part.id === "number") {
+          const version = runState.messageVersions.get(part.message_id) || 0;
+          if (part.id <= version) {
+            return;
+          }
+          if (part.merged_lengths) {
+            // the part was merged by the server from parts of which the first ones might already be in the history
+            const firstVersion = part.id - part.merged_lengths.length + 1;
+            let known = 0;
+            for (let v = firstVersion; v <= version; v++) {
+              known += part.merged_lengths[v - firstVersion];
+            }
+            content = content.substring(known);
+          }
+          runState.messageVersions.set(part.message_id, part.id);
+        }
+
+        let message = runState.messages.get(part.message_id);
+        if (!message) {
+          message = {
+            id: part.message_id,
+            role: "",
+            content: "",
+            duration: 0,
+            tokens_query: 0,
+            tokens_response: 0,
+          };
+          storeMessage(message);
+        }
+        message.content += content;
+
+        if (isRendered(part.message_id)) {
+          const messageDiv = document.getElementById(
+              `message-${part.message_id}`,
+          );
+          if (messageDiv) {
+            messageDiv.getElementsByTagName("pre")[0].textContent +=
+                content;
+          } else {
+            renderMessage(message);
+          }
+        }
+        followLatest(part.message_id);
+      }
+
+      function handleToolCall(toolCall) {
+        storeToolCall(toolCall);
+        if (isRendered(toolCall.message_id)) {
+          renderToolCall(toolCall);
+        }
+      }
+
       function handleToolCallStreamPart(part) {
         const messageDiv = document.getElementById(
             `message-${part.message_id}-tool-calls`,
@@ -333,9 +584,7 @@
           return;
         }
 
-        document.getElementById("messages").innerHTML = "";
-        sectionColumns = [];
-        document.documentElement.style.setProperty("--section-column-count", 0);
+        resetRunState();
         send("MessageRequest", {follow_run: runId});
         currentRun = runId;
         // set hash to runId via pushState
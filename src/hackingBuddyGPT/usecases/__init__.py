@@ -1,6 +1,32 @@
-from .examples import *
-from .privesc import *
-from .web import *
-from .web_api_testing import *
-from .viewer import *
-from .rag import *
\ No newline at end of file
+import importlib
+
+# the use cases are only imported when they are accessed, as they pull in heavy dependencies (see manifest.py)
+_EXPORTS = {
+    "ExPrivEscLinux": "examples",
+    "ExPrivEscLinuxTemplated": "examples",
+    "ExPrivEscLinuxHintFileUseCase": "examples",
+    "ExPrivEscLinuxLSEUseCase": "examples",
+    "LinuxPrivesc": "privesc",
+    "LinuxPrivescUseCase": "privesc",
+    "WindowsPrivesc": "privesc",
+    "WindowsPrivescUseCase": "privesc",
+    "WebTestingWithExplanation": "web",
+    "SimpleWebAPIDocumentation": "web_api_testing",
+    "SimpleWebAPITesting": "web_api_testing",
+    "Viewer": "viewer",
+    "Replayer": "viewer",
+    "ReplayImporter": "viewer",
+    "TraceExporter": "viewer",
+    "ThesisLinuxPrivescPrototype": "rag",
+    "ThesisLinuxPrivescPrototypeUseCase": "rag",
+    "Campaign": "campaign",
+    "Benchmark": "benchmark",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
@@ -1,15 +1,18 @@
 import datetime
+import functools
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from mako.template import Template
-from typing import Dict
+from typing import Dict, Optional, Union
 
 from hackingBuddyGPT.utils.logging import log_conversation, Logger, log_param
 from hackingBuddyGPT.capabilities.capability import (
     Capability,
     capabilities_to_simple_text_handler,
 )
+from hackingBuddyGPT.usecases.base import StopRun
 from hackingBuddyGPT.utils import llm_util
+from hackingBuddyGPT.utils.loop_detector import LoopDetector, fingerprint, tool_call_fingerprint
 from hackingBuddyGPT.utils.openai.openai_llm import OpenAIConnection
 
 
@@ -22,6 +25,15 @@ class Agent(ABC):
 
     llm: OpenAIConnection = None
 
+    # a command that was already executed within the last loop_window commands is not executed again: "cache" gives the
+    # LLM its earlier result, "hint" asks for a different command and "stop" gives the earlier result, but stops the run
+    # after loop_max_repeats repeats in a row ("" executes every command)
+    loop_policy: str = ""
+    loop_window: int = 10
+    loop_max_repeats: int = 3
+
+    _loop_detector: Optional[LoopDetector] = None
+
     def init(self):  # noqa: B027
         pass
 
@@ -31,11 +43,69 @@ class Agent(ABC):
     def after_run(self):  # noqa: B027
         pass
 
+    def cleanup(self):  # noqa: B027
+        pass
+
     # callback
     @abstractmethod
     def perform_round(self, turn: int) -> bool:
         pass
 
+    def checkpoint(self) -> dict:
+        capabilities = {name: capability.checkpoint() for name, capability in self._capabilities.items()}
+        checkpoint = {"capabilities": {name: state for name, state in capabilities.items() if state is not None}}
+        if self._loop_detector is not None:
+            checkpoint["loop_detector"] = self._loop_detector.checkpoint()
+        return checkpoint
+
+    def restore(self, checkpoint: dict):
+        for name, state in checkpoint.get("capabilities", {}).items():
+            if name in self._capabilities:
+                self._capabilities[name].restore(state)
+        if "loop_detector" in checkpoint:
+            self._loop_detector = LoopDetector(self.loop_window)
+            self._loop_detector.restore(checkpoint["loop_detector"])
+
+    def supports_resume(self) -> bool:
+        # the checkpoint of the base agent only contains the capabilities, agents have to add the rest of their state
+        return type(self).checkpoint is not Agent.checkpoint
+
+    def repeated_command(self, key: str, cmd: str) -> Optional[str]:
+        """
+        Returns what the LLM gets instead of the result of a command (identified by its fingerprint as key) that it
+        already ran recently, according to the loop_policy, or None if the command is to be executed.
+        """
+        if not self.loop_policy:
+            return None
+        if self.loop_policy not in ("cache", "hint", "stop"):
+            raise ValueError(f"Unknown loop_policy '{self.loop_policy}', use one of cache, hint or stop")
+        if self._loop_detector is None:
+            self._loop_detector = LoopDetector(self.loop_window)
+
+        result = self._loop_detector.lookup(key)
+        if result is None:
+            return None
+        if self.loop_policy == "stop" and self._loop_detector.repeats >= self.loop_max_repeats:
+            raise StopRun(f"no progress, the last {self._loop_detector.repeats} commands were repeats")
+        if self.loop_policy == "hint":
+            return f"You already ran `{cmd}` recently and its output is in your history, so it was not run again. Try a different command."
+        return f"{result}\n\n(this is the output of an earlier execution of `{cmd}`, it was not run again)"
+
+    def skip_repeated_command(self, message_id: int, tool_call_id: Union[int, str], key: str, cmd: str, function_name: str = "", arguments: Optional[str] = None) -> Optional[str]:
+        """
+        Checks a command with `repeated_command` and, if it is not to be executed, logs what the LLM gets instead as the
+        result of its tool call (with `arguments`, which default to the command). Returns that, or None if the command
+        is to be executed.
+        """
+        repeated = self.repeated_command(key, cmd)
+        if repeated is not None:
+            self.log.add_tool_call(message_id, tool_call_id, function_name, cmd if arguments is None else arguments, repeated, datetime.timedelta(0))
+        return repeated
+
+    def remember_command(self, key: str, result: str):
+        if self._loop_detector is not None:
+            self._loop_detector.record(key, result)
+
     def add_capability(self, cap: Capability, name: str = None, default: bool = False):
         if name is None:
             name = cap.get_name()
@@ -48,6 +118,10 @@ class Agent(ABC):
 
     def run_capability_json(self, message_id: int, tool_call_id: str, capability_name: str, arguments: str) -> str:
         capability = self.get_capability(capability_name)
+        key = tool_call_fingerprint(capability_name, arguments)
+        result = self.skip_repeated_command(message_id, tool_call_id, key, f"{capability_name} {arguments}", capability_name, arguments)
+        if result is not None:
+            return result
 
         tic = datetime.datetime.now()
         try:
@@ -55,12 +129,17 @@ class Agent(ABC):
         except Exception as e:
             result = f"EXCEPTION: {e}"
         duration = datetime.datetime.now() - tic
+        self.remember_command(key, result)
 
         self.log.add_tool_call(message_id, tool_call_id, capability_name, arguments, result, duration)
         return result
 
     def run_capability_simple_text(self, message_id: int, cmd: str) -> tuple[str, str, str, bool]:
         _capability_descriptions, parser = capabilities_to_simple_text_handler(self._capabilities, default_capability=self._default_capability)
+        key = fingerprint(cmd)
+        repeated = self.skip_repeated_command(message_id, 0, key, cmd)
+        if repeated is not None:
+            return "", cmd, repeated, False
 
         tic = datetime.datetime.now()
         try:
@@ -75,6 +154,7 @@ class Agent(ABC):
             return "", "", output, False
 
         capability, cmd, (result, got_root) = output
+        self.remember_command(key, result)
         self.log.add_tool_call(message_id, tool_call_id=0, function_name=capability, arguments=cmd, result_text=result, duration=duration)
 
         return capability, cmd, result, got_root
@@ -84,6 +164,13 @@ class Agent(ABC):
         return "You can either\n\n" + "\n".join(f"- {description}" for description in capability_descriptions.values())
 
 
+@functools.lru_cache(maxsize=None)
+def load_template(filename: str) -> Template:
+    # mako keeps the compiled module of a template file only as long as the newest Template of that file lives, so
+    # creating a Template for every agent breaks the other Templates of the same file once that agent is collected
+    return Template(filename=filename)
+
+
 @dataclass
 class AgentWorldview(ABC):
     @abstractmethod
@@ -107,7 +194,7 @@ class TemplatedAgent(Agent):
         self._state = initial_state
 
     def set_template(self, template: str):
-        self._template = Template(filename=template)
+        self._template = load_template(template)
         self._template_size = self.llm.count_tokens(self._template.source)
 
     @log_conversation("Asking LLM for a new command...")
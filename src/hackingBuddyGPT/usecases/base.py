@@ -1,12 +1,23 @@
 import abc
 import json
 import argparse
+import importlib
+import os
 from dataclasses import dataclass
 
 from hackingBuddyGPT.utils.logging import Logger, log_param
+from hackingBuddyGPT.utils.metrics import start_metrics_server
+from hackingBuddyGPT.utils.profiler import RoundProfiler, create_round_profiler
 from typing import Dict, Type, TypeVar, Generic
 
 from hackingBuddyGPT.utils.configurable import Transparent, configurable
+from hackingBuddyGPT.usecases.manifest import USE_CASES
+
+class StopRun(Exception):
+    """
+    Raised in a round to end the run early (as a failure with the message of the exception as reason).
+    """
+
 
 @dataclass
 class UseCase(abc.ABC):
@@ -54,6 +65,20 @@ class UseCase(abc.ABC):
 @dataclass
 class AutonomousUseCase(UseCase, abc.ABC):
     max_turns: int = 10
+    # if set (as host:port), the metrics of the agent are served at http://<metrics_address>/metrics during the run
+    metrics_address: str = ""
+    # profiles every round with "cprofile" or "sampling" (see hackingBuddyGPT.utils.profiler), the profiles and a
+    # summary of the run are written to <profile_dir>/run_<run id>/
+    profile: str = ""
+    profile_dir: str = "profiles"
+    profile_top: int = 25
+    profile_interval: float = 0.005
+    # continues the interrupted run with this id (which has to be started with the same configuration and the
+    # local_logger) after the last round that it finished, instead of starting a new run
+    resume: int = 0
+    # a run that is still in progress is only resumed once nothing was logged to it for this many seconds, as its
+    # process might otherwise still be running it
+    resume_stale_after: int = 600
 
     _got_root: bool = False
 
@@ -67,27 +92,80 @@ class AutonomousUseCase(UseCase, abc.ABC):
     def after_run(self):
         pass
 
+    def cleanup(self):
+        """
+        Called once the run is over, also if it ended with an exception, to release what the run holds (eg. threads).
+        """
+        pass
+
+    def checkpoint(self) -> dict:
+        """
+        Returns the state that is needed to continue the run after the current round, as a json serializable dict. It
+        is saved after every round, and given to `restore` (after `before_run`) when the run is resumed.
+        """
+        return {}
+
+    def restore(self, checkpoint: dict):
+        pass
+
+    def supports_resume(self) -> bool:
+        """
+        Runs can only be resumed by use cases that save all of their state with `checkpoint`.
+        """
+        return type(self).checkpoint is not AutonomousUseCase.checkpoint
+
     def run(self, configuration):
         self.configuration = configuration
-        self.log.start_run(self.get_name(), self.serialize_configuration(configuration))
+        metrics_server = start_metrics_server(self.metrics_address)
+        checkpoint = None
+        if self.resume:
+            if not self.supports_resume():
+                raise ValueError(f"{self.get_name()} does not save its state in checkpoints, so its runs can not be resumed")
+            checkpoint = self.log.resume_run(self.resume, self.get_name(), self.resume_stale_after)
+        else:
+            self.log.start_run(self.get_name(), self.serialize_configuration(configuration))
+
+        profiler = create_round_profiler(self.profile, os.path.join(self.profile_dir, f"run_{self.log.run.id}"), self.profile_top, self.profile_interval)
 
         self.before_run()
 
+        saves_checkpoints = self.supports_resume()
         turn = 1
+        if checkpoint is not None:
+            last_turn, state = checkpoint
+            self.restore(json.loads(state))
+            turn = last_turn + 1
+        if self.resume:
+            self.log.status_message(f"Resuming the run at turn {turn}")
+
+        stop_reason = None
         try:
-            while turn <= self.max_turns and not self._got_root:
+            while turn <= self.max_turns and not self._got_root and stop_reason is None:
                 with self.log.section(f"round {turn}"):
                     self.log.console.log(f"[yellow]Starting turn {turn} of {self.max_turns}")
 
-                    self._got_root = self.perform_round(turn)
+                    if profiler is not None:
+                        profiler.start_round(turn)
+                    try:
+                        self._got_root = self.perform_round(turn)
+                    except StopRun as e:
+                        stop_reason = str(e)
+                    finally:
+                        if profiler is not None:
+                            profiler.end_round(turn)
 
                     turn += 1
 
+                if saves_checkpoints:
+                    self.log.save_checkpoint(turn - 1, json.dumps(self.checkpoint()))
+
             self.after_run()
 
             # write the final result to the database and console
             if self._got_root:
                 self.log.run_was_success()
+            elif stop_reason is not None:
+                self.log.run_was_failure(stop_reason)
             else:
                 self.log.run_was_failure("maximum turn number reached")
 
@@ -96,6 +174,17 @@ class AutonomousUseCase(UseCase, abc.ABC):
             import traceback
             self.log.run_was_failure("exception occurred", details=f":\n\n{traceback.format_exc()}")
             raise
+        finally:
+            self.cleanup()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            if profiler is not None:
+                self.report_profile(profiler)
+
+    def report_profile(self, profiler: RoundProfiler):
+        summary = profiler.finish()
+        self.log.console.print(f"[bold]Profile of the run[/bold] (written to {profiler.directory})")
+        self.log.console.print(summary, markup=False, highlight=False)
 
 
 use_cases: Dict[str, configurable] = dict()
@@ -133,9 +222,21 @@ class AutonomousAgentUseCase(AutonomousUseCase, Generic[T]):
             def after_run(self):
                 return self.agent.after_run()
 
+            def cleanup(self):
+                return self.agent.cleanup()
+
             def perform_round(self, turn: int):
                 return self.agent.perform_round(turn)
 
+            def checkpoint(self) -> dict:
+                return self.agent.checkpoint()
+
+            def restore(self, checkpoint: dict):
+                self.agent.restore(checkpoint)
+
+            def supports_resume(self) -> bool:
+                return self.agent.supports_resume()
+
         constructed_class = dataclass(AutonomousAgentUseCase)
 
         return constructed_class
@@ -153,6 +254,16 @@ def use_case(description):
     return inner
 
 
+def load_use_case(name: str) -> configurable:
+    """
+    Returns the use case with the given name, importing the module that registers it (according to the manifest) if
+    that did not yet happen.
+    """
+    if name not in use_cases and name in USE_CASES:
+        importlib.import_module(USE_CASES[name][0])
+    return use_cases[name]
+
+
 def register_use_case(name: str, description: str, use_case: Type[UseCase]):
     """
     This function is used to register a UseCase that was created manually, and not through the use_case decorator.
@@ -0,0 +1,277 @@
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from mako.template import Template
+from rich.table import Table
+
+from hackingBuddyGPT.usecases.base import AutonomousUseCase, UseCase, use_case
+from hackingBuddyGPT.utils import Console, DbStorage, ui
+from hackingBuddyGPT.utils.fakes import EndlessFakeLLM, GeneratedOutputSSHConnection
+from hackingBuddyGPT.utils.logging import LocalLogger
+
+BENCHMARK_AGENTS = ("LinuxPrivesc", "ExPrivEscLinux", "ExPrivEscLinuxTemplated")
+
+LOGGER_METHODS = ("add_message", "add_tool_call", "log_section", "finalize_section", "call_response", "status_message", "system_message", "save_checkpoint")
+DB_WRITE_METHODS = ("add_message", "add_or_update_message", "add_section", "add_tool_call", "handle_message_update", "finalize_message", "save_checkpoint", "run_was_success", "run_was_failure")
+CONSOLE_METHODS = ("print", "log", "print_message", "print_tool_call")
+
+_MISSING = object()
+
+
+class StageTimer:
+    """
+    Measures the time that goes into the stages of a round, by wrapping the functions that make up a stage. Stages
+    that are entered from within another stage (eg. the database writes of the logger) pause it, so that every
+    measured second is attributed to exactly one stage. Only calls from a single thread are supported.
+    """
+
+    def __init__(self):
+        self.totals: dict[str, float] = defaultdict(float)
+        self._stack: list[list] = []  # [stage, time at which it was entered or resumed]
+        self._patched: list[tuple[Any, str, Any]] = []
+
+    def enter(self, stage: str):
+        now = time.perf_counter()
+        if self._stack:
+            outer = self._stack[-1]
+            self.totals[outer[0]] += now - outer[1]
+        self._stack.append([stage, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        stage, started_at = self._stack.pop()
+        self.totals[stage] += now - started_at
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def timed(self, stage: str, function: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            self.enter(stage)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.exit()
+
+        return wrapper
+
+    def patch(self, owner: Any, name: str, replacement: Any):
+        self._patched.append((owner, name, vars(owner).get(name, _MISSING)))
+        setattr(owner, name, replacement)
+
+    def instrument(self, stage: str, owner: Any, *names: str):
+        for name in names:
+            self.patch(owner, name, self.timed(stage, getattr(owner, name)))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patched):
+            if original is _MISSING:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patched.clear()
+
+
+def memory_usage() -> tuple[int, int]:
+    """
+    Returns the resident set size of the process in bytes (0 where it can not be read) and the number of memory blocks
+    allocated by the Python interpreter.
+    """
+    rss = 0
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    return rss, sys.getallocatedblocks()
+
+
+def growth_per_round(samples: list[dict], key: str) -> float:
+    # the first half of the run is warm-up (caches, the history filling up), growth after that is what accumulates
+    later = samples[len(samples) // 2:]
+    if len(later) < 2 or later[-1]["round"] == later[0]["round"]:
+        return 0.0
+    return (later[-1][key] - later[0][key]) / (later[-1]["round"] - later[0]["round"])
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list[str]:
+    """
+    Returns the regressions of the result against the baseline (both as written by the Benchmark use case), which are a
+    drop of the rounds per second or a rise of the overhead per round by more than max_regression (a fraction).
+    """
+    regressions = []
+    if result["rounds_per_second"] < baseline["rounds_per_second"] * (1 - max_regression):
+        regressions.append(f"rounds per second dropped from {baseline['rounds_per_second']:.1f} to {result['rounds_per_second']:.1f}")
+    if result["overhead_ms_per_round"] > baseline["overhead_ms_per_round"] * (1 + max_regression):
+        regressions.append(f"overhead per round rose from {baseline['overhead_ms_per_round']:.3f}ms to {result['overhead_ms_per_round']:.3f}ms")
+    return regressions
+
+
+@use_case("Measures the overhead of the agent loop, with a fake LLM and a fake target")
+class Benchmark(UseCase):
+    """
+    Runs an agent for a number of rounds against an LLM and a target that answer instantly (see utils/fakes.py), so
+    that everything that is measured is the cost of the orchestration: rendering the templates, counting tokens,
+    parsing and handling the commands, logging, the log database and the console. The LLM cycles through enumeration
+    commands, so the agent never gets root and the history is always full.
+
+    The result (rounds per second, milliseconds per round by stage and the memory growth per round) is printed and,
+    with `output`, written as JSON. Given the JSON of an earlier benchmark as `baseline`, the benchmark fails (with exit
+    code 1) if it got slower by more than `max_regression`, so it can be used to compare commits.
+    """
+
+    agent: str = "LinuxPrivesc"
+    rounds: int = 500
+    history_size: int = 4096  # context size of the fake LLM in tokens, which the history is fitted into
+    output_size: int = 2000  # characters of output of every command
+    database: str = ":memory:"
+    console_mode: str = "headless"
+    memory_samples: int = 10
+    label: str = ""  # stored with the result, eg. the commit
+    output: str = ""
+    baseline: str = ""
+    max_regression: float = 0.1
+
+    _result: dict = field(default_factory=dict)
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def create_use_case(self, log: LocalLogger) -> AutonomousUseCase:
+        llm = EndlessFakeLLM(self.history_size)
+        conn = GeneratedOutputSSHConnection(self.output_size)
+        if self.agent == "LinuxPrivesc":
+            from hackingBuddyGPT.usecases.privesc.linux import LinuxPrivesc, LinuxPrivescUseCase
+            return LinuxPrivescUseCase(agent=LinuxPrivesc(conn=conn, llm=llm, log=log), log=log, max_turns=self.rounds)
+        if self.agent == "ExPrivEscLinux":
+            from hackingBuddyGPT.usecases.examples.agent import ExPrivEscLinux, ExPrivEscLinuxUseCase
+            return ExPrivEscLinuxUseCase(agent=ExPrivEscLinux(conn=conn, llm=llm, log=log), log=log, max_turns=self.rounds)
+        if self.agent == "ExPrivEscLinuxTemplated":
+            from hackingBuddyGPT.usecases.examples.agent_with_state import (
+                ExPrivEscLinuxTemplated,
+                ExPrivEscLinuxTemplatedUseCase,
+            )
+            return ExPrivEscLinuxTemplatedUseCase(agent=ExPrivEscLinuxTemplated(conn=conn, llm=llm, log=log), log=log, max_turns=self.rounds)
+        raise ValueError(f"Unknown agent '{self.agent}', use one of {', '.join(BENCHMARK_AGENTS)}")
+
+    def instrument(self, timer: StageTimer, use_case: AutonomousUseCase, log: LocalLogger, memory: list[dict]):
+        from hackingBuddyGPT.usecases import agents
+        from hackingBuddyGPT.usecases.privesc import common
+
+        agent = use_case.agent
+        timer.instrument("template rendering", Template, "render")
+        timer.instrument("token counting", agent.llm, "count_tokens")
+        timer.instrument("llm (fake)", agent.llm, "get_response")
+        timer.instrument("target (fake)", agent.conn, "run")
+        timer.instrument("logging", log, *LOGGER_METHODS)
+        timer.instrument("db writes", log.log_db, *DB_WRITE_METHODS)
+        timer.instrument("db reads", log.log_db, "get_round_data")
+        timer.instrument("console", log.console, *CONSOLE_METHODS)
+        timer.instrument("history table", ui, "add_history_row")
+        timer.instrument("checkpoints", use_case, "checkpoint")
+
+        # the parser that is created by the handler does the parsing and runs the capability
+        for module in (agents, common):
+            create_handler = module.capabilities_to_simple_text_handler
+
+            def timed_handler(*args, create_handler=create_handler, **kwargs):
+                descriptions, parser = create_handler(*args, **kwargs)
+                return descriptions, timer.timed("capabilities", parser)
+
+            timer.patch(module, "capabilities_to_simple_text_handler", timer.timed("capabilities", timed_handler))
+
+        sample_every = max(1, self.rounds // max(1, self.memory_samples))
+        perform_round = use_case.perform_round
+
+        def sampled_round(turn: int):
+            result = perform_round(turn)
+            if turn % sample_every == 0 or turn == self.rounds:
+                rss, blocks = memory_usage()
+                memory.append({"round": turn, "rss": rss, "blocks": blocks})
+            return result
+
+        timer.patch(use_case, "perform_round", sampled_round)
+
+    def run(self, configuration):
+        log_db = DbStorage(self.database)
+        log_db.init()
+        log = LocalLogger(log_db=log_db, console=Console(mode=self.console_mode), tag=f"benchmark {self.label}".strip())
+        use_case = self.create_use_case(log)
+        use_case.init()
+
+        timer = StageTimer()
+        rss, blocks = memory_usage()
+        memory = [{"round": 0, "rss": rss, "blocks": blocks}]
+        self.instrument(timer, use_case, log, memory)
+        try:
+            started_at = time.perf_counter()
+            use_case.run(configuration)
+            duration = time.perf_counter() - started_at
+        finally:
+            timer.restore()
+
+        self._result = self.evaluate(duration, timer.totals, memory)
+        self.report(self._result)
+        if self.output:
+            with open(self.output, "w") as f:
+                json.dump(self._result, f, indent=2)
+
+        if self.baseline:
+            with open(self.baseline) as f:
+                regressions = compare(self._result, json.load(f), self.max_regression)
+            for regression in regressions:
+                self.log.console.print(f"[bold red]Regression: {regression}")
+            if regressions:
+                raise SystemExit(1)
+        return self._result
+
+    def evaluate(self, duration: float, totals: dict[str, float], memory: list[dict]) -> dict:
+        stages = {stage: seconds * 1000 / self.rounds for stage, seconds in sorted(totals.items())}
+        fakes = stages.get("llm (fake)", 0) + stages.get("target (fake)", 0)
+        per_round = duration * 1000 / self.rounds
+        stages["other"] = per_round - sum(stages.values())
+        return {
+            "label": self.label,
+            "created_at": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "configuration": {
+                "agent": self.agent,
+                "rounds": self.rounds,
+                "history_size": self.history_size,
+                "output_size": self.output_size,
+                "database": self.database,
+                "console_mode": self.console_mode,
+            },
+            "duration": duration,
+            "rounds_per_second": self.rounds / duration,
+            # the time of a round without the (fake) LLM and target
+            "overhead_ms_per_round": per_round - fakes,
+            "stages_ms_per_round": stages,
+            "memory": {
+                "samples": memory,
+                "rss_growth_per_round": growth_per_round(memory, "rss"),
+                "blocks_growth_per_round": growth_per_round(memory, "blocks"),
+            },
+        }
+
+    def report(self, result: dict):
+        console = self.log.console
+        console.print(f"[bold]{result['configuration']['agent']}[/bold]: {result['rounds_per_second']:.1f} rounds per second, "
+                      f"{result['overhead_ms_per_round']:.3f}ms overhead per round")
+        table = Table(title="Time per round by stage")
+        table.add_column("Stage")
+        table.add_column("ms", justify="right")
+        table.add_column("%", justify="right")
+        total = sum(result["stages_ms_per_round"].values())
+        for stage, ms in sorted(result["stages_ms_per_round"].items(), key=lambda item: -item[1]):
+            table.add_row(stage, f"{ms:.3f}", f"{100 * ms / total:.1f}" if total else "")
+        console.print(table)
+        memory = result["memory"]
+        console.print(f"Memory growth per round: {memory['rss_growth_per_round'] / 1024:.1f}KiB resident, "
+                      f"{memory['blocks_growth_per_round']:.1f} allocated blocks")
@@ -0,0 +1,293 @@
+import configparser
+import datetime
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import yaml
+
+from hackingBuddyGPT.usecases.base import UseCase, use_case
+from hackingBuddyGPT.utils.rate_limiter import BudgetExceeded, SharedRateLimiter, install_rate_limiter
+
+
+@dataclass(frozen=True)
+class Target:
+    name: str
+    group: str
+    host: str
+    port: Optional[int] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.group}/{self.name}"
+
+
+def read_inventory(path: str, groups: Optional[list[str]] = None) -> list[Target]:
+    """
+    Reads the targets from an ansible inventory in INI format (like scripts/hosts.ini). Every host of a group is a
+    target (the group usually being the vulnerability class that was set up on it), hosts that are not in any group
+    are targets of the group "ungrouped". `ansible_host` and `ansible_port` of a host are respected.
+    """
+    parser = configparser.ConfigParser(allow_no_value=True, delimiters=("=",), default_section="__ungrouped_defaults__")
+    parser.optionxform = str  # host names are case-sensitive
+    with open(path) as f:
+        # hosts before the first group are ungrouped, which configparser needs a section for
+        parser.read_string("[ungrouped]\n" + f.read(), source=path)
+
+    targets: list[Target] = []
+    grouped_hosts = set()
+    for group in parser.sections():
+        if ":" in group:  # :vars and :children sections
+            continue
+        for line, variables in parser.items(group, raw=True):
+            # configparser splits "host ansible_port=2222" at the first "=", so the line is put back together
+            parts = (line if variables is None else f"{line}={variables}").split()
+            name, host_variables = parts[0], dict(part.split("=", 1) for part in parts[1:] if "=" in part)
+            if group != "ungrouped":
+                grouped_hosts.add(name)
+            port = host_variables.get("ansible_port")
+            targets.append(Target(name, group, host_variables.get("ansible_host", name), int(port) if port else None))
+
+    targets = [target for target in targets if target.group != "ungrouped" or target.name not in grouped_hosts]
+    if groups:
+        targets = [target for target in targets if target.group in groups]
+    return targets
+
+
+def read_group_descriptions(path: str) -> dict[str, str]:
+    """
+    Returns the names of the plays of an ansible playbook (like scripts/tasks.yaml) by the groups that they are
+    applied to, which describe the vulnerability that was set up for the group and can be used as hint.
+    """
+    with open(path) as f:
+        plays = yaml.safe_load(f) or []
+
+    descriptions: dict[str, str] = {}
+    for play in plays:
+        for group in str(play.get("hosts", "")).replace(":", ",").split(","):
+            group = group.strip()
+            if group and group != "all" and "name" in play:
+                descriptions[group] = play["name"]
+    return descriptions
+
+
+def format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+@dataclass
+class Job:
+    target: Target
+    values: dict[str, Any]  # the combination of the matrix, which identifies the job together with target and repetition
+    repetition: int
+    parameters: dict[str, Any] = field(default_factory=dict)  # the same for all jobs (and can contain secrets)
+
+    @property
+    def key(self) -> str:
+        return " ".join([self.target.key] + [f"{name}={format_value(value)}" for name, value in self.values.items()] + [f"rep={self.repetition}"])
+
+    def arguments(self, hints: dict[str, str]) -> list[str]:
+        arguments = [f"--conn.host={self.target.host}", f"--conn.hostname={self.target.name}"]
+        if self.target.port is not None:
+            arguments.append(f"--conn.port={self.target.port}")
+        for name, value in {**self.parameters, **self.values}.items():
+            if name == "hint" and isinstance(value, bool):
+                # a boolean hint selects whether the description of the vulnerability of the target is given as hint
+                value = hints.get(self.target.group, "") if value else ""
+            arguments.append(f"--{name}={format_value(value)}")
+        return arguments
+
+
+def plan_jobs(targets: list[Target], parameters: dict[str, Any], matrix: dict[str, list[Any]], repetitions: int) -> list[Job]:
+    """
+    Every combination of the values in the matrix is run against every target, `repetitions` times each.
+    """
+    names = list(matrix.keys())
+    combinations = [dict(zip(names, values, strict=True)) for values in itertools.product(*(matrix[name] for name in names))]
+    return [
+        Job(target, combination, repetition, parameters)
+        for repetition in range(1, repetitions + 1)
+        for target in targets
+        for combination in combinations
+    ]
+
+
+class CampaignProgress:
+    """
+    Keeps track of the finished jobs of a campaign in a .jsonl file, so that an interrupted campaign can be resumed.
+    Jobs that failed with an error (and not just did not get root) are tried again when resuming.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.finished: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if entry["error"] is None:
+                            self.finished[entry["job"]] = entry
+                        else:
+                            self.finished.pop(entry["job"], None)
+
+    def is_finished(self, job: Job) -> bool:
+        return job.key in self.finished
+
+    def record(self, job: Job, result: dict):
+        entry = {"job": job.key, "at": datetime.datetime.now().isoformat(), **result}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        if entry["error"] is None:
+            self.finished[job.key] = entry
+
+
+def _init_worker(limiter: SharedRateLimiter):
+    install_rate_limiter(limiter)
+
+
+def close_connections(instance: Optional[UseCase]):
+    """
+    Closes the connections to the target and the log database of a finished job, as the worker process is reused for
+    the next jobs.
+    """
+    if instance is None:
+        return
+    for owner in (instance, getattr(instance, "agent", None)):
+        conn = getattr(owner, "conn", None)
+        if conn is not None and hasattr(conn, "close"):
+            conn.close()
+    log_db = getattr(getattr(instance, "log", None), "log_db", None)
+    if log_db is not None:
+        log_db.close()
+
+
+def run_job(use_case_name: str, arguments: list[str], imports: tuple[str, ...] = ()) -> dict:
+    """
+    Runs a single job of a campaign in a worker process, configured through the same command line parsing (including
+    .env and environment variables) as a run started with wintermute. `imports` are the modules that register use cases
+    which are not part of hackingBuddyGPT.
+    """
+    from hackingBuddyGPT.cli.wintermute import use_case_commands
+    from hackingBuddyGPT.utils.configurable import instantiate
+
+    instance = None
+    try:
+        for module in imports:
+            importlib.import_module(module)
+        instance, configuration = instantiate(["wintermute", use_case_name] + arguments, use_case_commands())
+        result = instance.run(configuration)
+        return {"result": result, "run_id": instance.log.run.id, "error": None, "budget_exceeded": False}
+    except BudgetExceeded as e:
+        run = getattr(getattr(instance, "log", None), "run", None)
+        return {"result": None, "run_id": run.id if run else None, "error": str(e), "budget_exceeded": True}
+    except Exception as e:
+        run = getattr(getattr(instance, "log", None), "run", None)
+        return {"result": None, "run_id": run.id if run else None, "error": f"{type(e).__name__}: {e}", "budget_exceeded": False}
+    finally:
+        close_connections(instance)
+
+
+@use_case("Runs a use case against a fleet of targets with a matrix of configurations")
+class Campaign(UseCase):
+    """
+    The campaign file (YAML or JSON) describes what to run, eg.:
+
+        name: gpt-4o-baseline
+        use_case: LinuxPrivesc
+        imports: [my_package.use_cases] # optional, modules that register use cases outside of hackingBuddyGPT
+        inventory: scripts/hosts.ini
+        tasks: scripts/tasks.yaml       # optional, the play names are used as hints
+        groups: [vuln_suid_gtfo]        # optional, defaults to all groups of the inventory
+        repetitions: 5
+        parameters:                     # passed to every run
+          conn.username: lowpriv
+          conn.password: trustno1
+          max_turns: 20
+        matrix:                         # every combination is run against every target
+          llm.model: [gpt-4o, gpt-4o-mini]
+          hint: [true, false]
+          enable_update_state: [true, false]
+
+    Runs are executed in `workers` processes, which share the LLM rate limits and token budget, and log to the same
+    database as the campaign (tagged with the campaign name and the job).
+    """
+
+    campaign_file: str = ""
+    workers: int = 4
+    requests_per_minute: float = 0
+    tokens_per_minute: float = 0
+    token_budget: int = 0
+    progress_file: str = ""
+    worker_console: str = "headless"
+
+    _config: dict = field(default_factory=dict)
+
+    def init(self):
+        super().init()
+        with open(self.campaign_file) as f:
+            self._config = yaml.safe_load(f)
+        if not self.progress_file:
+            self.progress_file = os.path.splitext(self.campaign_file)[0] + ".progress.jsonl"
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def _relative(self, path: str) -> str:
+        # paths in the campaign file are relative to it
+        return os.path.join(os.path.dirname(os.path.abspath(self.campaign_file)), path)
+
+    def plan(self) -> list[Job]:
+        targets = read_inventory(self._relative(self._config["inventory"]), self._config.get("groups"))
+        return plan_jobs(targets, self._config.get("parameters", {}), self._config.get("matrix", {}), self._config.get("repetitions", 1))
+
+    def worker_arguments(self, job: Job, hints: dict[str, str]) -> list[str]:
+        name = self._config.get("name", os.path.splitext(os.path.basename(self.campaign_file))[0])
+        arguments = [f"--log.tag={name} {job.key}", f"--log.console.mode={self.worker_console}"]
+        if hasattr(self.log, "log_db"):
+            arguments.append(f"--log_db.connection_string={self.log.log_db.connection_string}")
+        # the arguments of the job come last, so that they can override the defaults of the campaign
+        return arguments + job.arguments(hints)
+
+    def run(self, configuration):
+        hints = read_group_descriptions(self._relative(self._config["tasks"])) if "tasks" in self._config else {}
+        progress = CampaignProgress(self.progress_file)
+        jobs = self.plan()
+        pending = [job for job in jobs if not progress.is_finished(job)]
+        console = self.log.console
+        console.print(f"[bold]Campaign[/bold] {len(jobs)} jobs, {len(jobs) - len(pending)} already finished, running {len(pending)} with {self.workers} workers")
+
+        context = multiprocessing.get_context("spawn")
+        limiter = SharedRateLimiter(self.requests_per_minute, self.tokens_per_minute, self.token_budget, context=context)
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker, initargs=(limiter,))
+        budget_exceeded = False
+        got_root = 0
+        try:
+            imports = tuple(self._config.get("imports", []))
+            futures = {executor.submit(run_job, self._config["use_case"], self.worker_arguments(job, hints), imports): job for job in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                result = future.result()
+                progress.record(job, result)
+                got_root += result["result"] is True
+
+                state = "[green]root" if result["result"] else ("[red]error: " + result["error"] if result["error"] else "[yellow]no root")
+                console.print(f"[{done}/{len(pending)}] {job.key} (run {result['run_id']}): {state}", highlight=False)
+
+                if result["budget_exceeded"] and not budget_exceeded:
+                    budget_exceeded = True
+                    console.print("[bold red]Token budget used up, the remaining jobs are not started (resume the campaign to run them)")
+                    for other in futures:
+                        other.cancel()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        console.print(f"[bold]Campaign finished[/bold]: {got_root} of {len(pending)} runs got root, {limiter.used_tokens} tokens used")
+        return not budget_exceeded
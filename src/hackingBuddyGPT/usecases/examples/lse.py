@@ -1,4 +1,7 @@
 import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 
 from mako.template import Template
 
@@ -6,6 +9,7 @@ from hackingBuddyGPT.capabilities import SSHRunCommand
 from hackingBuddyGPT.usecases.base import UseCase, use_case
 from hackingBuddyGPT.usecases.privesc.linux import LinuxPrivesc, LinuxPrivescUseCase
 from hackingBuddyGPT.utils import SSHConnection
+from hackingBuddyGPT.utils.logging import LoggerBranch
 from hackingBuddyGPT.utils.openai.openai_llm import OpenAIConnection
 
 template_dir = pathlib.Path(__file__).parent
@@ -26,6 +30,10 @@ class ExPrivEscLinuxLSEUseCase(UseCase):
     # use either an use-case or an agent to perform the privesc
     use_use_case: bool = False
 
+    # try all hints at the same time, each with its own agent and SSH session, instead of one after another (only with
+    # agents). As soon as one of them gets root, the others are stopped.
+    parallel: bool = False
+
     # simple helper that uses lse.sh to get hints from the system
     def call_lse_against_host(self):
         self.log.console.print("[green]performing initial enumeration with lse.sh")
@@ -43,11 +51,28 @@ class ExPrivEscLinuxLSEUseCase(UseCase):
     def get_name(self) -> str:
         return self.__class__.__name__
 
-    def run(self):
+    def run(self, configuration):
+        self.configuration = configuration
+        if not self.use_use_case:
+            self.log.start_run(self.get_name(), self.serialize_configuration(configuration))
+
         # get the hints through running LSE on the target system
         hints = self.call_lse_against_host()
         turns_per_hint = int(self.max_turns / len(hints))
 
+        if self.parallel and not self.use_use_case:
+            result = self.run_in_parallel(hints, turns_per_hint)
+        else:
+            result = self.run_one_after_another(hints, turns_per_hint)
+
+        if not self.use_use_case:
+            if result:
+                self.log.run_was_success()
+            else:
+                self.log.run_was_failure("no hint led to root")
+        return result
+
+    def run_one_after_another(self, hints, turns_per_hint) -> bool:
         # now try to escalate privileges using the hints
         for hint in hints:
             if self.use_use_case:
@@ -60,6 +85,53 @@ class ExPrivEscLinuxLSEUseCase(UseCase):
             if result is True:
                 self.log.console.print("[green]Got root!")
                 return True
+        return False
+
+    def run_in_parallel(self, hints, turns_per_hint) -> bool:
+        self.log.console.print(f"[yellow]Calling {len(hints)} agents in parallel to perform the privilege escalation")
+
+        stop = threading.Event()
+        log_lock = threading.Lock()
+        connections: list[Optional[SSHConnection]] = [None] * len(hints)
+
+        with self.log.section(f"exploring {len(hints)} hints in parallel"):
+            with ThreadPoolExecutor(max_workers=len(hints), thread_name_prefix="hint") as executor:
+                futures = [
+                    executor.submit(self.run_hint_branch, index, hint, turns_per_hint, LoggerBranch(self.log, f"hint {index + 1}", log_lock), connections, stop)
+                    for index, hint in enumerate(hints)
+                ]
+                for future in as_completed(futures):
+                    if future.result() is True and not stop.is_set():
+                        self.log.console.print(f"[green]Got root with hint {futures.index(future) + 1}!")
+                        # the other agents stop after their current round, closing their connections also interrupts
+                        # commands that are still running on the target
+                        stop.set()
+                        for index, conn in enumerate(connections):
+                            if conn is not None and index != futures.index(future):
+                                conn.close()
+
+        return stop.is_set()
+
+    def run_hint_branch(self, index, hint, turns_per_hint, log, connections, stop: threading.Event) -> bool:
+        with log.section(f"hint {index + 1}: {hint}"):
+            try:
+                # every agent gets its own SSH session, as commands of the agents must not block each other
+                conn = self.conn.new_with()
+                conn.init()
+                connections[index] = conn
+                if stop.is_set():
+                    return False
+
+                agent = self.create_agent(hint, conn, log)
+                return self.run_agent(agent, turns_per_hint, log, stop)
+            except Exception as e:
+                if stop.is_set():
+                    return False  # most likely the connection was closed as another agent got root
+                log.status_message(f"agent for hint {index + 1} failed: {type(e).__name__}: {e}")
+                return False
+            finally:
+                if connections[index] is not None:
+                    connections[index].close()
 
     def run_using_usecases(self, hint, turns_per_hint):
         # TODO: init usecase
@@ -75,31 +147,40 @@ class ExPrivEscLinuxLSEUseCase(UseCase):
             max_turns=turns_per_hint,
             log=self.log,
         )
-        linux_privesc.init(self.configuration)
-        return linux_privesc.run()
+        linux_privesc.init()
+        return linux_privesc.run(self.configuration)
 
     def run_using_agent(self, hint, turns_per_hint):
+        return self.run_agent(self.create_agent(hint, self.conn, self.log), turns_per_hint, self.log)
+
+    def create_agent(self, hint, conn, log) -> LinuxPrivesc:
         # init agent
         agent = LinuxPrivesc(
-            conn=self.conn,
+            conn=conn,
             llm=self.llm,
             hint=hint,
             enable_explanation=self.enable_explanation,
             enable_update_state=self.enable_update_state,
             disable_history=self.disable_history,
         )
-        agent.log = self.log
+        agent.log = log
         agent.init()
+        return agent
 
+    def run_agent(self, agent, turns_per_hint, log, stop: Optional[threading.Event] = None) -> bool:
         # perform the privilege escalation
         agent.before_run()
         turn = 1
         got_root = False
-        while turn <= turns_per_hint and not got_root:
-            self.log.console.log(f"[yellow]Starting turn {turn} of {turns_per_hint}")
-
-            if agent.perform_round(turn) is True:
-                got_root = True
+        # the round statistics of the log database expect rounds that do not overlap, which the rounds of parallel
+        # agents do, so they are logged as turns instead
+        section = "round" if stop is None else "turn"
+        while turn <= turns_per_hint and not got_root and not (stop is not None and stop.is_set()):
+            with log.section(f"{section} {turn}"):
+                log.console.log(f"[yellow]Starting turn {turn} of {turns_per_hint}")
+
+                if agent.perform_round(turn) is True:
+                    got_root = True
             turn += 1
 
         # cleanup and finish
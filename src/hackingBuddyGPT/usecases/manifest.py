@@ -0,0 +1,27 @@
+"""
+The use cases that ship with hackingBuddyGPT, with the module that registers them (through @use_case) and their
+description.
+
+This allows the CLI to list all use cases and show their descriptions without importing them, so only the selected
+use case (and with it its dependencies, like langchain or fastapi) is imported. When adding a use case, it also has to
+be added here (tests/test_cli.py checks that the manifest matches the registered use cases).
+"""
+
+USE_CASES: dict[str, tuple[str, str]] = {
+    "ExPrivEscLinux": ("hackingBuddyGPT.usecases.examples.agent", "Showcase Minimal Linux Priv-Escalation"),
+    "ExPrivEscLinuxTemplated": ("hackingBuddyGPT.usecases.examples.agent_with_state", "Showcase Minimal Linux Priv-Escalation"),
+    "LinuxPrivesc": ("hackingBuddyGPT.usecases.privesc.linux", "Linux Privilege Escalation"),
+    "WindowsPrivesc": ("hackingBuddyGPT.usecases.privesc.windows", "Windows Privilege Escalation"),
+    "ExPrivEscLinuxHintFile": ("hackingBuddyGPT.usecases.examples.hintfile", "Linux Privilege Escalation using hints from a hint file initial guidance"),
+    "ExPrivEscLinuxLSE": ("hackingBuddyGPT.usecases.examples.lse", "Linux Privilege Escalation using lse.sh for initial guidance"),
+    "WebTestingWithExplanation": ("hackingBuddyGPT.usecases.web.with_explanation", "Minimal implementation of a web testing use case while allowing the llm to 'talk'"),
+    "SimpleWebAPIDocumentation": ("hackingBuddyGPT.usecases.web_api_testing.simple_openapi_documentation", "Minimal implementation of a web API testing use case"),
+    "SimpleWebAPITesting": ("hackingBuddyGPT.usecases.web_api_testing.simple_web_api_testing", "Minimal implementation of a web API testing use case"),
+    "Viewer": ("hackingBuddyGPT.usecases.viewer", "Webserver for (live) log viewing"),
+    "Replayer": ("hackingBuddyGPT.usecases.viewer", "Tool to replay the .jsonl logs generated by the Viewer (not well tested)"),
+    "ReplayImporter": ("hackingBuddyGPT.usecases.viewer", "Imports the .jsonl logs generated by the Viewer directly into the log database"),
+    "TraceExporter": ("hackingBuddyGPT.usecases.viewer", "Exports the timing of a logged run as Chrome trace-event JSON (for chrome://tracing or ui.perfetto.dev)"),
+    "ThesisLinuxPrivescPrototype": ("hackingBuddyGPT.usecases.rag.linux", "Thesis Linux Privilege Escalation Prototype"),
+    "Campaign": ("hackingBuddyGPT.usecases.campaign", "Runs a use case against a fleet of targets with a matrix of configurations"),
+    "Benchmark": ("hackingBuddyGPT.usecases.benchmark", "Measures the overhead of the agent loop, with a fake LLM and a fake target"),
+}
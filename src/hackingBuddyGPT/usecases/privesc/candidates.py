@@ -0,0 +1,65 @@
+"""
+Local ranking of the candidate commands that the LLM proposed for a round, so that only the most promising ones are
+executed, without asking the LLM again.
+"""
+
+import re
+from typing import Container, Iterable
+
+from hackingBuddyGPT.utils.loop_detector import fingerprint
+
+# commands that only look at the system, which are tried before commands that might change it
+READ_ONLY_COMMANDS = {
+    "cat", "crontab", "df", "env", "file", "find", "getcap", "getent", "grep", "groups", "head", "history", "hostname",
+    "id", "ip", "last", "less", "ls", "lsb_release", "mount", "netstat", "printenv", "ps", "pwd", "ss", "stat", "tail",
+    "uname", "w", "which", "who", "whoami",
+}
+READ_ONLY_PATTERNS = [re.compile(r"^sudo -l\b"), re.compile(r"^sudo -V\b")]
+
+# well known ways to get a shell out of binaries that run with higher privileges (see https://gtfobins.github.io/)
+GTFOBINS_PATTERNS = [re.compile(pattern) for pattern in (
+    r"\bpython[0-9.]* -c .*os\.(set(e|re)?uid|exec|system)",
+    r"\bperl -e .*(exec|system)",
+    r"\bruby -e .*exec",
+    r"\bfind .*-exec /bin/(ba)?sh",
+    r"\bvim? -c ['\"]?:?!/bin/(ba)?sh",
+    r"\bawk ['\"]BEGIN ?\{system",
+    r"\bless .*!/bin/(ba)?sh",
+    r"\benv /bin/(ba)?sh",
+    r"\btar .*--checkpoint-action=exec",
+    r"\bzip .*-TT",
+    r"\bnmap --interactive",
+    r"\bdocker run .*-v /:/",
+    r"/bin/(ba)?sh -p\b",
+    r"^sudo (-u root )?(/usr/bin/)?(vim?|less|more|man|awk|find|nmap|perl|python[0-9.]*|ruby|env|tar|zip|bash|sh|su)\b",
+)]
+
+
+def is_read_only(cmd: str) -> bool:
+    parts = cmd.split()
+    if not parts or is_gtfobins(cmd):  # eg. find -exec /bin/sh
+        return False
+    return parts[0].rsplit("/", 1)[-1] in READ_ONLY_COMMANDS or any(pattern.search(cmd) for pattern in READ_ONLY_PATTERNS)
+
+
+def is_gtfobins(cmd: str) -> bool:
+    return any(pattern.search(cmd) for pattern in GTFOBINS_PATTERNS)
+
+
+def rank_candidates(candidates: Iterable[str], seen: Container[str]) -> list[str]:
+    """
+    Returns the distinct candidates (by fingerprint, see `loop_detector.fingerprint`) ordered by how promising they are:
+    commands that were not yet executed (`seen` holds their fingerprints) come first, then read-only commands and then
+    known GTFOBins escalations. Ties keep the order in which the LLM proposed them.
+    """
+    distinct = {}
+    for cmd in candidates:
+        key = fingerprint(cmd)
+        if key and key not in distinct:
+            distinct[key] = cmd
+
+    def score(key: str) -> tuple[bool, bool, bool]:
+        cmd = distinct[key]
+        return key not in seen, is_read_only(cmd), is_gtfobins(cmd)
+
+    return [distinct[key] for key in sorted(distinct, key=score, reverse=True)]
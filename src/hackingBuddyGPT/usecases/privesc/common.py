@@ -1,5 +1,7 @@
 import datetime
 import pathlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from mako.template import Template
 from typing import Any, Dict, Optional
@@ -7,9 +9,12 @@ from typing import Any, Dict, Optional
 from hackingBuddyGPT.capabilities import Capability
 from hackingBuddyGPT.capabilities.capability import capabilities_to_simple_text_handler
 from hackingBuddyGPT.usecases.agents import Agent
-from hackingBuddyGPT.utils.logging import log_section, log_conversation
-from hackingBuddyGPT.utils import llm_util
+from hackingBuddyGPT.utils.logging import MessageStreamLogger, log_section, log_conversation
+from hackingBuddyGPT.utils import LLMResult, llm_util, ui
 from hackingBuddyGPT.utils.cli_history import SlidingCliHistory
+from hackingBuddyGPT.utils.loop_detector import LoopDetector, fingerprint
+
+from .candidates import rank_candidates
 
 template_dir = pathlib.Path(__file__).parent / "templates"
 template_next_cmd = Template(filename=str(template_dir / "query_next_command.txt"))
@@ -24,20 +29,37 @@ class Privesc(Agent):
     enable_update_state: bool = False
     disable_history: bool = False
     hint: str = ""
+    # the explanations are only logged and do not feed the next prompt, so they are requested in the background while
+    # the next round already runs, with at most this many outstanding (0 waits for each explanation)
+    max_background_explanations: int = 2
+    # the LLM is asked for this many candidate commands per round, of which the execute_candidates best distinct ones
+    # (see candidates.rank_candidates) are executed one after another, with all their results going into the history
+    candidates: int = 1
+    execute_candidates: int = 1
 
     _sliding_history: SlidingCliHistory = None
     _state: str = ""
     _capabilities: Dict[str, Capability] = field(default_factory=dict)
     _template_params: Dict[str, Any] = field(default_factory=dict)
     _max_history_size: int = 0
+    _last_turn: int = 0
+    _explanation_executor: Optional[ThreadPoolExecutor] = None
+    # (round, answer, prompt message, answer message) of the explanations that were requested in the background
+    _pending_explanations: deque[tuple[int, Future, MessageStreamLogger, MessageStreamLogger]] = field(default_factory=deque)
 
     def before_run(self):
-        if self.hint != "":
+        # a resumed run already logged the hint
+        if self.hint != "" and not self.log.resumed:
             self.log.status_message(f"[bold green]Using the following hint: '{self.hint}'")
 
         if self.disable_history is False:
             self._sliding_history = SlidingCliHistory(self.llm)
 
+        # the candidates are ranked by whether they were already executed, which the loop detector keeps track of (even
+        # if no loop_policy is set, in which case repeated commands are still executed)
+        if self.candidates > 1 and self._loop_detector is None:
+            self._loop_detector = LoopDetector(self.loop_window)
+
         self._template_params = {
             "capabilities": self.get_capability_block(),
             "system": self.system,
@@ -51,28 +73,74 @@ class Privesc(Agent):
         self._max_history_size = self.llm.context_size - llm_util.SAFETY_MARGIN - template_size
 
     def perform_round(self, turn: int) -> bool:
-        # get the next command and run it
-        cmd, message_id = self.get_next_command()
-        result, got_root = self.run_command(cmd, message_id)
+        # get the next commands and run them, until one of them got root
+        cmds, message_id = self.get_next_commands()
+        got_root = False
+        for tool_call_id, cmd in enumerate(cmds):
+            result, got_root = self.run_command(cmd, message_id, tool_call_id)
 
-        # log and output the command and its result
-        if self._sliding_history:
-            self._sliding_history.add_command(cmd, result)
+            # log and output the command and its result
+            if self._sliding_history:
+                self._sliding_history.add_command(cmd, result)
 
-        # analyze the result..
-        if self.enable_explanation:
-            self.analyze_result(cmd, result)
+            # analyze the result..
+            if self.enable_explanation:
+                if self.max_background_explanations > 0:
+                    self.analyze_result_in_background(turn, cmd, result)
+                else:
+                    self.analyze_result(cmd, result)
 
-        # .. and let our local model update its state
-        if self.enable_update_state:
-            self.update_state(cmd, result)
+            # .. and let our local model update its state
+            if self.enable_update_state:
+                self.update_state(cmd, result)
+
+            if got_root:
+                break
+
+        self.log_finished_explanations()
 
-        # Output Round Data..  # TODO: reimplement
-        # self.log.console.print(ui.get_history_table(self.enable_explanation, self.enable_update_state, self.log.run_id, self.log.log_db, turn))
+        # Output Round Data.. (only available if we are logging to a local database)
+        # only the row of this round is printed, the whole history is printed once the run is over
+        self._last_turn = turn
+        if hasattr(self.log, "log_db"):
+            table = ui.create_history_table(self.enable_explanation, self.enable_update_state)
+            ui.add_history_row(table, self.enable_explanation, self.enable_update_state, self.log.run.id, self.log.log_db, turn)
+            self.log.console.print(table)
 
         # if we got root, we can stop the loop
         return got_root
 
+    def after_run(self):
+        super().after_run()
+        self.log_finished_explanations(wait=True)
+
+        if hasattr(self.log, "log_db") and self._last_turn > 0:
+            self.log.console.print(ui.get_history_table(self.enable_explanation, self.enable_update_state, self.log.run.id, self.log.log_db, self._last_turn))
+
+    def cleanup(self):
+        super().cleanup()
+        if self._explanation_executor is not None:
+            self._explanation_executor.shutdown(wait=False, cancel_futures=True)
+            self._explanation_executor = None
+        # only left if the run failed, their messages are closed without an explanation
+        while self._pending_explanations:
+            _turn, _future, prompt, answer = self._pending_explanations.popleft()
+            prompt.finalize(0, 0, datetime.timedelta(0))
+            answer.finalize(0, 0, datetime.timedelta(0))
+
+    def checkpoint(self) -> dict:
+        checkpoint = super().checkpoint()
+        checkpoint["state"] = self._state
+        if self._sliding_history:
+            checkpoint["history"] = self._sliding_history.checkpoint()
+        return checkpoint
+
+    def restore(self, checkpoint: dict):
+        super().restore(checkpoint)
+        self._state = checkpoint.get("state", "")
+        if self._sliding_history and "history" in checkpoint:
+            self._sliding_history.restore(checkpoint["history"])
+
     def get_state_size(self) -> int:
         if self.enable_update_state:
             return self.llm.count_tokens(self._state)
@@ -80,43 +148,101 @@ class Privesc(Agent):
             return 0
 
     @log_conversation("Asking LLM for a new command...", start_section=True)
-    def get_next_command(self) -> tuple[str, int]:
+    def get_next_commands(self) -> tuple[list[str], int]:
         history = ""
         if not self.disable_history:
             history = self._sliding_history.get_history(self._max_history_size - self.get_state_size())
 
         self._template_params.update({"history": history, "state": self._state})
 
-        cmd = self.llm.get_response(template_next_cmd, **self._template_params)
-        message_id = self.log.call_response(cmd)
+        if self.candidates <= 1:
+            cmd = self.llm.get_response(template_next_cmd, **self._template_params)
+            message_id = self.log.call_response(cmd)
+            return [llm_util.cmd_output_fixer(cmd.result)], message_id
 
-        return llm_util.cmd_output_fixer(cmd.result), message_id
+        answers = self.llm.get_responses(template_next_cmd, self.candidates, **self._template_params)
+        ranked = rank_candidates((llm_util.cmd_output_fixer(answer.result) for answer in answers), self._loop_detector)
+        # all candidates are logged as one answer, in the order of their ranking
+        ranking = "\n".join(f"{i}. {cmd}" for i, cmd in enumerate(ranked, start=1))
+        message_id = self.log.call_response(LLMResult(
+            ranking,
+            answers[0].prompt,
+            ranking,
+            max(answer.duration for answer in answers),
+            sum(answer.tokens_query for answer in answers),
+            sum(answer.tokens_response for answer in answers),
+        ))
+        return ranked[:self.execute_candidates], message_id
 
     @log_section("Executing that command...")
-    def run_command(self, cmd, message_id) -> tuple[Optional[str], bool]:
+    def run_command(self, cmd, message_id, tool_call_id: int = 0) -> tuple[Optional[str], bool]:
         _capability_descriptions, parser = capabilities_to_simple_text_handler(self._capabilities, default_capability=self._default_capability)
+        key = fingerprint(cmd)
+        repeated = self.skip_repeated_command(message_id, tool_call_id, key, cmd)
+        if repeated is not None:
+            return repeated, False
+
         start_time = datetime.datetime.now()
         success, *output = parser(cmd)
         if not success:
-            self.log.add_tool_call(message_id, tool_call_id=0, function_name="", arguments=cmd, result_text=output[0], duration=0)
+            self.log.add_tool_call(message_id, tool_call_id=tool_call_id, function_name="", arguments=cmd, result_text=output[0], duration=datetime.datetime.now() - start_time)
             return output[0], False
 
         assert len(output) == 1
         capability, cmd, (result, got_root) = output[0]
         duration = datetime.datetime.now() - start_time
-        self.log.add_tool_call(message_id, tool_call_id=0, function_name=capability, arguments=cmd, result_text=result, duration=duration)
+        self.remember_command(key, result)
+        self.log.add_tool_call(message_id, tool_call_id=tool_call_id, function_name=capability, arguments=cmd, result_text=result, duration=duration)
 
         return result, got_root
 
     @log_conversation("Analyze its result...", start_section=True)
     def analyze_result(self, cmd, result):
-        state_size = self.get_state_size()
+        self.log.call_response(self.explain_result(cmd, result, self._state))
+
+    def analyze_result_in_background(self, turn: int, cmd, result):
+        if self._explanation_executor is None:
+            self._explanation_executor = ThreadPoolExecutor(max_workers=self.max_background_explanations, thread_name_prefix="explanation")
+
+        self.log_finished_explanations()
+        while len(self._pending_explanations) >= self.max_background_explanations:
+            self.log_explanation(*self._pending_explanations.popleft())
+
+        # the loggers are not thread-safe, so only the LLM call runs in the background. Its messages are already created
+        # in this round (and filled once the answer is there), so that the explanation is attributed to this round
+        with self.log.conversation("Analyze its result...", start_section=True):
+            prompt = self.log.stream_message("system")
+            answer = self.log.stream_message("assistant")
+        future = self._explanation_executor.submit(self.explain_result, cmd, result, self._state)
+        self._pending_explanations.append((turn, future, prompt, answer))
+
+    def log_finished_explanations(self, wait: bool = False):
+        # in the order in which they were requested
+        while self._pending_explanations and (wait or self._pending_explanations[0][1].done()):
+            self.log_explanation(*self._pending_explanations.popleft())
+
+    def log_explanation(self, turn: int, future: Future, prompt: MessageStreamLogger, answer: MessageStreamLogger):
+        try:
+            explanation: LLMResult = future.result()
+        except Exception as e:
+            prompt.finalize(0, 0, datetime.timedelta(0))
+            answer.finalize(0, 0, datetime.timedelta(0))
+            self.log.status_message(f"[bold red]Explaining the result of round {turn} failed: {type(e).__name__}: {e}")
+            return
+
+        prompt.append(explanation.prompt)
+        prompt.finalize(0, 0, datetime.timedelta(0))
+        answer.append(explanation.answer)
+        answer.finalize(explanation.tokens_query, explanation.tokens_response, explanation.duration)
+        self.log.console.print_message(f"Analyze its result... (round {turn}) - assistant", explanation.answer)
+
+    def explain_result(self, cmd, result, state) -> LLMResult:
+        state_size = self.llm.count_tokens(state) if self.enable_update_state else 0
         target_size = self.llm.context_size - llm_util.SAFETY_MARGIN - state_size
 
         # ugly, but cut down result to fit context size
         result = llm_util.trim_result_front(self.llm, target_size, result)
-        answer = self.llm.get_response(template_analyze, cmd=cmd, resp=result, facts=self._state)
-        self.log.call_response(answer)
+        return self.llm.get_response(template_analyze, cmd=cmd, resp=result, facts=state)
 
     @log_conversation("Updating fact list..", start_section=True)
     def update_state(self, cmd, result):
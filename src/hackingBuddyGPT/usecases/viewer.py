@@ -1,26 +1,37 @@
 #!/usr/bin/python3
 
 import asyncio
+import dataclasses
 import datetime
+import glob
+import gzip
+import html
+import itertools
 import json
 import os
 import random
+import sqlite3
 import string
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 from enum import Enum
 import time
-from typing import Optional, Union
+from collections import deque
+from typing import Iterator, Optional, Union
 
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse
 from starlette.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 
 from hackingBuddyGPT.usecases.base import UseCase, use_case
+from hackingBuddyGPT.utils import metrics
 from hackingBuddyGPT.utils.configurable import parameter
 from hackingBuddyGPT.utils.db_storage import DbStorage
+from hackingBuddyGPT.utils.db_storage.db_executor import DbExecutor
 from hackingBuddyGPT.utils.db_storage.db_storage import (
+    SEARCH_HIGHLIGHT_END,
+    SEARCH_HIGHLIGHT_START,
     Message,
     MessageStreamPart,
     Run,
@@ -31,6 +42,8 @@ from hackingBuddyGPT.utils.db_storage.db_storage import (
 from dataclasses_json import dataclass_json
 
 from hackingBuddyGPT.utils.logging import GlobalLocalLogger, GlobalRemoteLogger
+from hackingBuddyGPT.utils.replay_recorder import ReplayRecorder
+from hackingBuddyGPT.utils.trace_export import export_run_trace
 
 INGRESS_TOKEN = os.environ.get("INGRESS_TOKEN", None)
 VIEWER_TOKEN = os.environ.get("VIEWER_TOKEN", random.choices(string.ascii_letters + string.digits, k=32))
@@ -46,9 +59,24 @@ STATIC_DIR = RESOURCE_DIR + "/static"
 @dataclass(frozen=True)
 class MessageRequest:
     follow_run: Optional[int] = None
+    before_message: Optional[int] = None  # if set, requests the page of history before this message of the followed run
 
 
-MessageData = Union[MessageRequest, Run, Section, Message, MessageStreamPart, ToolCall, ToolCallStreamPart]
+@dataclass_json
+@dataclass
+class HistoryPage:
+    """
+    A page of the history of a run (messages and the tool calls and sections belonging to them), which is sent to a
+    client in one frame. The newest page is sent when a run is selected, older pages are requested by the client.
+    """
+    run_id: int
+    messages: list[Message]
+    tool_calls: list[ToolCall]
+    sections: list[Section]
+    has_more: bool
+
+
+MessageData = Union[MessageRequest, Run, Section, Message, MessageStreamPart, ToolCall, ToolCallStreamPart, HistoryPage]
 
 
 class MessageType(str, Enum):
@@ -59,6 +87,7 @@ class MessageType(str, Enum):
     MESSAGE_STREAM_PART = "MessageStreamPart"
     TOOL_CALL = "ToolCall"
     TOOL_CALL_STREAM_PART = "ToolCallStreamPart"
+    HISTORY_PAGE = "HistoryPage"
 
     def get_class(self) -> MessageData:
         return {
@@ -69,6 +98,7 @@ class MessageType(str, Enum):
             "MessageStreamPart": MessageStreamPart,
             "ToolCall": ToolCall,
             "ToolCallStreamPart": ToolCallStreamPart,
+            "HistoryPage": HistoryPage,
         }[self.value]
 
 
@@ -86,16 +116,90 @@ class ReplayMessage:
     message: ControlMessage
 
 
-@dataclass
+def utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class ClientQueueOverflow(Exception):
+    pass
+
+
+@dataclass(eq=False)
 class Client:
     websocket: WebSocket
-    db: DbStorage
+    db: DbExecutor
+    subscriptions: "RunSubscriptions"
+    history_page_size: int = 250
+    queue_size: int = 1000
 
-    queue: asyncio.Queue[ControlMessage] = field(default_factory=asyncio.Queue)
+    queue: asyncio.Queue[ControlMessage] = field(init=False)
+    # the times at which the messages in the queue were put there, to measure how long the fan-out to this client lags
+    _enqueued_at: deque[float] = field(init=False)
 
     current_run = None
     follow_new_runs = False
 
+    # the last message that was put into the queue and has not yet been sent, used for coalescing stream parts. Only
+    # messages that are owned by this client (and not shared with other clients and the replay recording) are mutated
+    _last_queued: Optional[ControlMessage] = None
+    _last_queued_owned: bool = False
+
+    def __post_init__(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._enqueued_at = deque()
+
+    def deliver(self, message: ControlMessage) -> None:
+        """
+        Non-blocking enqueue of a message for this client, which is used by the ingress so that a slow client can not
+        back up the ingestion. If the client already falls behind, consecutive stream parts of the same message are
+        merged into one. If the queue still overflows, ClientQueueOverflow is raised and the client has to be dropped.
+        """
+        if self.queue.empty():
+            self.queue.put_nowait(message)
+            self._enqueued_at.append(time.monotonic())
+            self._last_queued, self._last_queued_owned = message, False
+            return
+
+        if self._coalesce(message):
+            return
+
+        if self.queue.full():
+            raise ClientQueueOverflow(f"queue of client {id(self)} overflowed ({self.queue.maxsize} messages)")
+
+        owned = message.type in (MessageType.MESSAGE_STREAM_PART, MessageType.TOOL_CALL_STREAM_PART)
+        if owned:
+            # copy the stream part, so that later parts can be appended to it while it is waiting in the queue
+            message = ControlMessage(message.type, dataclasses.replace(message.data))
+        self.queue.put_nowait(message)
+        self._enqueued_at.append(time.monotonic())
+        self._last_queued, self._last_queued_owned = message, owned
+
+    def _coalesce(self, message: ControlMessage) -> bool:
+        last = self._last_queued
+        if last is None or not self._last_queued_owned or last.type != message.type:
+            return False
+
+        if message.type == MessageType.MESSAGE_STREAM_PART:
+            key = ("run_id", "message_id", "action")
+        elif message.type == MessageType.TOOL_CALL_STREAM_PART:
+            key = ("run_id", "message_id", "tool_call_id", "field", "action")
+        else:
+            return False
+
+        if any(getattr(last.data, k) != getattr(message.data, k) for k in key) or message.data.action != "append":
+            return False
+
+        if message.type == MessageType.MESSAGE_STREAM_PART:
+            # the merged part results in the version of the message of the newest part, which the client checks against
+            # the version of the loaded history. As that version can lie within the merged parts, their lengths are kept
+            # (in UTF-16 code units, as the client counts them) so that the client can skip the ones it already has
+            if last.data.merged_lengths is None:
+                last.data.merged_lengths = [utf16_length(last.data.content)]
+            last.data.merged_lengths.append(utf16_length(message.data.content))
+            last.data.id = message.data.id
+        last.data.content += message.data.content
+        return True
+
     async def send_message(self, message: ControlMessage) -> None:
         await self.websocket.send_text(message.to_json())
 
@@ -103,17 +207,24 @@ class Client:
         await self.send_message(ControlMessage(type, message))
 
     async def send_messages(self) -> None:
-        runs = self.db.get_runs()
+        runs = await self.db.read("get_runs")
         for r in runs:
             await self.send(MessageType.RUN, r)
 
         while True:
             try:
                 msg: ControlMessage = await self.queue.get()
+                metrics.viewer_fanout_lag.observe(time.monotonic() - self._enqueued_at.popleft())
+                if msg is self._last_queued:
+                    self._last_queued = None
                 data = msg.data
                 if msg.type == MessageType.MESSAGE_REQUEST:
-                    if data.follow_run is not None:
+                    if data.follow_run is None:
+                        pass
+                    elif data.before_message is None:
                         await self.switch_to_run(data.follow_run)
+                    elif data.follow_run == self.current_run:
+                        await self.send_history_page(data.follow_run, data.before_message)
 
                 elif msg.type == MessageType.RUN:
                     await self.send_message(msg)
@@ -152,72 +263,129 @@ class Client:
                     print("Invalid message")
                     continue
 
+                before_message = data.get("before_message", None)
                 message = ControlMessage(
                     type=MessageType.MESSAGE_REQUEST,
-                    data=MessageRequest(int(data["follow_run"])),
+                    data=MessageRequest(int(data["follow_run"]), int(before_message) if before_message is not None else None),
                 )
                 # we don't process the message here, as having all message processing done in lockstep in the send_messages
                 # function means that we don't have to worry about race conditions between reading from the database and
                 # incoming messages
                 await self.queue.put(message)
+                self._enqueued_at.append(time.monotonic())
+                self._last_queued = None
             except Exception as e:
                 print(f"Error receiving message: {e}")
                 raise e
 
     async def switch_to_run(self, run_id: int):
+        # subscribe before loading the history, so that live updates that arrive in the meantime are queued up
         self.current_run = run_id
-        messages = self.db.get_messages_by_run(run_id)
-
-        tool_calls = list(self.db.get_tool_calls_by_run(run_id))
-        tool_calls_per_message = dict()
-        for tc in tool_calls:
-            if tc.message_id not in tool_calls_per_message:
-                tool_calls_per_message[tc.message_id] = []
-            tool_calls_per_message[tc.message_id].append(tc)
-
-        sections: list[Section] = list(self.db.get_sections_by_run(run_id))
-        sections_starting_with_message = dict()
-        for s in sections:
-            if s.from_message not in sections_starting_with_message:
-                sections_starting_with_message[s.from_message] = []
-            sections_starting_with_message[s.from_message].append(s)
-
-        for msg in messages:
-            if msg.id in sections_starting_with_message:
-                for s in sections_starting_with_message[msg.id]:
-                    await self.send(MessageType.SECTION, s)
-                    sections.remove(s)
-            await self.send(MessageType.MESSAGE, msg)
-            if msg.id in tool_calls_per_message:
-                for tc in tool_calls_per_message[msg.id]:
-                    await self.send(MessageType.TOOL_CALL, tc)
-                    tool_calls.remove(tc)
-
-        for tc in tool_calls:
-            await self.send(MessageType.TOOL_CALL, tc)
-
-        for s in sections:
-            await self.send(MessageType.SECTION, s)
+        self.subscriptions.follow(self, run_id)
+
+        # only the newest page of the history is sent (as a snapshot), the live updates are then merged on top of it and
+        # older pages are only loaded once the client scrolls to them
+        await self.send_history_page(run_id, None)
+
+    async def send_history_page(self, run_id: int, before_message: Optional[int]):
+        messages = await self.db.read("get_latest_messages_by_run", run_id, before_id=before_message, limit=self.history_page_size)
+        if len(messages) > 0:
+            first_message = messages[0].id
+        else:
+            first_message = before_message if before_message is not None else 0
+
+        # the newest page is open ended, so that it also contains tool calls and sections of messages that are not yet there
+        last_message = None if before_message is None else before_message - 1
+
+        tool_calls = await self.db.read("get_tool_calls_by_run", run_id, message_after=first_message - 1, message_until=last_message)
+        sections = await self.db.read("get_sections_overlapping", run_id, first_message, last_message)
+        has_more = len(messages) == self.history_page_size and first_message > 0
+
+        await self.send(MessageType.HISTORY_PAGE, HistoryPage(run_id, messages, tool_calls, sections, has_more))
+
+
+class RunSubscriptions:
+    """
+    Index of the connected clients by the run that they are following, so that the fan-out of an ingested message only
+    costs as much as there are clients interested in it. Run messages are sent to all clients, as they update the list
+    of runs.
+    """
+
+    def __init__(self):
+        self._clients: set[Client] = set()
+        self._by_run: dict[int, set[Client]] = dict()
+        self._run_of_client: dict[Client, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def __iter__(self):
+        return iter(list(self._clients))
+
+    def add(self, client: Client):
+        self._clients.add(client)
+
+    def remove(self, client: Client):
+        self._clients.discard(client)
+        self._unfollow(client)
+
+    def follow(self, client: Client, run_id: int):
+        self._unfollow(client)
+        self._by_run.setdefault(run_id, set()).add(client)
+        self._run_of_client[client] = run_id
+
+    def _unfollow(self, client: Client):
+        run_id = self._run_of_client.pop(client, None)
+        if run_id is None:
+            return
+        subscribers = self._by_run.get(run_id)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if len(subscribers) == 0:
+                del self._by_run[run_id]
+
+    def publish(self, message: ControlMessage) -> list[Client]:
+        """
+        Delivers the message to all interested clients and returns the clients that overflowed and need to be dropped.
+        """
+        if message.type == MessageType.RUN:
+            clients = self._clients
+        else:
+            clients = self._by_run.get(message.data.run_id, ())
+
+        overflowed = []
+        for client in list(clients):
+            try:
+                client.deliver(message)
+            except ClientQueueOverflow as e:
+                print(f"Dropping client: {e}")
+                overflowed.append(client)
+        return overflowed
 
 
 @use_case("Webserver for (live) log viewing")
 class Viewer(UseCase):
     """
-    TODOs:
-    - [ ] This server needs to be as async as possible to allow good performance, but the database accesses are not yet, might be an issue?
+    All database accesses are done through a DbExecutor, so that they do not block the event loop: writes are
+    serialized on a single writer thread, reads are served by `db_readers` separate read connections.
+
+    With `save_playback_dir` all ingested events are additionally recorded for the Replayer (see ReplayRecorder), the
+    recordings are flushed every `playback_flush_interval` seconds and when a run ends.
     """
     log: GlobalLocalLogger = None
     log_db: DbStorage = None
     log_server_address: str = "127.0.0.1:4444"
     save_playback_dir: str = ""
-
-    async def save_message(self, message: ControlMessage):
-        if not self.save_playback_dir or len(self.save_playback_dir) == 0:
-            return
-
-        # check if a file with the name of the message run id already exists in the save_playback_dir
-        # if it does, append the message to the json lines file
-        # if it doesn't, create a new file with the name of the message run id and write the message to it
+    playback_flush_interval: float = 1.0
+    playback_max_open_files: int = 64
+    compress_playbacks: bool = False
+    db_readers: int = 4
+    history_page_size: int = 250
+    client_queue_size: int = 1000
+
+    def record_message(self, recorder: ReplayRecorder, message: ControlMessage, data: dict):
+        # the raw ingress data is recorded (in the same format as a serialized ReplayMessage), which saves serializing
+        # the parsed message again for every streamed token
         if isinstance(message.data, Run):
             run_id = message.data.id
         elif hasattr(message.data, "run_id"):
@@ -225,23 +393,34 @@ class Viewer(UseCase):
         else:
             raise ValueError("gotten message without run_id", message)
 
-        if not os.path.exists(self.save_playback_dir):
-            os.makedirs(self.save_playback_dir)
-
-        file_path = os.path.join(self.save_playback_dir, f"{run_id}.jsonl")
-        with open(file_path, "a") as f:
-            f.write(ReplayMessage(datetime.datetime.now(), message).to_json() + "\n")
+        recorder.record(run_id, json.dumps({"at": time.time(), "message": data}))
+        if isinstance(message.data, Run) and message.data.stopped_at is not None:
+            recorder.finish_run(run_id)
 
     def run(self, config):
         @asynccontextmanager
         async def lifespan(app: FastAPI):
-            app.state.db = self.log_db
-            app.state.clients = []
+            app.state.db = DbExecutor(self.log_db, readers=self.db_readers)
+            app.state.clients = RunSubscriptions()
+            app.state.recorder = None
+            flush_task = None
+            if self.save_playback_dir:
+                app.state.recorder = ReplayRecorder(self.save_playback_dir, max_open_files=self.playback_max_open_files, compress=self.compress_playbacks)
+
+                async def flush_playbacks():
+                    while True:
+                        await asyncio.sleep(self.playback_flush_interval)
+                        app.state.recorder.flush()
+                flush_task = asyncio.create_task(flush_playbacks())
 
             yield
 
             for client in app.state.clients:
                 await client.websocket.close()
+            if flush_task is not None:
+                flush_task.cancel()
+                app.state.recorder.close()
+            app.state.db.shutdown()
 
         app = FastAPI(lifespan=lifespan)
 
@@ -267,45 +446,99 @@ class Viewer(UseCase):
         async def admin_ui(request: Request):
             return templates.TemplateResponse("index.html", {"request": request})
 
-        @app.websocket("/ingress")
-        async def ingress_endpoint(websocket: WebSocket):
-            await websocket.accept()
+        @app.get("/stats")
+        async def run_stats():
+            return [stats.to_dict() | {"overhead": stats.overhead} for stats in await app.state.db.read("get_run_stats")]
+
+        @app.get("/stats/{run_id}")
+        async def round_stats(run_id: int):
+            return [stats.to_dict() | {"overhead": stats.overhead} for stats in await app.state.db.read("get_round_stats", run_id)]
+
+        @app.get("/trace/{run_id}")
+        async def trace(run_id: int):
             try:
-                while True:
-                    # Receive messages from the ingress websocket
-                    data = await websocket.receive_json()
-                    message_type = MessageType(data["type"])
-                    # parse the data according to the message type into the appropriate dataclass
-                    message = message_type.get_class().from_dict(data["data"])
+                return await app.state.db.read_with(export_run_trace, run_id)
+            except ValueError as e:
+                return JSONResponse({"error": str(e)}, status_code=404)
+
+        @app.get("/metrics")
+        async def prometheus_metrics():
+            return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+        @app.get("/dashboard", response_class=HTMLResponse)
+        async def runs_dashboard(request: Request):
+            rows = await app.state.db.read("get_run_stats")
+            return templates.TemplateResponse("dashboard.html", {"request": request, "run_id": None, "rows": rows})
+
+        @app.get("/dashboard/{run_id}", response_class=HTMLResponse)
+        async def run_dashboard(request: Request, run_id: int):
+            rows = await app.state.db.read("get_round_stats", run_id)
+            return templates.TemplateResponse("dashboard.html", {"request": request, "run_id": run_id, "rows": rows})
+
+        @app.get("/search")
+        async def search(q: str, limit: int = 50, raw: bool = False):
+            try:
+                results = await app.state.db.read("search", q, limit=limit, raw_query=raw)
+            except sqlite3.OperationalError as e:
+                return JSONResponse({"error": f"invalid search query: {e}"}, status_code=400)
+
+            def highlighted(snippet: str) -> str:
+                return html.escape(snippet).replace(SEARCH_HIGHLIGHT_START, "<mark>").replace(SEARCH_HIGHLIGHT_END, "</mark>")
+
+            return [
+                {**result.to_dict(), "snippet": highlighted(result.snippet)}
+                for result in results
+            ]
+
+        async def ingest(websocket: WebSocket, data: dict):
+            message_type = MessageType(data["type"])
+            # parse the data according to the message type into the appropriate dataclass
+            message = message_type.get_class().from_dict(data["data"])
+            metrics.viewer_ingested_messages.labels(message_type.value).inc()
+
+            if message_type == MessageType.RUN:
+                if message.id is None:
+                    message.started_at = datetime.datetime.now()
+                    message.id = await app.state.db.write("create_run", message.model, message.tag, message.started_at, message.configuration)
+                    data["data"]["id"] = message.id  # set the id also in the raw data, so we can properly serialize it to replays
+                else:
+                    await app.state.db.write("update_run", message.id, message.model, message.state, message.tag, message.started_at, message.stopped_at, message.configuration)
+                await websocket.send_text(message.to_json())
 
-                    if message_type == MessageType.RUN:
-                        if message.id is None:
-                            message.started_at = datetime.datetime.now()
-                            message.id = app.state.db.create_run(message.model, message.tag, message.started_at, message.configuration)
-                            data["data"]["id"] = message.id  # set the id also in the raw data, so we can properly serialize it to replays
-                        else:
-                            app.state.db.update_run(message.id, message.model, message.state, message.tag, message.started_at, message.stopped_at, message.configuration)
-                        await websocket.send_text(message.to_json())
+            elif message_type == MessageType.MESSAGE:
+                await app.state.db.write("add_or_update_message", message.run_id, message.id, message.conversation, message.role, message.content, message.tokens_query, message.tokens_response, message.duration, message.finished_at)
 
-                    elif message_type == MessageType.MESSAGE:
-                        app.state.db.add_or_update_message(message.run_id, message.id, message.conversation, message.role, message.content, message.tokens_query, message.tokens_response, message.duration)
+            elif message_type == MessageType.MESSAGE_STREAM_PART:
+                # the version of the message after this part was applied is used as its id, so that clients can
+                # skip parts that are already contained in the history they loaded
+                message.id = await app.state.db.write("handle_message_update", message.run_id, message.message_id, message.action, message.content)
 
-                    elif message_type == MessageType.MESSAGE_STREAM_PART:
-                        app.state.db.handle_message_update(message.run_id, message.message_id, message.action, message.content)
+            elif message_type == MessageType.TOOL_CALL:
+                await app.state.db.write("add_tool_call", message.run_id, message.message_id, message.id, message.function_name, message.arguments, message.result_text, message.duration, message.finished_at)
 
-                    elif message_type == MessageType.TOOL_CALL:
-                        app.state.db.add_tool_call(message.run_id, message.message_id, message.id, message.function_name, message.arguments, message.result_text, message.duration)
+            elif message_type == MessageType.SECTION:
+                await app.state.db.write("add_section", message.run_id, message.id, message.name, message.from_message, message.to_message, message.duration, message.finished_at, message.conversation)
 
-                    elif message_type == MessageType.SECTION:
-                        app.state.db.add_section(message.run_id, message.id, message.name, message.from_message, message.to_message, message.duration)
+            else:
+                print("UNHANDLED ingress", message)
 
-                    else:
-                        print("UNHANDLED ingress", message)
+            control_message = ControlMessage(type=message_type, data=message)
+            if app.state.recorder is not None:
+                self.record_message(app.state.recorder, control_message, data)
+            for client in app.state.clients.publish(control_message):
+                app.state.clients.remove(client)
+                asyncio.create_task(client.websocket.close(code=1013, reason="client fell too far behind"))
+            metrics.viewer_clients.set(len(app.state.clients))
 
-                    control_message = ControlMessage(type=message_type, data=message)
-                    await self.save_message(control_message)
-                    for client in app.state.clients:
-                        await client.queue.put(control_message)
+        @app.websocket("/ingress")
+        async def ingress_endpoint(websocket: WebSocket):
+            await websocket.accept()
+            try:
+                while True:
+                    # Receive messages from the ingress websocket, either one by one or batched into a list
+                    data = await websocket.receive_json()
+                    for message_data in (data if isinstance(data, list) else [data]):
+                        await ingest(websocket, message_data)
 
             except WebSocketDisconnect as e:
                 import traceback
@@ -315,25 +548,26 @@ class Viewer(UseCase):
         @app.websocket("/client")
         async def client_endpoint(websocket: WebSocket):
             await websocket.accept()
-            client = Client(websocket, app.state.db)
-            app.state.clients.append(client)
+            client = Client(websocket, app.state.db, app.state.clients, self.history_page_size, self.client_queue_size)
+            app.state.clients.add(client)
+            metrics.viewer_clients.set(len(app.state.clients))
 
             # run the receiving and sending tasks in the background until one of them returns
-            tasks = ()
+            tasks = (
+                asyncio.create_task(client.send_messages()),
+                asyncio.create_task(client.receive_messages()),
+            )
             try:
-                tasks = (
-                    asyncio.create_task(client.send_messages()),
-                    asyncio.create_task(client.receive_messages()),
-                )
                 await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-            except WebSocketDisconnect:
+            finally:
                 # read the task exceptions, close remaining tasks
                 for task in tasks:
-                    if task.exception():
-                        print(task.exception())
-                    else:
+                    if not task.done():
                         task.cancel()
+                    elif not task.cancelled() and task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                        print(task.exception())
                 app.state.clients.remove(client)
+                metrics.viewer_clients.set(len(app.state.clients))
                 print("Egress WebSocket disconnected")
 
         import uvicorn
@@ -357,55 +591,198 @@ class Viewer(UseCase):
         return "log_viewer"
 
 
+def read_recording(path: str) -> Iterator[dict]:
+    """
+    Yields the raw events (serialized ReplayMessages) of a recording, which may be gzip-compressed.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def recording_files(path: str) -> list[str]:
+    # a single recording, a directory of recordings or a glob pattern
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.jsonl*")
+    files = [f for f in glob.glob(path) if f.endswith((".jsonl", ".jsonl.gz"))]
+    if not files:
+        raise ValueError(f"No recordings found at {path}")
+    return sorted(files)
+
+
 @use_case("Tool to replay the .jsonl logs generated by the Viewer (not well tested)")
 class Replayer(UseCase):
+    """
+    Replays recordings to a running Viewer. Pauses in the recording are divided by `playback_speed` and then shortened
+    to at most `max_pause` seconds. All messages that are due within `batch_interval` seconds are sent in one batch.
+    """
     log: GlobalRemoteLogger = None
     replay_file: str = None
     pause_on_message: bool = False
     pause_on_tool_calls: bool = False
     playback_speed: float = 1.0
+    max_pause: float = 5.0
+    batch_interval: float = 0.05
 
     def get_name(self) -> str:
         return "replayer"
 
-    def init(self, configuration):
+    def init(self):
         self.log.init_websocket()  # we don't want to automatically start a run here
 
-    def run(self):
-        recording_start: Optional[datetime.datetime] = None
-        replay_start: datetime.datetime = datetime.datetime.now()
-
-        print(f"replaying {self.replay_file}")
-        for line in open(self.replay_file, "r"):
-            data = json.loads(line)
-            msg: ReplayMessage = ReplayMessage.from_dict(data)
-            msg.message.type = MessageType(data["message"]["type"])
-            msg.message.data = msg.message.type.get_class().from_dict(data["message"]["data"])
-
-            if recording_start is None:
-                if msg.message.type != MessageType.RUN:
-                    raise ValueError("First message must be a RUN message, is", msg.message.type)
-                recording_start = msg.at
-                self.log.start_run(msg.message.data.model, msg.message.data.tag, msg.message.data.configuration, msg.at)
-
-            # wait until the message should be sent
-            sleep_time = ((msg.at - recording_start) / self.playback_speed) - (datetime.datetime.now() - replay_start)
-            if sleep_time.total_seconds() > 3:
-                print(msg)
-                print(f"sleeping for {sleep_time.total_seconds()}s")
-            time.sleep(max(sleep_time.total_seconds(), 0))
-
-            if isinstance(msg.message.data, Run):
-                msg.message.data.id = self.log.run.id
-            elif hasattr(msg.message.data, "run_id"):
-                msg.message.data.run_id = self.log.run.id
+    def run(self, configuration):
+        for replay_file in recording_files(self.replay_file):
+            print(f"replaying {replay_file}")
+            self.replay(replay_file)
+            self.log.run = None
+
+    def replay(self, replay_file: str):
+        recording_last: Optional[float] = None
+        replay_at = 0.0  # the (compressed) time at which the current message is to be sent, relative to replay_start
+        replay_start = time.monotonic()
+        batch: list[dict] = []
+
+        for event in read_recording(replay_file):
+            message = event["message"]
+            message_type = MessageType(message["type"])
+
+            if recording_last is None:
+                if message_type != MessageType.RUN:
+                    raise ValueError("First message must be a RUN message, is", message_type)
+                run = Run.from_dict(message["data"])
+                self.log.start_run(run.model, run.configuration, run.tag, datetime.datetime.fromtimestamp(event["at"]))
+                recording_last = event["at"]
+                continue
+
+            replay_at += min((event["at"] - recording_last) / self.playback_speed, self.max_pause)
+            recording_last = event["at"]
+
+            if message_type == MessageType.RUN:
+                message["data"]["id"] = self.log.run.id
+            elif "run_id" in message["data"]:
+                message["data"]["run_id"] = self.log.run.id
             else:
-                raise ValueError("Message has no run_id", msg.message.data)
-
-            if self.pause_on_message and msg.message.type == MessageType.MESSAGE \
-               or self.pause_on_tool_calls and msg.message.type == MessageType.TOOL_CALL:
+                raise ValueError("Message has no run_id", message)
+
+            # send everything that is due before waiting for this message
+            sleep_time = replay_at - (time.monotonic() - replay_start)
+            if sleep_time > self.batch_interval:
+                if batch:
+                    self.log.send_batch(batch)
+                    batch = []
+                if sleep_time > 3:
+                    print(f"sleeping for {sleep_time:.2f}s")
+                time.sleep(sleep_time)
+
+            if self.pause_on_message and message_type == MessageType.MESSAGE \
+               or self.pause_on_tool_calls and message_type == MessageType.TOOL_CALL:
+                if batch:
+                    self.log.send_batch(batch)
+                    batch = []
                 input("Paused, press Enter to continue")
-                replay_start = datetime.datetime.now() - (msg.at - recording_start)
+                replay_start = time.monotonic() - replay_at
+
+            batch.append(message)
+
+        if batch:
+            self.log.send_batch(batch)
+
+
+@use_case("Imports the .jsonl logs generated by the Viewer directly into the log database")
+class ReplayImporter(UseCase):
+    """
+    Streams recordings straight into the database, every recorded run becomes a new run. The events are written in
+    transactions of `batch_size` events, and consecutive stream parts of a message are merged into one update.
+    """
+    log_db: DbStorage = None
+    replay_file: str = None
+    batch_size: int = 5000
+
+    def get_name(self) -> str:
+        return "replay_importer"
+
+    def run(self, configuration):
+        start = time.monotonic()
+        files = recording_files(self.replay_file)
+        events = 0
+        for replay_file in files:
+            events += self.import_recording(replay_file)
+        print(f"imported {len(files)} recordings with {events} events in {time.monotonic() - start:.2f}s")
+
+    def import_recording(self, replay_file: str) -> int:
+        run_ids: dict[int, int] = {}  # recorded run id -> new run id
+        events = read_recording(replay_file)
+        count = 0
+        while batch := list(itertools.islice(events, self.batch_size)):
+            with self.log_db.write_batch():
+                self.import_batch(batch, run_ids)
+            count += len(batch)
+        return count
+
+    def import_batch(self, batch: list[dict], run_ids: dict[int, int]):
+        pending_part: Optional[list] = None  # [run_id, message_id, content] of consecutive stream parts
+
+        for event in batch:
+            message_type = MessageType(event["message"]["type"])
+            data = event["message"]["data"]
+
+            if message_type == MessageType.MESSAGE_STREAM_PART:
+                run_id = run_ids[data["run_id"]]
+                if pending_part is not None and pending_part[:2] == [run_id, data["message_id"]]:
+                    pending_part[2] += data["content"]
+                    continue
+                if pending_part is not None:
+                    self.log_db.handle_message_update(*pending_part[:2], "append", pending_part[2])
+                pending_part = [run_id, data["message_id"], data["content"]]
+                continue
+
+            if pending_part is not None:
+                self.log_db.handle_message_update(*pending_part[:2], "append", pending_part[2])
+                pending_part = None
+            self.import_event(message_type, data, run_ids, event["at"])
+
+        if pending_part is not None:
+            self.log_db.handle_message_update(*pending_part[:2], "append", pending_part[2])
+
+    def import_event(self, message_type: MessageType, data: dict, run_ids: dict[int, int], at: float):
+        # recordings from before the finishing times were logged are placed at the time they were recorded
+        finished_at = data.get("finished_at") or at
+
+        def duration() -> datetime.timedelta:
+            return datetime.timedelta(seconds=data["duration"] or 0)
+
+        if message_type == MessageType.RUN:
+            started_at = datetime.datetime.fromisoformat(data["started_at"])
+            if data["id"] not in run_ids:
+                run_ids[data["id"]] = self.log_db.create_run(data["model"], data["tag"], started_at, data["configuration"])
+            stopped_at = datetime.datetime.fromisoformat(data["stopped_at"]) if data.get("stopped_at") else None
+            self.log_db.update_run(run_ids[data["id"]], data["model"], data["state"] or "in progress", data["tag"], started_at, stopped_at, data["configuration"])
+            return
+
+        run_id = run_ids[data["run_id"]]
+        if message_type == MessageType.MESSAGE:
+            self.log_db.add_or_update_message(run_id, data["id"], data["conversation"], data["role"], data["content"], data["tokens_query"], data["tokens_response"], duration(), finished_at)
+        elif message_type == MessageType.TOOL_CALL:
+            self.log_db.add_tool_call(run_id, data["message_id"], data["id"], data["function_name"], data["arguments"], data["result_text"], duration(), finished_at)
+        elif message_type == MessageType.SECTION:
+            self.log_db.add_section(run_id, data["id"], data["name"], data["from_message"], data["to_message"], duration(), finished_at, data.get("conversation"))
+        else:
+            print("UNHANDLED recorded event", message_type)
+
+
+@use_case("Exports the timing of a logged run as Chrome trace-event JSON (for chrome://tracing or ui.perfetto.dev)")
+class TraceExporter(UseCase):
+    log_db: DbStorage = None
+    run_id: int = None
+    output: str = ""  # defaults to run_<run_id>.trace.json
+
+    def get_name(self) -> str:
+        return "trace_exporter"
 
-            print("sending")
-            self.log.send(msg.message.type, msg.message.data)
+    def run(self, configuration):
+        output = self.output or f"run_{self.run_id}.trace.json"
+        with open(output, "w") as f:
+            json.dump(export_run_trace(self.log_db, self.run_id), f)
+        print(f"wrote trace of run {self.run_id} to {output}")
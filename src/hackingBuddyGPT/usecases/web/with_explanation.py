@@ -1,3 +1,4 @@
+import dataclasses
 from dataclasses import field
 from typing import List, Any, Union, Dict, Iterable, Optional
 
@@ -11,7 +12,9 @@ from hackingBuddyGPT.usecases.agents import Agent
 from hackingBuddyGPT.usecases.base import AutonomousAgentUseCase, use_case
 from hackingBuddyGPT.utils import LLMResult, tool_message
 from hackingBuddyGPT.utils.configurable import parameter
+from hackingBuddyGPT.utils.context_window import ContextWindow
 from hackingBuddyGPT.utils.openai.openai_lib import OpenAILib
+from hackingBuddyGPT.utils.rolling_summary import RollingSummary
 
 Prompt = List[Union[ChatCompletionMessage, ChatCompletionMessageParam]]
 Context = Any
@@ -32,14 +35,28 @@ class WebTestingWithExplanation(Agent):
         desc="A comma (,) separated list of flags to find",
         default="hostname,dir,username,rootfile,secretfile,adminpass",
     )
+    keep_recent_turns: int = parameter(desc="Number of most recent rounds that are always sent verbatim", default=10)
+    summarize_every_turns: int = parameter(
+        desc="Number of older rounds that are summarized together into the memory of the agent (0 disables summarizing)",
+        default=10,
+    )
+    summary_model: str = parameter(desc="Model that summarizes the older rounds (defaults to the model of the llm)", default="")
 
     _prompt_history: Prompt = field(default_factory=list)
     _context: Context = field(default_factory=lambda: {"notes": list()})
     _capabilities: Dict[str, Capability] = field(default_factory=dict)
     _all_flags_found: bool = False
+    _summary: Optional[RollingSummary] = None
 
     def init(self):
         super().init()
+        self._prompt_history = ContextWindow(self.llm.count_tokens)
+        if self.summarize_every_turns > 0:
+            summary_llm = self.llm
+            if self.summary_model and self.summary_model != self.llm.model:
+                summary_llm = dataclasses.replace(self.llm, model=self.summary_model)
+                summary_llm.init()
+            self._summary = RollingSummary(summary_llm, self.keep_recent_turns, self.summarize_every_turns)
         self._context["host"] = self.host
         self.add_capability(SubmitFlag(self.flag_format_description, set(self.flag_template.format(flag=flag) for flag in self.flags.split(",")), success_function=self.all_flags_found))
         self.add_capability(HTTPRequest(self.host))
@@ -55,14 +72,50 @@ class WebTestingWithExplanation(Agent):
             f"THE MOST IMPORTANT THING TO DO IS, that if you see a flag ({self.flag_format_description}), you should submit it immediately."
         )
         self._prompt_history.append({ "role": "system", "content": system_message })
-        self.log.system_message(system_message)
+        if not self.log.resumed:  # a resumed run already logged it
+            self.log.system_message(system_message)
+
+    def cleanup(self):
+        super().cleanup()
+        if self._summary is not None:
+            self._summary.close()
+
+    def checkpoint(self) -> dict:
+        checkpoint = super().checkpoint()
+        checkpoint["prompt_history"] = [message.model_dump(exclude_none=True) if isinstance(message, ChatCompletionMessage) else message for message in self._prompt_history]
+        if self._summary is not None:
+            checkpoint["summary"] = self._summary.checkpoint()
+        return checkpoint
+
+    def restore(self, checkpoint: dict):
+        super().restore(checkpoint)
+        self._prompt_history[:] = checkpoint["prompt_history"]
+        if self._summary is not None and "summary" in checkpoint:
+            self._summary.restore(checkpoint["summary"])
+
+    def compact_history(self):
+        if self._summary is None:
+            return
+        try:
+            result = self._summary.apply(self._prompt_history)
+        except Exception as e:
+            if self._summary.disabled:
+                self.log.status_message(f"Summarizing the older rounds failed {self._summary.max_failures} times in a row, they are no longer summarized: {e}")
+            else:
+                self.log.status_message(f"Summarizing the older rounds failed, trying again later: {e}")
+            return
+        if result is not None:
+            with self.log.conversation("Summarizing older rounds..."):
+                self.log.add_message("assistant", result.answer, result.tokens_query, result.tokens_response, result.duration)
 
     def all_flags_found(self):
         self.log.status_message("All flags found! Congratulations!")
         self._all_flags_found = True
 
     def perform_round(self, turn: int):
-        prompt = self._prompt_history  # TODO: in the future, this should do some context truncation
+        # older rounds are summarized in the background, a summary that is ready by now replaces them
+        self.compact_history()
+        prompt = self._prompt_history  # cut down to the context size of the model by the llm (see ContextWindow)
 
         result_stream: Iterable[Union[ChoiceDelta, LLMResult]] = self.llm.stream_response(prompt, self.log.console, capabilities=self._capabilities, get_individual_updates=True)
         result: Optional[LLMResult] = None
@@ -79,6 +132,8 @@ class WebTestingWithExplanation(Agent):
         message_id = stream_output.finalize(result.tokens_query, result.tokens_response, result.duration)
 
         message: ChatCompletionMessage = result.result
+        if self._summary is not None:
+            self._summary.start_turn(self._prompt_history)
         self._prompt_history.append(result.result)
 
         if message.tool_calls is not None:
@@ -86,6 +141,8 @@ class WebTestingWithExplanation(Agent):
                 tool_result = self.run_capability_json(message_id, tool_call.id, tool_call.function.name, tool_call.function.arguments)
                 self._prompt_history.append(tool_message(tool_result, tool_call.id))
 
+        if self._summary is not None:
+            self._summary.maybe_start(self._prompt_history)
         return self._all_flags_found
 
 
@@ -15,6 +15,7 @@ from hackingBuddyGPT.usecases.web_api_testing.response_processing.response_handl
 from hackingBuddyGPT.usecases.web_api_testing.utils.custom_datatypes import Context, Prompt
 from hackingBuddyGPT.usecases.web_api_testing.utils.llm_handler import LLMHandler
 from hackingBuddyGPT.utils.configurable import parameter
+from hackingBuddyGPT.utils.context_window import ContextWindow
 from hackingBuddyGPT.utils.openai.openai_lib import OpenAILib
 
 
@@ -63,6 +64,7 @@ class SimpleWebAPIDocumentation(Agent):
     def init(self):
         """Initializes the agent with its capabilities and handlers."""
         super().init()
+        self._prompt_history = ContextWindow(self.llm.count_tokens)
         self._setup_capabilities()
         self.llm_handler = LLMHandler(self.llm, self._capabilities)
         self.response_handler = ResponseHandler(self.llm_handler)
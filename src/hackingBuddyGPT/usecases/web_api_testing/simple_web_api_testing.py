@@ -19,6 +19,7 @@ from hackingBuddyGPT.usecases.web_api_testing.utils.custom_datatypes import Cont
 from hackingBuddyGPT.usecases.web_api_testing.utils.llm_handler import LLMHandler
 from hackingBuddyGPT.utils import tool_message
 from hackingBuddyGPT.utils.configurable import parameter
+from hackingBuddyGPT.utils.context_window import ContextWindow
 from hackingBuddyGPT.utils.openai.openai_lib import OpenAILib
 
 # OpenAPI specification file path
@@ -67,6 +68,7 @@ class SimpleWebAPITesting(Agent):
         LLM handler, capabilities, and the initial prompt.
         """
         super().init()
+        self._prompt_history = ContextWindow(self.llm.count_tokens)
         if os.path.exists(openapi_spec_filename):
             self._openapi_specification: Dict[str, Any] = OpenAPISpecificationParser(openapi_spec_filename).api_data
         self._context["host"] = self.host
@@ -1,9 +1,11 @@
-import re
+import json
 from typing import Any, Dict, List
 
 import openai
 
 from hackingBuddyGPT.capabilities.capability import capabilities_to_action_model
+from hackingBuddyGPT.utils.context_window import ContextWindow
+from hackingBuddyGPT.utils.llm_util import SAFETY_MARGIN
 
 
 class LLMHandler:
@@ -28,55 +30,66 @@ class LLMHandler:
         self.llm = llm
         self._capabilities = capabilities
         self.created_objects: Dict[str, List[Any]] = {}
-        self._re_word_boundaries = re.compile(r"\b")
+        self._response_model = None
+        self._response_model_tokens = 0
 
     def call_llm(self, prompt: List[Dict[str, Any]]) -> Any:
         """
-        Calls the LLM with the specified prompt and retrieves the response.
+        Calls the LLM with the newest part of the prompt that fits into the context window of the model (see
+        ContextWindow) and retrieves the response.
 
         Args:
-            prompt (List[Dict[str, Any]]): The prompt messages to send to the LLM.
+            prompt (List[Dict[str, Any]]): The prompt messages to send to the LLM, preferably a ContextWindow, as
+                the tokens of the messages of a plain list have to be counted on every call.
 
         Returns:
             Any: The response from the LLM.
         """
-        print(f"Initial prompt length: {len(prompt)}")
+        response_model = self.response_model()
+        window = self.context_window(prompt)
+        max_tokens = self.llm.context_size - SAFETY_MARGIN - self._response_model_tokens
 
-        def call_model(prompt: List[Dict[str, Any]]) -> Any:
+        def call_model(messages: List[Dict[str, Any]]) -> Any:
             """Helper function to avoid redundancy in making the API call."""
             return self.llm.instructor.chat.completions.create_with_completion(
                 model=self.llm.model,
-                messages=prompt,
-                response_model=capabilities_to_action_model(self._capabilities),
+                messages=messages,
+                response_model=response_model,
             )
 
         try:
-            if len(prompt) > 30:
-                return call_model(self.adjust_prompt(prompt, num_prompts=5))
-
-            return call_model(self.adjust_prompt_based_on_token(prompt))
+            return call_model(window.window(max_tokens))
         except openai.BadRequestError as e:
-            try:
-                print(f"Error: {str(e)} - Adjusting prompt size and retrying.")
-                # Reduce prompt size; removing elements and logging this adjustment
-                return call_model(self.adjust_prompt_based_on_token(self.adjust_prompt(prompt)))
-            except openai.BadRequestError as e:
-                new_prompt = self.adjust_prompt_based_on_token(self.adjust_prompt(prompt, num_prompts=2))
-                print("New prompt:")
-                print(f"Len New prompt:{len(new_prompt)}")
-
-                for prompt in new_prompt:
-                    print(f"{prompt}")
-                return call_model(new_prompt)
+            if getattr(e, "code", None) != "context_length_exceeded" and "maximum context length" not in str(e):
+                raise
+            # the token counts are estimates (eg. for the tool definitions), so the request is retried once with a
+            # considerably smaller window
+            print(f"Error: {str(e)} - Retrying with half of the context window.")
+            return call_model(window.window(max_tokens // 2))
+
+    def response_model(self) -> Any:
+        if self._response_model is None:
+            self._response_model = capabilities_to_action_model(self._capabilities)
+            self._response_model_tokens = self.llm.count_tokens(json.dumps(self._response_model.model_json_schema()))
+        return self._response_model
+
+    def context_window(self, prompt: List[Dict[str, Any]]) -> ContextWindow:
+        if isinstance(prompt, ContextWindow):
+            return prompt
+        return ContextWindow(self.llm.count_tokens, prompt)
 
     def adjust_prompt(self, prompt: List[Dict[str, Any]], num_prompts: int = 5) -> List[Dict[str, Any]]:
-        adjusted_prompt = prompt[len(prompt) - num_prompts - (len(prompt) % 2) : len(prompt)]
-        if not isinstance(adjusted_prompt[0], dict):
-            adjusted_prompt = prompt[len(prompt) - num_prompts - (len(prompt) % 2) - 1 : len(prompt)]
+        """
+        Returns the last num_prompts messages of the prompt, extended to the front so that tool results are not
+        separated from the message with their tool call.
+        """
+        start = max(len(prompt) - num_prompts, 0)
+        while start > 0 and self._role(prompt[start]) == "tool":
+            start -= 1
+        adjusted_prompt = prompt[start:]
 
         print(f"Adjusted prompt length: {len(adjusted_prompt)}")
-        print(f"adjusted prompt:{adjusted_prompt}")
-        return prompt
+        return adjusted_prompt
 
     def add_created_object(self, created_object: Any, object_type: str) -> None:
         """
@@ -101,24 +114,15 @@ class LLMHandler:
         print(f"created_objects: {self.created_objects}")
         return self.created_objects
 
-    def adjust_prompt_based_on_token(self, prompt: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        prompt.reverse()
-        tokens = 0
-        max_tokens = 10000
-        for item in prompt:
-            if tokens > max_tokens:
-                prompt.remove(item)
-            else:
-                if isinstance(item, dict):
-                    new_token_count = tokens + self.get_num_tokens(item["content"])
-                    if new_token_count <= max_tokens:
-                        tokens = new_token_count
-                else:
-                    continue
-
-        print(f"tokens:{tokens}")
-        prompt.reverse()
-        return prompt
+    def adjust_prompt_based_on_token(self, prompt: List[Dict[str, Any]], max_tokens: int = 10000) -> List[Dict[str, Any]]:
+        """
+        Returns the leading system messages and the newest messages of the prompt that fit into max_tokens.
+        """
+        return self.context_window(prompt).window(max_tokens)
 
     def get_num_tokens(self, content: str) -> int:
-        return len(self._re_word_boundaries.findall(content)) >> 1
+        return self.llm.count_tokens(content)
+
+    @staticmethod
+    def _role(message: Any) -> Any:
+        return message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
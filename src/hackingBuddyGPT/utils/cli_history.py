@@ -1,31 +1,131 @@
-from .llm_util import LLM, trim_result_front
+from collections import deque
+
+from .llm_util import LLM
+
+# outputs that are longer than this many characters per token of the target size are cut down before they are counted,
+# as counting the tokens of eg. a 'find /' output takes long (and most of it would be dropped anyway)
+TARGET_SIZE_FACTOR = 3
+
+
+def trim_front(model: LLM, target_size: int, text: str) -> tuple[str, int]:
+    """
+    Drops characters from the front of the text until it has at most target_size tokens, returns the rest and its size.
+    """
+    if target_size <= 0:
+        return "", 0
+    if len(text) > TARGET_SIZE_FACTOR * target_size:
+        text = text[-TARGET_SIZE_FACTOR * target_size:]
+    size = model.count_tokens(text)
+    while size > target_size:
+        # tokens are at least a character long, so at least the surplus of tokens has to go
+        text = text[size - target_size:]
+        size = model.count_tokens(text)
+    return text, size
+
+
+def format_command(cmd: str) -> str:
+    return f"$ {cmd}\n"
 
 
 class SlidingCliHistory:
+    """
+    The history of the commands and their outputs, of which the newest part that fits into the token budget of a
+    prompt is given to the LLM.
+
+    The history is kept as segments of (command, output, token count), with the token count of every segment computed
+    once when it is added, and a running total. Fitting it into a budget drops whole segments from the front, and only
+    the output of the oldest segment that still partially fits has to be counted again, so the cost of a round depends
+    on the size of the new output and not on the size of the whole history. Token counts of the segments are added up,
+    which can differ slightly from the count of the joined text.
+    """
+
     model: LLM = None
     maximum_target_size: int = 0
-    sliding_history: str = ""
     last_output: str = ''
 
     def __init__(self, used_model: LLM):
         self.model = used_model
         self.maximum_target_size = self.model.context_size
+        self._segments: deque[tuple[str, str, int]] = deque()
+        self._total_tokens = 0
+        self._last_output_tokens = 0
+
+    @property
+    def sliding_history(self) -> str:
+        return "".join(format_command(cmd) + output for cmd, output, _ in self._segments)
+
+    @property
+    def total_tokens(self) -> int:
+        return self._total_tokens
+
+    def checkpoint(self) -> dict:
+        return {
+            "segments": list(self._segments),
+            "last_output": self.last_output,
+            "last_output_tokens": self._last_output_tokens,
+        }
+
+    def restore(self, checkpoint: dict):
+        self._segments = deque(tuple(segment) for segment in checkpoint["segments"])
+        self._total_tokens = sum(size for _, _, size in self._segments)
+        self.last_output = checkpoint["last_output"]
+        self._last_output_tokens = checkpoint["last_output_tokens"]
+
+    def _segment(self, cmd: str, output: str, target_size: int) -> tuple[str, str, int]:
+        """
+        Returns the segment for the command and output, with the output trimmed from the front to fit into target_size,
+        or an empty segment if not even the command fits.
+        """
+        cmd_size = self.model.count_tokens(format_command(cmd))
+        if cmd_size > target_size:
+            return cmd, "", 0
+        output, output_size = trim_front(self.model, target_size - cmd_size, output)
+        return cmd, output, cmd_size + output_size
+
+    def _append(self, cmd: str, output: str):
+        segment = self._segment(cmd, output, self.maximum_target_size)
+        if segment[2] > 0:
+            self._segments.append(segment)
+            self._total_tokens += segment[2]
+
+    def _trim(self, target_size: int):
+        while self._segments and self._total_tokens > target_size:
+            cmd, output, size = self._segments.popleft()
+            self._total_tokens -= size
+            if self._total_tokens < target_size:
+                # the oldest segment that still partially fits keeps its command and the end of its output
+                segment = self._segment(cmd, output, target_size - self._total_tokens)
+                if segment[2] > 0:
+                    self._segments.appendleft(segment)
+                    self._total_tokens += segment[2]
 
     def add_command(self, cmd: str, output: str):
-        self.sliding_history += f"$ {cmd}\n{output}"
-        self.sliding_history = trim_result_front(self.model, self.maximum_target_size, self.sliding_history)
+        self._append(cmd, output)
+        self._trim(self.maximum_target_size)
 
     def get_history(self, target_size: int) -> str:
-        return trim_result_front(self.model, min(self.maximum_target_size, target_size), self.sliding_history)
+        target_size = min(self.maximum_target_size, target_size)
+        parts = []
+        size = 0
+        for cmd, output, segment_size in reversed(self._segments):
+            if size + segment_size > target_size:
+                cmd, output, segment_size = self._segment(cmd, output, target_size - size)
+                if segment_size > 0:
+                    parts.append(format_command(cmd) + output)
+                break
+            parts.append(format_command(cmd) + output)
+            size += segment_size
+        return "".join(reversed(parts))
 
     def add_command_only(self, cmd: str, output: str):
-        self.sliding_history +=  f"$ {cmd}\n"
-        self.last_output = output
-        last_output_size = self.model.count_tokens(self.last_output)
-        if self.maximum_target_size - last_output_size < 0:
-            last_output_size = 0
-            self.last_output = ''
-        self.sliding_history = trim_result_front(self.model, self.maximum_target_size - last_output_size, self.sliding_history)
+        self._append(cmd, "")
+        self.last_output, self._last_output_tokens = output, self.model.count_tokens(output)
+        if self.maximum_target_size - self._last_output_tokens < 0:
+            self.last_output, self._last_output_tokens = '', 0
+        self._trim(self.maximum_target_size - self._last_output_tokens)
 
     def get_commands_and_last_output(self, target_size: int) -> str:
-        return trim_result_front(self.model, min(self.maximum_target_size, target_size), self.sliding_history + self.last_output)
\ No newline at end of file
+        target_size = min(self.maximum_target_size, target_size)
+        if self._last_output_tokens > target_size:
+            return trim_front(self.model, target_size, self.last_output)[0]
+        return self.get_history(target_size - self._last_output_tokens) + self.last_output
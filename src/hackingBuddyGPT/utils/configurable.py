@@ -3,6 +3,8 @@ import dataclasses
 import inspect
 import os
 import json
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from dotenv import dotenv_values
 from dataclasses import dataclass, Field, field, MISSING, _MISSING_TYPE
 from types import NoneType
@@ -272,12 +274,18 @@ class ParameterDefinition(Generic[C]):
     secret: bool
 
     _instance: Optional[Any] = field(init=False, default=None)
+    # held while the instance is created, so that a (global) parameter that is shared by configurables which are
+    # initialized concurrently is still only created once
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False, compare=False)
 
     def __call__(self, collection: ParsingResults) -> C:
         if self._instance is None:
             value = get_at(collection, self.name)
             if value is None:
                 raise ParameterError(f"Missing required parameter '--{'.'.join(self.name)}'", self.name)
+            if self.type is bool and isinstance(value, str):
+                # bool("False") would be True
+                value = value.strip().lower() not in ("", "0", "false", "no", "off")
             self._instance = self.type(value)
         return self._instance
 
@@ -335,12 +343,12 @@ class ComplexParameterDefinition(ParameterDefinition[C]):
         # TODO: default handling?
         # we only do instance management on non-top level parameter definitions (those would be the full configurable, which does not need to be cached and also fails)
         if self._instance is None:
-            self._instance = self.type(**{
-                name: param(collection)
-                for name, param in self.parameters.items()
-            })
-            if hasattr(self._instance, "init"):
-                self._instance.init()
+            with self._lock:
+                if self._instance is None:
+                    instance = self.type(**call_parameters(self.parameters, collection))
+                    if hasattr(instance, "init"):
+                        instance.init()
+                    self._instance = instance
         return self._instance
 
     def get_default(self, defaults: list[tuple[str, ParsingResults]], fail_fast: bool = True) -> tuple[Any, str, str]:
@@ -365,15 +373,40 @@ class ChoiceParameterDefinition(ParameterDefinition[C]):
             if value not in self.choices:
                 raise ParameterError(f"Invalid value for parameter '--{'.'.join(self.name)}': {value} (possible values are {', '.join(self.choices.keys())})", self.name)
             choice, parameters = self.choices[value]
-            self._instance = choice(**{
-                name: parameter(collection)
-                for name, parameter in parameters.items()
-            })
-            if hasattr(self._instance, "init"):
-                self._instance.init()
+            with self._lock:
+                if self._instance is None:
+                    instance = choice(**call_parameters(parameters, collection))
+                    if hasattr(instance, "init"):
+                        instance.init()
+                    self._instance = instance
         return self._instance
 
 
+def call_parameters(parameters: dict[str, ParameterDefinition], collection: ParsingResults) -> dict[str, Any]:
+    """
+    Evaluates the parameters of a configurable. The configurables among them are independent of each other, so they
+    are created and initialized concurrently (their init often connects somewhere, eg. SSH, the database or the log
+    server), each of them again with its own dependencies first. If one of them fails, its error is raised right away,
+    without waiting for the others.
+    """
+    pending = [
+        name for name, parameter in parameters.items()
+        if isinstance(parameter, (ComplexParameterDefinition, ChoiceParameterDefinition)) and parameter._instance is None
+    ]
+    if len(pending) > 1:
+        executor = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="configurable-init")
+        try:
+            futures = {name: executor.submit(parameters[name], collection) for name in pending}
+            done, _ = wait(futures.values(), return_when=FIRST_EXCEPTION)
+            for name in pending:  # in parameter order, so that the error is deterministic if several already failed
+                if futures[name] in done and futures[name].exception() is not None:
+                    raise futures[name].exception()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return {name: parameter(collection) for name, parameter in parameters.items()}
+
+
 def get_inspect_parameters_for_class(cls: type, basename: list[str]) -> dict[str, tuple[inspect.Parameter, list[str], Optional[dataclasses.Field]]]:
     fields = getattr(cls, "__dataclass_fields__", {})
     return {
@@ -503,27 +536,49 @@ def parameter_definition_for(param: inspect.Parameter, name: list[str], field: O
 
 @dataclass
 class Parseable(Generic[C]):
-    cls: Type[C]
+    """
+    A command of the CLI. Its parameters are only collected when the command is used, and if `cls` is not given, it is
+    only then obtained from the `loader`, so that listing the commands does not need to import them all.
+    """
+    cls: Optional[Type[C]]
     description: Optional[str]
+    loader: Optional[Callable[[], Type[C]]] = None
 
-    _parameter: ComplexParameterDefinition = field(init=False)
+    _parameter: Optional[ComplexParameterDefinition] = field(init=False, default=None)
     _parameter_collection: ParameterCollection = field(init=False, default_factory=dict)
+    _name_index: Optional[dict[str, list[str]]] = field(init=False, default=None)
 
     def __call__(self, parsing_results: ParsingResults):
-        return self._parameter(parsing_results)
-
-    def __post_init__(self):
-        self._parameter = ComplexParameterDefinition(
-            name=[],
-            type=self.cls,
-            default=no_default(),
-            description=self.description,
-            secret=False,
-            parameters=parameter_definitions_for_class(self.cls, [], self._parameter_collection),
-        )
+        return self.parameter(parsing_results)
+
+    @property
+    def parameter(self) -> ComplexParameterDefinition:
+        if self._parameter is None:
+            if self.cls is None:
+                self.cls = self.loader()
+            self._parameter = ComplexParameterDefinition(
+                name=[],
+                type=self.cls,
+                default=no_default(),
+                description=self.description,
+                secret=False,
+                parameters=parameter_definitions_for_class(self.cls, [], self._parameter_collection),
+            )
+        return self._parameter
+
+    @property
+    def parameter_collection(self) -> ParameterCollection:
+        _ = self.parameter
+        return self._parameter_collection
+
+    @property
+    def name_index(self) -> dict[str, list[str]]:
+        if self._name_index is None:
+            self._name_index = parameter_name_index(self.parameter_collection)
+        return self._name_index
 
     def to_help(self, defaults: list[tuple[str, ParsingResults]], level: int = 0) -> str:
-        return "\n".join(dfs_flatmap(self._parameter_collection, lambda _, parameter: parameter.to_help(defaults, level+1) if not isinstance(parameter, ComplexParameterDefinition) else None))
+        return "\n".join(dfs_flatmap(self.parameter_collection, lambda _, parameter: parameter.to_help(defaults, level+1) if not isinstance(parameter, ComplexParameterDefinition) else None))
 
 
 CommandMap = dict[str, Union["CommandMap[C]", Parseable[C]]]
@@ -592,32 +647,57 @@ def _instantiate(program: str, args: list[str], commands: CommandMap[C], command
         raise TypeError(f"Invalid command type {type(command)}")
 
 
-def get_environment_variables(parsing_results: ParsingResults, parameter_collection: ParameterCollection) -> tuple[str, ParsingResults]:
+def parameter_name_index(parameter_collection: ParameterCollection) -> dict[str, list[str]]:
+    """
+    Maps the dotted names of all parameters that can be set (as they are given on the command line) to their path in
+    the parameter collection, so that names from the environment can be resolved with a single lookup each.
+    """
+    index = dict()
+
+    def add(name: list[str], parameter: ParameterDefinition):
+        if name[-1] != "$":
+            index[".".join(name)] = name
+        elif isinstance(parameter, ChoiceParameterDefinition):
+            index[".".join(name[:-1])] = name
+
+    dfs_flatmap(parameter_collection, add)
+    return index
+
+
+def resolve_environment_name(name_index: dict[str, list[str]], key: str) -> Optional[list[str]]:
+    # legacy support for other spellings of the parameter names
+    for candidate in (key, key.lower(), key.replace("_", "."), key.lower().replace("-", ".")):
+        name = name_index.get(candidate)
+        if name is not None:
+            return name
+    return None
+
+
+def get_environment_variables(parsing_results: ParsingResults, parameter_collection: ParameterCollection, name_index: Optional[dict[str, list[str]]] = None) -> tuple[str, ParsingResults]:
+    if name_index is None:
+        name_index = parameter_name_index(parameter_collection)
+
     env_parsing_results = dict()
     for key, value in os.environ.items():
-        # legacy support
-        test_key = key.split(".")
-        if get_at(parameter_collection, test_key) is None:
-            test_key = key.lower().split(".")
-            if get_at(parameter_collection, test_key) is None:
-                test_key = key.replace("_", ".").split(".")
-                if get_at(parameter_collection, test_key) is None:
-                    test_key = key.lower().replace("-", ".").split(".")
-                    if get_at(parameter_collection, test_key) is None:
-                        continue
-        set_at(parsing_results, test_key, value)
-        set_at(env_parsing_results, test_key, value)
+        name = resolve_environment_name(name_index, key)
+        if name is None:
+            continue
+        set_at(parsing_results, name, value)
+        set_at(env_parsing_results, name, value)
     return ("environment variables", env_parsing_results)
 
 
-def get_env_file_variables(parsing_results: ParsingResults, parameter_collection: ParameterCollection) -> tuple[str, ParsingResults]:
+def get_env_file_variables(parsing_results: ParsingResults, parameter_collection: ParameterCollection, name_index: Optional[dict[str, list[str]]] = None) -> tuple[str, ParsingResults]:
+    if name_index is None:
+        name_index = parameter_name_index(parameter_collection)
+
     env_file_parsing_results = dict()
     for key, value in dotenv_values().items():
-        key = key.split(".")
-        if get_at(parameter_collection, key) is None:
+        name = name_index.get(key)
+        if name is None:
             continue
-        set_at(parsing_results, key, value)
-        set_at(env_file_parsing_results, key, value)
+        set_at(parsing_results, name, value)
+        set_at(env_file_parsing_results, name, value)
     return (".env file", env_file_parsing_results)
 
 
@@ -641,15 +721,15 @@ def filter_secret_values(parsing_results: ParsingResults, parameter_collection:
 
 
 def parse_args(program: str, command: list[str], direct_args: list[str], parseable: Parseable[C], parse_env_file: bool = True, parse_environment: bool = True) -> tuple[C, ParsingResults]:
-    parameter_collection = parseable._parameter_collection
+    parameter_collection = parseable.parameter_collection
 
     parsing_results: ParsingResults = dict()
     defaults: list[tuple[str, ParsingResults]] = []
     if parse_environment:
-        defaults.append(get_environment_variables(parsing_results, parameter_collection))
+        defaults.append(get_environment_variables(parsing_results, parameter_collection, parseable.name_index))
 
     if parse_env_file:
-        defaults.append(get_env_file_variables(parsing_results, parameter_collection))
+        defaults.append(get_env_file_variables(parsing_results, parameter_collection, parseable.name_index))
 
     if "--config" in direct_args:
         config_file_idx = direct_args.index("--config")
@@ -1,13 +1,98 @@
+import time
+
 from rich import console
+from rich.console import Group
+from rich.panel import Panel
+from rich.text import Text
 
 from hackingBuddyGPT.utils.configurable import configurable
 
+CONSOLE_MODES = ("full", "summary", "headless")
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"\n... [{len(text) - max_chars} more characters truncated]"
+
+
+def summarize(text: str, max_chars: int = 120) -> str:
+    first_line = text.strip().split("\n", 1)[0]
+    if len(first_line) > max_chars:
+        first_line = first_line[:max_chars] + "..."
+    return f"{first_line} ({len(text)} chars)"
+
 
 @configurable("console", "Console")
 class Console(console.Console):
     """
     Simple wrapper around the rich Console class, to allow for dependency injection and configuration.
+
+    Rendering every prompt, tool result and streamed token is a real cost in high-throughput runs, so how much is shown
+    is configurable with the `mode`:
+     - `full` renders messages and tool calls as panels, each cut off after `max_panel_chars` characters (0 for no
+       limit), streamed output is redrawn at most `stream_fps` times per second
+     - `summary` prints a single line per message and tool call, and nothing while streaming
+     - `headless` prints nothing at all
+    This only affects the terminal, the loggers still store everything.
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, mode: str = "full", max_panel_chars: int = 20000, stream_fps: float = 20.0):
+        if mode not in CONSOLE_MODES:
+            raise ValueError(f"Unknown console mode {mode!r}, expected one of {CONSOLE_MODES}")
+        super().__init__(quiet=mode == "headless")
+        self.mode = mode
+        self.max_panel_chars = max_panel_chars
+        self.stream_fps = stream_fps
+
+        self._stream_buffer: list[str] = []
+        self._stream_flushed_at = 0.0
+
+    def print_message(self, title: str, content: str):
+        if self.mode == "full":
+            self.print(Panel(truncate(content, self.max_panel_chars), title=title))
+        elif self.mode == "summary":
+            self.print(Text.assemble((f"{title}: ", "bold"), summarize(content)))
+
+    def print_tool_call(self, function_name: str, arguments: str, result_text: str):
+        if self.mode == "full":
+            self.print(Panel(
+                Group(
+                    Panel(truncate(arguments, self.max_panel_chars), title="arguments"),
+                    Panel(truncate(result_text, self.max_panel_chars), title="result"),
+                ),
+                title=f"Tool Call: {function_name}"))
+        elif self.mode == "summary":
+            self.print(Text.assemble((f"Tool Call: {function_name} ", "bold"), summarize(arguments), " -> ", summarize(result_text or "")))
+
+    def stream_header(self, header: str):
+        """
+        Starts a new block of streamed output (eg. the content or a tool call of a message), given as rich markup.
+        """
+        if self.mode != "full":
+            return
+        self.flush_stream()
+        self.print(header)
+
+    def stream(self, text: str):
+        """
+        Adds streamed output, which is only written when the last write is at least 1/stream_fps seconds ago.
+        """
+        if self.mode != "full":
+            return
+        self._stream_buffer.append(text)
+        now = time.monotonic()
+        if self.stream_fps <= 0 or now - self._stream_flushed_at >= 1 / self.stream_fps:
+            self.flush_stream(now)
+
+    def flush_stream(self, now: float = None):
+        if self._stream_buffer:
+            self.print("".join(self._stream_buffer), end="", markup=False, highlight=False)
+            self._stream_buffer.clear()
+        self._stream_flushed_at = now if now is not None else time.monotonic()
+
+    def end_stream(self):
+        if self.mode != "full":
+            return
+        self.flush_stream()
+        self.print()
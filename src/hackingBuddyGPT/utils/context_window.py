@@ -0,0 +1,128 @@
+"""
+A prompt history for chat-style use cases, that knows the token count of each of its messages, so that the part that
+fits into the context window of the model can be selected without tokenizing the whole history for every request.
+"""
+
+import bisect
+import json
+from typing import Any, Callable, Iterable
+
+# tokens that every message costs on top of its content (role, separators), as documented by OpenAI
+MESSAGE_OVERHEAD = 4
+
+
+def _get(message: Any, key: str) -> Any:
+    if isinstance(message, dict):
+        return message.get(key)
+    return getattr(message, key, None)
+
+
+def message_tokens(count_tokens: Callable[[str], int], message: Any) -> int:
+    """
+    Estimates the tokens of a message (a dict or an openai message object), including its tool calls.
+    """
+    content = _get(message, "content")
+    if content is None:
+        content = ""
+    elif not isinstance(content, str):
+        content = json.dumps(content, default=str)  # content parts
+
+    tokens = MESSAGE_OVERHEAD + count_tokens(content)
+    for tool_call in _get(message, "tool_calls") or []:
+        function = _get(tool_call, "function")
+        tokens += count_tokens(_get(function, "name") or "") + count_tokens(_get(function, "arguments") or "")
+    return int(tokens)
+
+
+class ContextWindow(list):
+    """
+    A list of prompt messages, which can be used (and appended to) wherever the prompt history was a plain list, and
+    which additionally keeps the token count of every message and a running total.
+
+    Messages are grouped so that an assistant message with tool calls and the tool results that follow it stay
+    together, as the API rejects tool results without their call. `window` selects the leading system messages and
+    the newest groups that fit into a token budget. Appending costs the tokenization of the new message only, and
+    selecting a window is a binary search over the groups. Other modifications of the list (which the use cases do not
+    do) re-index it, reusing the counts of the messages that are still in it.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], messages: Iterable[Any] = ()):
+        super().__init__()
+        self._count_tokens = count_tokens
+        self._tokens: list[int] = []
+        self._prefix: list[int] = [0]  # _prefix[i] is the sum of the tokens of the first i messages
+        self._group_starts: list[int] = []
+        self.extend(messages)
+
+    @property
+    def total_tokens(self) -> int:
+        return self._prefix[-1]
+
+    def _add(self, message: Any, tokens: int):
+        if _get(message, "role") != "tool" or len(self) == 0:
+            self._group_starts.append(len(self))
+        super().append(message)
+        self._tokens.append(tokens)
+        self._prefix.append(self._prefix[-1] + tokens)
+
+    def append(self, message: Any):
+        self._add(message, message_tokens(self._count_tokens, message))
+
+    def extend(self, messages: Iterable[Any]):
+        for message in messages:
+            self.append(message)
+
+    def __iadd__(self, messages: Iterable[Any]):
+        self.extend(messages)
+        return self
+
+    def _reindex(self, previous: list[Any]):
+        known = {id(message): tokens for message, tokens in zip(previous, self._tokens, strict=True)}
+        messages = list(self)
+        super().clear()
+        self._tokens, self._prefix, self._group_starts = [], [0], []
+        for message in messages:
+            tokens = known.get(id(message))
+            self._add(message, tokens if tokens is not None else message_tokens(self._count_tokens, message))
+
+    def _modify(name: str):
+        def modify(self, *args, **kwargs):
+            previous = list(self)
+            result = getattr(super(ContextWindow, self), name)(*args, **kwargs)
+            self._reindex(previous)
+            return self if name == "__imul__" else result
+        modify.__name__ = name
+        return modify
+
+    insert = _modify("insert")
+    remove = _modify("remove")
+    pop = _modify("pop")
+    clear = _modify("clear")
+    sort = _modify("sort")
+    reverse = _modify("reverse")
+    __setitem__ = _modify("__setitem__")
+    __delitem__ = _modify("__delitem__")
+    __imul__ = _modify("__imul__")
+    del _modify
+
+    def window(self, max_tokens: int) -> list[Any]:
+        """
+        Returns the leading system messages and as many of the newest message groups as fit into max_tokens, the newest
+        group is always included.
+        """
+        max_tokens = int(max_tokens)
+        if self.total_tokens <= max_tokens:
+            return list(self)
+
+        pinned = 0
+        while pinned < len(self) and _get(self[pinned], "role") == "system":
+            pinned += 1
+
+        # the first group (after the pinned messages) from which on everything fits
+        first = bisect.bisect_left(self._group_starts, pinned)
+        if first == len(self._group_starts):
+            return list(self)  # everything is pinned
+        needed = self.total_tokens - (max_tokens - self._prefix[pinned])
+        index = bisect.bisect_left(self._group_starts, needed, lo=first, key=lambda start: self._prefix[start])
+        start = self._group_starts[min(index, len(self._group_starts) - 1)]
+        return self[:pinned] + self[start:]
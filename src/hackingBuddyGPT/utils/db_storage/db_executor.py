@@ -0,0 +1,80 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from hackingBuddyGPT.utils import metrics
+
+from .db_storage import RawDbStorage
+
+
+class DbExecutor:
+    """
+    Moves all database accesses of an asyncio application (like the Viewer) off the event loop.
+
+    All writes are sent to a single writer thread that uses the given storage object, so that they are serialized and
+    keep their order. Reads are handled by a small pool of threads, each of which opens its own read connection to the
+    same database, so that a long running query (eg. loading the history of a big run) does neither block the event loop
+    nor the ingestion of new data.
+
+    In-memory databases can not be shared between connections, so in that case all reads are also done by the writer.
+    """
+
+    def __init__(self, db: RawDbStorage, readers: int = 4):
+        self._db = db
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+        self._reader_local = threading.local()
+        self._readers = None
+        if readers > 0 and not db.is_in_memory:
+            self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+
+    def _reader_db(self) -> RawDbStorage:
+        db = getattr(self._reader_local, "db", None)
+        if db is None:
+            db = RawDbStorage(self._db.connection_string, busy_timeout=self._db.busy_timeout)
+            db.connect(read_only=True)
+            self._reader_local.db = db
+        return db
+
+    def _read(self, method: str, *args, **kwargs) -> Any:
+        return getattr(self._reader_db(), method)(*args, **kwargs)
+
+    def _write(self, method: str, *args, **kwargs) -> Any:
+        return getattr(self._db, method)(*args, **kwargs)
+
+    async def read(self, method: str, *args, **kwargs) -> Any:
+        """
+        Calls the (reading) method with the given name on a storage object of one of the reader threads.
+        """
+        loop = asyncio.get_running_loop()
+        if self._readers is None:
+            return await loop.run_in_executor(self._writer, functools.partial(self._write, method, *args, **kwargs))
+        return await loop.run_in_executor(self._readers, functools.partial(self._read, method, *args, **kwargs))
+
+    async def read_with(self, function: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Calls the function with the storage object of one of the reader threads as first argument, for queries that are
+        not methods of the storage (eg. exports).
+        """
+        loop = asyncio.get_running_loop()
+        if self._readers is None:
+            return await loop.run_in_executor(self._writer, functools.partial(function, self._db, *args, **kwargs))
+        return await loop.run_in_executor(self._readers, lambda: function(self._reader_db(), *args, **kwargs))
+
+    async def write(self, method: str, *args, **kwargs) -> Any:
+        """
+        Calls the method with the given name on the main storage object in the writer thread.
+        """
+        loop = asyncio.get_running_loop()
+        metrics.db_write_queue_depth.inc()
+        try:
+            return await loop.run_in_executor(self._writer, functools.partial(self._write, method, *args, **kwargs))
+        finally:
+            metrics.db_write_queue_depth.dec()
+
+    def shutdown(self):
+        self._writer.shutdown(wait=True)
+        if self._readers is not None:
+            self._readers.shutdown(wait=True)
@@ -1,9 +1,15 @@
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from dataclasses_json import config, dataclass_json
 import datetime
+import functools
+import itertools
+import random
 import sqlite3
+import time
 from typing import Literal, Optional, Union
 
+from hackingBuddyGPT.utils import metrics
 from hackingBuddyGPT.utils.configurable import Global, configurable, parameter
 
 
@@ -36,6 +42,10 @@ class Section:
     from_message: int
     to_message: int
     duration: datetime.timedelta = field(metadata=timedelta_metadata)
+    finished_at: Optional[float] = None  # unix timestamp of the last write, the start is at finished_at - duration
+    # if set, the section only covers the messages of this conversation (and of the conversations "<conversation> - ...")
+    # in its range, eg. the sections of a LoggerBranch, whose range also contains the messages of parallel branches
+    conversation: Optional[str] = None
 
 
 @dataclass_json
@@ -50,6 +60,7 @@ class Message:
     duration: datetime.timedelta = field(metadata=timedelta_metadata)
     tokens_query: int
     tokens_response: int
+    finished_at: Optional[float] = None  # unix timestamp of the last write, the start is at finished_at - duration
 
 
 @dataclass_json
@@ -60,6 +71,9 @@ class MessageStreamPart:
     message_id: int
     action: StreamAction
     content: str
+    # set by the viewer when it merges consecutive parts (with the versions id - len(merged_lengths) + 1 to id) into
+    # this one, the lengths of their contents in UTF-16 code units, so that clients can cut off what they already have
+    merged_lengths: Optional[list[int]] = None
 
 
 @dataclass_json
@@ -74,6 +88,7 @@ class ToolCall:
     state: str
     result_text: str
     duration: datetime.timedelta = field(metadata=timedelta_metadata)
+    finished_at: Optional[float] = None  # unix timestamp of the last write, the start is at finished_at - duration
 
 
 @dataclass_json
@@ -91,22 +106,198 @@ class ToolCallStreamPart:
 LogTypes = Union[Run, Section, Message, MessageStreamPart, ToolCall, ToolCallStreamPart]
 
 
+@dataclass_json
+@dataclass
+class SearchResult:
+    run_id: int
+    message_id: int
+    tool_call_id: Optional[str]  # None if the match is in the message itself
+    snippet: str  # matches are surrounded by SEARCH_HIGHLIGHT_START and SEARCH_HIGHLIGHT_END
+    rank: float  # lower is better
+
+
+@dataclass_json
+@dataclass
+class RoundStats:
+    run_id: int
+    round: int
+    section_id: int
+    from_message: int
+    to_message: Optional[int]
+    duration: float  # all times are in seconds
+    command: Optional[str]  # arguments of the first tool call of the round
+    llm_calls: int
+    tokens_query: int
+    tokens_response: int
+    llm_time: float
+    tool_calls: int
+    tool_time: float
+    response_size: int  # characters of all tool call results
+
+    @property
+    def overhead(self) -> float:
+        """time of the round that was neither spent waiting for the LLM nor for tool calls"""
+        return self.duration - self.llm_time - self.tool_time
+
+
+@dataclass_json
+@dataclass
+class RunStats:
+    run_id: int
+    rounds: int
+    duration: float  # sum of the round durations
+    messages: int
+    llm_calls: int
+    tokens_query: int
+    tokens_response: int
+    llm_time: float
+    tool_calls: int
+    tool_time: float
+    response_size: int
+
+    @property
+    def overhead(self) -> float:
+        return self.duration - self.llm_time - self.tool_time
+
+
+# the snippets are marked with characters that are very unlikely to be part of the logs, so that users of the search can
+# safely replace them with the highlighting they need (eg. after escaping the snippet for HTML)
+SEARCH_HIGHLIGHT_START = "\x02"
+SEARCH_HIGHLIGHT_END = "\x03"
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    message = str(error)
+    return "database is locked" in message or "database is busy" in message or "database table is locked" in message
+
+
+def write_transaction(method):
+    """
+    Runs the decorated method in its own short write transaction (see RawDbStorage.write_batch), calls from within
+    another write transaction just become part of it.
+    """
+    duration = metrics.db_write_duration.labels(method.__name__)
+
+    @functools.wraps(method)
+    def wrapper(self: "RawDbStorage", *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with self.write_batch():
+                return method(self, *args, **kwargs)
+        finally:
+            duration.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
 @configurable("db_storage", "Stores the results of the experiments in a SQLite database")
 class RawDbStorage:
     def __init__(
-        self, connection_string: str = parameter(desc="sqlite3 database connection string for logs", default="wintermute.sqlite3")
+        self,
+        connection_string: str = parameter(desc="sqlite3 database connection string for logs", default="wintermute.sqlite3"),
+        busy_timeout: float = 10.0,  # seconds to wait for a lock held by another process before a write is retried
+        write_retries: int = 5,
     ):
         self.connection_string = connection_string
+        self.busy_timeout = busy_timeout
+        self.write_retries = write_retries
+        self.db: Optional[sqlite3.Connection] = None
+        self.cursor: Optional[sqlite3.Cursor] = None
+        self._read_db: Optional[sqlite3.Connection] = None
+        self._read_cursor: Optional[sqlite3.Cursor] = None
 
     def init(self):
         self.connect()
         self.setup_db()
 
-    def connect(self):
-        self.db = sqlite3.connect(self.connection_string, isolation_level=None)
-        self.db.row_factory = sqlite3.Row
+    @property
+    def is_in_memory(self) -> bool:
+        return self.connection_string == ":memory:" or "mode=memory" in self.connection_string
+
+    def _open_connection(self) -> sqlite3.Connection:
+        # the connection may be handed to a dedicated writer thread (see DbExecutor), accesses are serialized there
+        db = sqlite3.connect(self.connection_string, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False, uri=self.connection_string.startswith("file:"))
+        db.row_factory = sqlite3.Row
+        return db
+
+    def connect(self, read_only: bool = False):
+        """
+        Opens the write connection, which runs in autocommit mode with every write being its own short transaction (see
+        write_transaction). The database is switched to WAL mode, so that several processes (eg. parallel agents) can
+        share one log database, and readers never block writers (nor the other way around).
+        Read queries are served by a separate connection that is opened on first use, with read_only only that one is used.
+        """
+        self._read_db = self._read_cursor = None
+        if read_only:
+            self.db = self.cursor = None
+            return
+
+        self.db = self._open_connection()
         self.cursor = self.db.cursor()
-
+        if not self.is_in_memory:
+            self.cursor.execute("PRAGMA journal_mode = WAL")
+            # in WAL mode the database can not be corrupted with synchronous=NORMAL, only the last commits might be lost on power loss
+            self.cursor.execute("PRAGMA synchronous = NORMAL")
+
+    def close(self):
+        for db in (self._read_db, self.db):
+            if db is not None:
+                db.close()
+        self.db = self.cursor = self._read_db = self._read_cursor = None
+
+    @property
+    def read_cursor(self) -> sqlite3.Cursor:
+        if self._read_cursor is None:
+            if self.is_in_memory:
+                # in-memory databases can not be shared between connections
+                return self.cursor
+            self._read_db = self._open_connection()
+            self._read_db.execute("PRAGMA query_only = ON")
+            self._read_cursor = self._read_db.cursor()
+        return self._read_cursor
+
+    @contextmanager
+    def write_batch(self):
+        """
+        Groups all writes in the context into one transaction, which is considerably faster for bulk writes.
+
+        The transaction is started with BEGIN IMMEDIATE, so that the write lock is taken (and waited for, see
+        busy_timeout) before anything is read, as upgrading a read transaction to a write transaction fails immediately
+        in WAL mode if another process has written in the meantime. If the lock can still not be acquired, starting the
+        transaction is retried with a randomized exponential backoff.
+        """
+        if self.db.in_transaction:
+            yield
+            return
+
+        for attempt in itertools.count():
+            try:
+                self.cursor.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt >= self.write_retries:
+                    raise
+                time.sleep(min(0.05 * 2 ** attempt, 2.0) * random.uniform(0.5, 1.5))
+
+        try:
+            yield
+            self.cursor.execute("COMMIT")
+        finally:
+            if self.db.in_transaction:
+                self.cursor.execute("ROLLBACK")
+
+    def _execute_script(self, script: str):
+        # like cursor.executescript, but without committing, so that the statements can be part of a write transaction
+        statement = ""
+        for line in script.splitlines(keepends=True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                self.cursor.execute(statement)
+                statement = ""
+        if statement.strip():
+            self.cursor.execute(statement)
+
+    @write_transaction
     def setup_db(self):
         # create tables
         self.cursor.execute("""
@@ -128,6 +319,8 @@ class RawDbStorage:
                 from_message INTEGER,
                 to_message INTEGER,
                 duration REAL,
+                finished_at REAL,
+                conversation TEXT,
                 PRIMARY KEY (run_id, id),
                 FOREIGN KEY (run_id) REFERENCES runs (id)
             )
@@ -143,6 +336,7 @@ class RawDbStorage:
                 duration REAL,
                 tokens_query INTEGER,
                 tokens_response INTEGER,
+                finished_at REAL,
                 PRIMARY KEY (run_id, id),
                 FOREIGN KEY (run_id) REFERENCES runs (id)
             )
@@ -158,134 +352,559 @@ class RawDbStorage:
                 state TEXT,
                 result_text TEXT,
                 duration REAL,
+                finished_at REAL,
                 PRIMARY KEY (run_id, message_id, id),
                 FOREIGN KEY (run_id, message_id) REFERENCES messages (run_id, id)
             )
         """)
+        # the state of an agent at the end of its last round, so that an interrupted run can be resumed
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_id INTEGER PRIMARY KEY,
+                turn INTEGER,
+                state TEXT,
+                saved_at REAL,
+                FOREIGN KEY (run_id) REFERENCES runs (id)
+            )
+        """)
+        # databases created before the timestamps were recorded
+        for table in ("sections", "messages", "tool_calls"):
+            self._add_column_if_missing(table, "finished_at", "REAL")
+        # databases created before sections could be limited to a conversation
+        self._add_column_if_missing("sections", "conversation", "TEXT")
+
+        self.setup_search_index()
+        self.setup_statistics()
+
+    def _add_column_if_missing(self, table: str, column: str, definition: str):
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row["name"] for row in self.cursor.fetchall()}:
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def setup_search_index(self):
+        """
+        The full-text search index is kept in FTS5 tables, whose rowids are the rowids of the indexed messages and tool
+        calls. They are kept up to date by triggers on every write. Streamed message updates (which increase the version
+        of a message) are not indexed token by token, the message is re-indexed once it is finalized instead.
+        """
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('messages_fts', 'tool_calls_fts')")
+        existing_tables = {row[0] for row in self.cursor.fetchall()}
+
+        try:
+            self.cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content)")
+            self.cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS tool_calls_fts USING fts5(arguments, result_text)")
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search is not available, as the sqlite3 library does not support FTS5: {e}")
+            return
+
+        self._execute_script("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages WHEN new.version = old.version BEGIN
+                DELETE FROM messages_fts WHERE rowid = old.rowid;
+                INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                DELETE FROM messages_fts WHERE rowid = old.rowid;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS tool_calls_fts_insert AFTER INSERT ON tool_calls BEGIN
+                INSERT INTO tool_calls_fts (rowid, arguments, result_text) VALUES (new.rowid, new.arguments, new.result_text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS tool_calls_fts_update AFTER UPDATE ON tool_calls BEGIN
+                DELETE FROM tool_calls_fts WHERE rowid = old.rowid;
+                INSERT INTO tool_calls_fts (rowid, arguments, result_text) VALUES (new.rowid, new.arguments, new.result_text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS tool_calls_fts_delete AFTER DELETE ON tool_calls BEGIN
+                DELETE FROM tool_calls_fts WHERE rowid = old.rowid;
+            END;
+        """)
+
+        # databases that were created before the search index existed get indexed once
+        if "messages_fts" not in existing_tables:
+            self.cursor.execute("INSERT INTO messages_fts (rowid, content) SELECT rowid, content FROM messages")
+        if "tool_calls_fts" not in existing_tables:
+            self.cursor.execute("INSERT INTO tool_calls_fts (rowid, arguments, result_text) SELECT rowid, arguments, result_text FROM tool_calls")
+
+    def setup_statistics(self):
+        """
+        Per-round and per-run statistics are materialized into their own tables, which are kept up to date by triggers
+        when sections, messages and tool calls are written, so that summaries never need to scan the logs.
+        Rounds are the sections named "round <n>" (as written by the AutonomousUseCase), messages and tool calls are
+        attributed to the round whose message range contains them, and additionally broken down by conversation.
+        """
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'run_stats'")
+        is_new = self.cursor.fetchone() is None
+
+        # the round a message (or the message of a tool call) belongs to
+        def round_of(message_id: str) -> str:
+            return f"""(
+                SELECT section_id FROM round_stats
+                WHERE run_id = new.run_id AND from_message <= {message_id} AND (to_message IS NULL OR {message_id} < to_message)
+                ORDER BY from_message DESC LIMIT 1
+            )"""
+
+        message_counters = "llm_calls = llm_calls + (new.role = 'assistant'), tokens_query = tokens_query + COALESCE(new.tokens_query, 0), tokens_response = tokens_response + COALESCE(new.tokens_response, 0), llm_time = llm_time + COALESCE(new.duration, 0)"
+        message_deltas = "tokens_query = tokens_query + COALESCE(new.tokens_query, 0) - COALESCE(old.tokens_query, 0), tokens_response = tokens_response + COALESCE(new.tokens_response, 0) - COALESCE(old.tokens_response, 0), llm_time = llm_time + COALESCE(new.duration, 0) - COALESCE(old.duration, 0)"
+        tool_call_counters = "tool_calls = tool_calls + 1, tool_time = tool_time + COALESCE(new.duration, 0), response_size = response_size + COALESCE(length(new.result_text), 0)"
+        tool_call_deltas = "tool_time = tool_time + COALESCE(new.duration, 0) - COALESCE(old.duration, 0), response_size = response_size + COALESCE(length(new.result_text), 0) - COALESCE(length(old.result_text), 0)"
+
+        self._execute_script(f"""
+            CREATE TABLE IF NOT EXISTS run_stats (
+                run_id INTEGER PRIMARY KEY,
+                messages INTEGER DEFAULT 0,
+                llm_calls INTEGER DEFAULT 0,
+                tokens_query INTEGER DEFAULT 0,
+                tokens_response INTEGER DEFAULT 0,
+                llm_time REAL DEFAULT 0,
+                tool_calls INTEGER DEFAULT 0,
+                tool_time REAL DEFAULT 0,
+                response_size INTEGER DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS round_stats (
+                run_id INTEGER,
+                section_id INTEGER,
+                round INTEGER,
+                from_message INTEGER,
+                to_message INTEGER,
+                duration REAL DEFAULT 0,
+                command TEXT,
+                llm_calls INTEGER DEFAULT 0,
+                tokens_query INTEGER DEFAULT 0,
+                tokens_response INTEGER DEFAULT 0,
+                llm_time REAL DEFAULT 0,
+                tool_calls INTEGER DEFAULT 0,
+                tool_time REAL DEFAULT 0,
+                response_size INTEGER DEFAULT 0,
+                PRIMARY KEY (run_id, section_id)
+            );
+            CREATE INDEX IF NOT EXISTS round_stats_by_round ON round_stats (run_id, round);
+            CREATE TABLE IF NOT EXISTS round_conversation_stats (
+                run_id INTEGER,
+                section_id INTEGER,
+                conversation TEXT,
+                last_message_id INTEGER,
+                llm_calls INTEGER DEFAULT 0,
+                tokens_query INTEGER DEFAULT 0,
+                tokens_response INTEGER DEFAULT 0,
+                llm_time REAL DEFAULT 0,
+                PRIMARY KEY (run_id, section_id, conversation)
+            );
+
+            CREATE TRIGGER IF NOT EXISTS stats_section AFTER INSERT ON sections WHEN new.name LIKE 'round %' BEGIN
+                INSERT INTO round_stats (run_id, section_id, round, from_message, to_message, duration)
+                VALUES (new.run_id, new.id, CAST(substr(new.name, 7) AS INTEGER), new.from_message, new.to_message, new.duration)
+                ON CONFLICT (run_id, section_id) DO UPDATE SET
+                    from_message = excluded.from_message, to_message = excluded.to_message, duration = excluded.duration;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS stats_message_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO run_stats (run_id) VALUES (new.run_id) ON CONFLICT (run_id) DO NOTHING;
+                UPDATE run_stats SET messages = messages + 1, {message_counters} WHERE run_id = new.run_id;
+                UPDATE round_stats SET {message_counters} WHERE run_id = new.run_id AND section_id = {round_of("new.id")};
+                INSERT INTO round_conversation_stats (run_id, section_id, conversation, last_message_id)
+                SELECT new.run_id, {round_of("new.id")}, COALESCE(new.conversation, ''), new.id WHERE {round_of("new.id")} IS NOT NULL
+                ON CONFLICT (run_id, section_id, conversation) DO UPDATE SET last_message_id = max(last_message_id, excluded.last_message_id);
+                UPDATE round_conversation_stats SET {message_counters}
+                WHERE run_id = new.run_id AND section_id = {round_of("new.id")} AND conversation = COALESCE(new.conversation, '');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS stats_message_update AFTER UPDATE OF tokens_query, tokens_response, duration ON messages BEGIN
+                UPDATE run_stats SET {message_deltas} WHERE run_id = new.run_id;
+                UPDATE round_stats SET {message_deltas} WHERE run_id = new.run_id AND section_id = {round_of("new.id")};
+                UPDATE round_conversation_stats SET {message_deltas}
+                WHERE run_id = new.run_id AND section_id = {round_of("new.id")} AND conversation = COALESCE(new.conversation, '');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS stats_tool_call_insert AFTER INSERT ON tool_calls BEGIN
+                INSERT INTO run_stats (run_id) VALUES (new.run_id) ON CONFLICT (run_id) DO NOTHING;
+                UPDATE run_stats SET {tool_call_counters} WHERE run_id = new.run_id;
+                UPDATE round_stats SET {tool_call_counters}, command = COALESCE(command, new.arguments)
+                WHERE run_id = new.run_id AND section_id = {round_of("new.message_id")};
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS stats_tool_call_update AFTER UPDATE OF duration, result_text ON tool_calls BEGIN
+                UPDATE run_stats SET {tool_call_deltas} WHERE run_id = new.run_id;
+                UPDATE round_stats SET {tool_call_deltas} WHERE run_id = new.run_id AND section_id = {round_of("new.message_id")};
+            END;
+        """)
+
+        if is_new:
+            self._backfill_statistics()
+
+    def _backfill_statistics(self):
+        # databases that were created before the statistics tables existed get their statistics computed once
+        self._execute_script("""
+            INSERT INTO round_stats (run_id, section_id, round, from_message, to_message, duration)
+            SELECT run_id, id, CAST(substr(name, 7) AS INTEGER), from_message, to_message, duration FROM sections WHERE name LIKE 'round %';
+
+            CREATE TEMPORARY TABLE message_rounds AS
+            SELECT m.run_id, m.id AS message_id, r.section_id FROM messages m JOIN round_stats r
+            ON r.run_id = m.run_id AND r.from_message <= m.id AND (r.to_message IS NULL OR m.id < r.to_message);
+
+            INSERT INTO run_stats (run_id, messages, llm_calls, tokens_query, tokens_response, llm_time)
+            SELECT run_id, COUNT(*), SUM(role = 'assistant'), COALESCE(SUM(tokens_query), 0), COALESCE(SUM(tokens_response), 0), COALESCE(SUM(duration), 0)
+            FROM messages GROUP BY run_id;
+            INSERT INTO run_stats (run_id) SELECT DISTINCT run_id FROM tool_calls WHERE run_id NOT IN (SELECT run_id FROM run_stats);
+            UPDATE run_stats SET
+                tool_calls = (SELECT COUNT(*) FROM tool_calls t WHERE t.run_id = run_stats.run_id),
+                tool_time = (SELECT COALESCE(SUM(duration), 0) FROM tool_calls t WHERE t.run_id = run_stats.run_id),
+                response_size = (SELECT COALESCE(SUM(length(result_text)), 0) FROM tool_calls t WHERE t.run_id = run_stats.run_id);
+
+            INSERT INTO round_conversation_stats (run_id, section_id, conversation, last_message_id, llm_calls, tokens_query, tokens_response, llm_time)
+            SELECT m.run_id, mr.section_id, COALESCE(m.conversation, ''), MAX(m.id), SUM(m.role = 'assistant'), COALESCE(SUM(m.tokens_query), 0), COALESCE(SUM(m.tokens_response), 0), COALESCE(SUM(m.duration), 0)
+            FROM messages m JOIN message_rounds mr ON mr.run_id = m.run_id AND mr.message_id = m.id
+            GROUP BY m.run_id, mr.section_id, COALESCE(m.conversation, '');
+
+            UPDATE round_stats SET
+                llm_calls = (SELECT COALESCE(SUM(llm_calls), 0) FROM round_conversation_stats c WHERE c.run_id = round_stats.run_id AND c.section_id = round_stats.section_id),
+                tokens_query = (SELECT COALESCE(SUM(tokens_query), 0) FROM round_conversation_stats c WHERE c.run_id = round_stats.run_id AND c.section_id = round_stats.section_id),
+                tokens_response = (SELECT COALESCE(SUM(tokens_response), 0) FROM round_conversation_stats c WHERE c.run_id = round_stats.run_id AND c.section_id = round_stats.section_id),
+                llm_time = (SELECT COALESCE(SUM(llm_time), 0) FROM round_conversation_stats c WHERE c.run_id = round_stats.run_id AND c.section_id = round_stats.section_id);
+
+            CREATE TEMPORARY TABLE tool_call_rounds AS
+            SELECT t.run_id, t.message_id, t.duration, t.result_text, t.arguments, mr.section_id FROM tool_calls t JOIN message_rounds mr
+            ON mr.run_id = t.run_id AND mr.message_id = t.message_id;
+
+            UPDATE round_stats SET
+                tool_calls = (SELECT COUNT(*) FROM tool_call_rounds t WHERE t.run_id = round_stats.run_id AND t.section_id = round_stats.section_id),
+                tool_time = (SELECT COALESCE(SUM(duration), 0) FROM tool_call_rounds t WHERE t.run_id = round_stats.run_id AND t.section_id = round_stats.section_id),
+                response_size = (SELECT COALESCE(SUM(length(result_text)), 0) FROM tool_call_rounds t WHERE t.run_id = round_stats.run_id AND t.section_id = round_stats.section_id),
+                command = (SELECT arguments FROM tool_call_rounds t WHERE t.run_id = round_stats.run_id AND t.section_id = round_stats.section_id ORDER BY message_id LIMIT 1);
+
+            DROP TABLE message_rounds;
+            DROP TABLE tool_call_rounds;
+        """)
+
+    @staticmethod
+    def _message_range_query(query: str, run_id: int, column: str, after: Optional[int], until: Optional[int]) -> tuple[str, list]:
+        # restricts the query to rows that reference a message in the (after, until] range, used for paging
+        params = [run_id]
+        if after is not None:
+            query += f" AND {column} > ?"
+            params.append(after)
+        if until is not None:
+            query += f" AND {column} <= ?"
+            params.append(until)
+        return query, params
+
+    @staticmethod
+    def _deserialize_run(row) -> Run:
+        row = dict(row)
+        row["started_at"] = datetime.datetime.fromisoformat(row["started_at"])
+        row["stopped_at"] = datetime.datetime.fromisoformat(row["stopped_at"]) if row["stopped_at"] else None
+        return Run(**row)
 
     def get_runs(self) -> list[Run]:
+        self.read_cursor.execute("SELECT * FROM runs")
+        return [self._deserialize_run(row) for row in self.read_cursor.fetchall()]
+
+    def get_run(self, run_id: int) -> Optional[Run]:
+        self.read_cursor.execute("SELECT * FROM runs WHERE id = ?", (run_id,))
+        row = self.read_cursor.fetchone()
+        return None if row is None else self._deserialize_run(row)
+
+    def get_next_ids(self, run_id: int) -> tuple[int, int]:
+        """
+        Returns the ids that the next message and the next section of the run get, when logging into it continues.
+        """
+        self.read_cursor.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM messages WHERE run_id = ?", (run_id,))
+        message_id = self.read_cursor.fetchone()[0]
+        self.read_cursor.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM sections WHERE run_id = ?", (run_id,))
+        return message_id, self.read_cursor.fetchone()[0]
+
+    def get_checkpoint(self, run_id: int) -> Optional[tuple[int, str]]:
+        self.read_cursor.execute("SELECT turn, state FROM checkpoints WHERE run_id = ?", (run_id,))
+        row = self.read_cursor.fetchone()
+        return None if row is None else (row["turn"], row["state"])
+
+    def get_last_activity(self, run_id: int) -> Optional[float]:
+        """
+        Returns the unix timestamp of the last message or checkpoint that was written for the run, if there is any.
+        """
+        self.read_cursor.execute(
+            "SELECT MAX(last) FROM ("
+            "SELECT MAX(finished_at) AS last FROM messages WHERE run_id = ? "
+            "UNION ALL SELECT saved_at FROM checkpoints WHERE run_id = ?)",
+            (run_id, run_id),
+        )
+        return self.read_cursor.fetchone()[0]
+
+    def get_sections_by_run(self, run_id: int, from_message_after: Optional[int] = None, from_message_until: Optional[int] = None) -> list[Section]:
         def deserialize(row):
             row = dict(row)
-            row["started_at"] = datetime.datetime.fromisoformat(row["started_at"])
-            row["stopped_at"] = datetime.datetime.fromisoformat(row["stopped_at"]) if row["stopped_at"] else None
+            row["duration"] = datetime.timedelta(seconds=row["duration"])
             return row
 
-        self.cursor.execute("SELECT * FROM runs")
-        return [Run(**deserialize(row)) for row in self.cursor.fetchall()]
+        query, params = self._message_range_query("SELECT * FROM sections WHERE run_id = ?", run_id, "from_message", from_message_after, from_message_until)
+        self.read_cursor.execute(query, params)
+        return [Section(**deserialize(row)) for row in self.read_cursor.fetchall()]
 
-    def get_sections_by_run(self, run_id: int) -> list[Section]:
+    def get_messages_by_run(self, run_id: int, after_id: Optional[int] = None, limit: Optional[int] = None) -> list[Message]:
         def deserialize(row):
             row = dict(row)
             row["duration"] = datetime.timedelta(seconds=row["duration"])
             return row
 
-        self.cursor.execute("SELECT * FROM sections WHERE run_id = ?", (run_id,))
-        return [Section(**deserialize(row)) for row in self.cursor.fetchall()]
+        query = "SELECT * FROM messages WHERE run_id = ?"
+        params = [run_id]
+        if after_id is not None:
+            query += " AND id > ?"
+            params.append(after_id)
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        self.read_cursor.execute(query, params)
+        return [Message(**deserialize(row)) for row in self.read_cursor.fetchall()]
+
+    def get_latest_messages_by_run(self, run_id: int, before_id: Optional[int] = None, limit: int = 250) -> list[Message]:
+        """
+        Returns the (up to) `limit` newest messages of the run that come before `before_id` (or the newest at all), in
+        ascending order. This is used to load the history of a run backwards, page by page.
+        """
+        def deserialize(row):
+            row = dict(row)
+            row["duration"] = datetime.timedelta(seconds=row["duration"])
+            return row
 
-    def get_messages_by_run(self, run_id: int) -> list[Message]:
+        query = "SELECT * FROM messages WHERE run_id = ?"
+        params = [run_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        self.read_cursor.execute(query, params)
+        return [Message(**deserialize(row)) for row in reversed(self.read_cursor.fetchall())]
+
+    def get_sections_overlapping(self, run_id: int, from_message: int, to_message: Optional[int] = None) -> list[Section]:
+        """
+        Returns all sections of the run that cover at least one message of the [from_message, to_message] range, sections
+        that are not yet finished are treated as open ended.
+        """
         def deserialize(row):
             row = dict(row)
             row["duration"] = datetime.timedelta(seconds=row["duration"])
             return row
 
-        self.cursor.execute("SELECT * FROM messages WHERE run_id = ?", (run_id,))
-        return [Message(**deserialize(row)) for row in self.cursor.fetchall()]
+        query = "SELECT * FROM sections WHERE run_id = ? AND (to_message IS NULL OR to_message >= ?)"
+        params = [run_id, from_message]
+        if to_message is not None:
+            query += " AND from_message <= ?"
+            params.append(to_message)
+
+        self.read_cursor.execute(query, params)
+        return [Section(**deserialize(row)) for row in self.read_cursor.fetchall()]
 
-    def get_tool_calls_by_run(self, run_id: int) -> list[ToolCall]:
+    def get_tool_calls_by_run(self, run_id: int, message_after: Optional[int] = None, message_until: Optional[int] = None) -> list[ToolCall]:
         def deserialize(row):
             row = dict(row)
             row["duration"] = datetime.timedelta(seconds=row["duration"])
             return row
 
-        self.cursor.execute("SELECT * FROM tool_calls WHERE run_id = ?", (run_id,))
-        return [ToolCall(**deserialize(row)) for row in self.cursor.fetchall()]
-
+        query, params = self._message_range_query("SELECT * FROM tool_calls WHERE run_id = ?", run_id, "message_id", message_after, message_until)
+        self.read_cursor.execute(query, params)
+        return [ToolCall(**deserialize(row)) for row in self.read_cursor.fetchall()]
+
+    def search(self, query: str, limit: int = 50, raw_query: bool = False) -> list[SearchResult]:
+        """
+        Searches all messages and tool calls (arguments and results) and returns the best `limit` matches, ranked by bm25.
+        By default every whitespace separated term of the query is searched for as is (so things like paths or
+        credentials can be searched without any escaping), with `raw_query` the FTS5 query syntax can be used instead.
+        """
+        if not raw_query:
+            query = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+        if len(query) == 0:
+            return []
+
+        self.read_cursor.execute("""
+            SELECT * FROM (
+                SELECT m.run_id, m.id AS message_id, NULL AS tool_call_id,
+                       snippet(messages_fts, -1, ?, ?, '…', 24) AS snippet, bm25(messages_fts) AS rank
+                FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ?
+                UNION ALL
+                SELECT tc.run_id, tc.message_id, tc.id AS tool_call_id,
+                       snippet(tool_calls_fts, -1, ?, ?, '…', 24) AS snippet, bm25(tool_calls_fts) AS rank
+                FROM tool_calls_fts JOIN tool_calls tc ON tc.rowid = tool_calls_fts.rowid
+                WHERE tool_calls_fts MATCH ?
+            ) ORDER BY rank LIMIT ?
+        """, (SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_END, query, SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_END, query, limit))
+        return [SearchResult(**dict(row)) for row in self.read_cursor.fetchall()]
+
+    def get_round_stats(self, run_id: int) -> list[RoundStats]:
+        self.read_cursor.execute(f"SELECT {', '.join(RoundStats.__dataclass_fields__)} FROM round_stats WHERE run_id = ? ORDER BY round, section_id", (run_id,))
+        return [RoundStats(**dict(row)) for row in self.read_cursor.fetchall()]
+
+    def get_run_stats(self, run_id: Optional[int] = None) -> list[RunStats]:
+        """
+        Returns the statistics of the given run, or of all runs if no run_id is given.
+        """
+        query = """
+            SELECT s.*, COALESCE(r.rounds, 0) AS rounds, COALESCE(r.duration, 0) AS duration FROM run_stats s
+            LEFT JOIN (SELECT run_id, COUNT(*) AS rounds, SUM(duration) AS duration FROM round_stats GROUP BY run_id) r ON r.run_id = s.run_id
+        """
+        params = []
+        if run_id is not None:
+            query += " WHERE s.run_id = ?"
+            params.append(run_id)
+        self.read_cursor.execute(query + " ORDER BY s.run_id", params)
+        return [RunStats(**dict(row)) for row in self.read_cursor.fetchall()]
+
+    def get_round_data(self, run_id: int, round: int, explanation: bool, status_update: bool,
+                       command_conversation: str = "Asking LLM for a new command...",
+                       explanation_conversation: str = "Analyze its result...",
+                       state_conversation: str = "Updating fact list..") -> list[str]:
+        """
+        Returns a row for the command history table (see utils.ui.get_history_table) from the materialized statistics of
+        the round, the conversation names are the ones used by the Privesc agents.
+        """
+        self.read_cursor.execute("SELECT * FROM round_stats WHERE run_id = ? AND round = ? ORDER BY section_id DESC LIMIT 1", (run_id, round))
+        round_stats = self.read_cursor.fetchone()
+        if round_stats is None:
+            return [""] * (4 + (3 if explanation else 0) + (2 if status_update else 0))
+
+        self.read_cursor.execute("SELECT * FROM round_conversation_stats WHERE run_id = ? AND section_id = ?", (run_id, round_stats["section_id"]))
+        conversations = {row["conversation"]: row for row in self.read_cursor.fetchall()}
+
+        def timing(conversation: str) -> tuple[str, str]:
+            row = conversations.get(conversation)
+            if row is None:
+                return "", ""
+            return f"{row['llm_time']:.4f}", f"{row['tokens_query']}/{row['tokens_response']}"
+
+        think_time, tokens = timing(command_conversation)
+        result = [think_time, tokens, round_stats["command"] or "", str(round_stats["response_size"])]
+
+        if explanation:
+            explanation_text = ""
+            if explanation_conversation in conversations:
+                self.read_cursor.execute("SELECT content FROM messages WHERE run_id = ? AND id = ?", (run_id, conversations[explanation_conversation]["last_message_id"]))
+                row = self.read_cursor.fetchone()
+                explanation_text = row["content"] if row else ""
+            result += [explanation_text, *timing(explanation_conversation)]
+
+        if status_update:
+            result += list(timing(state_conversation))
+
+        return result
+
+    @write_transaction
     def create_run(self, model: str, tag: str, started_at: datetime.datetime, configuration: str) -> int:
+        # the id is taken from the row that was inserted in this transaction, so concurrent processes always get distinct ids
         self.cursor.execute(
-            "INSERT INTO runs (model, state, tag, started_at, configuration) VALUES (?, ?, ?, ?, ?)",
+            "INSERT INTO runs (model, state, tag, started_at, configuration) VALUES (?, ?, ?, ?, ?) RETURNING id",
             (model, "in progress", tag, started_at, configuration),
         )
-        return self.cursor.lastrowid
+        return self.cursor.fetchone()[0]
 
-    def add_message(self, run_id: int, message_id: int, conversation: Optional[str], role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta):
+    @write_transaction
+    def add_message(self, run_id: int, message_id: int, conversation: Optional[str], role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta, finished_at: Optional[float] = None):
         self.cursor.execute(
-            "INSERT INTO messages (run_id, conversation, id, role, content, tokens_query, tokens_response, duration) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (run_id, conversation, message_id, role, content, tokens_query, tokens_response, duration.total_seconds())
+            "INSERT INTO messages (run_id, conversation, id, role, content, tokens_query, tokens_response, duration, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, conversation, message_id, role, content, tokens_query, tokens_response, duration.total_seconds(), finished_at or time.time())
         )
 
-    def add_or_update_message(self, run_id: int, message_id: int, conversation: Optional[str], role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta):
+    @write_transaction
+    def add_or_update_message(self, run_id: int, message_id: int, conversation: Optional[str], role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta, finished_at: Optional[float] = None):
+        finished_at = finished_at or time.time()
         self.cursor.execute(
             "SELECT COUNT(*) FROM messages WHERE run_id = ? AND id = ?",
             (run_id, message_id),
         )
         if self.cursor.fetchone()[0] == 0:
             self.cursor.execute(
-                "INSERT INTO messages (run_id, conversation, id, role, content, tokens_query, tokens_response, duration) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (run_id, conversation, message_id, role, content, tokens_query, tokens_response, duration.total_seconds()),
+                "INSERT INTO messages (run_id, conversation, id, role, content, tokens_query, tokens_response, duration, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, conversation, message_id, role, content, tokens_query, tokens_response, duration.total_seconds(), finished_at),
             )
         else:
             if len(content) > 0:
                 self.cursor.execute(
-                    "UPDATE messages SET conversation = ?, role = ?, content = ?, tokens_query = ?, tokens_response = ?, duration = ? WHERE run_id = ? AND id = ?",
-                    (conversation, role, content, tokens_query, tokens_response, duration.total_seconds(), run_id, message_id),
+                    "UPDATE messages SET conversation = ?, role = ?, content = ?, tokens_query = ?, tokens_response = ?, duration = ?, finished_at = ? WHERE run_id = ? AND id = ?",
+                    (conversation, role, content, tokens_query, tokens_response, duration.total_seconds(), finished_at, run_id, message_id),
                 )
             else:
                 self.cursor.execute(
-                    "UPDATE messages SET conversation = ?, role = ?, tokens_query = ?, tokens_response = ?, duration = ? WHERE run_id = ? AND id = ?",
-                    (conversation, role, tokens_query, tokens_response, duration.total_seconds(), run_id, message_id),
+                    "UPDATE messages SET conversation = ?, role = ?, tokens_query = ?, tokens_response = ?, duration = ?, finished_at = ? WHERE run_id = ? AND id = ?",
+                    (conversation, role, tokens_query, tokens_response, duration.total_seconds(), finished_at, run_id, message_id),
                 )
 
-    def add_section(self, run_id: int, section_id: int, name: str, from_message: int, to_message: int, duration: datetime.timedelta):
+    @write_transaction
+    def add_section(self, run_id: int, section_id: int, name: str, from_message: int, to_message: int, duration: datetime.timedelta, finished_at: Optional[float] = None, conversation: Optional[str] = None):
         self.cursor.execute(
-            "INSERT OR REPLACE INTO sections (run_id, id, name, from_message, to_message, duration) VALUES (?, ?, ?, ?, ?, ?)",
-            (run_id, section_id, name, from_message, to_message, duration.total_seconds())
+            "INSERT OR REPLACE INTO sections (run_id, id, name, from_message, to_message, duration, finished_at, conversation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, section_id, name, from_message, to_message, duration.total_seconds(), finished_at or time.time(), conversation)
         )
 
-    def add_tool_call(self, run_id: int, message_id: int, tool_call_id: str, function_name: str, arguments: str, result_text: str, duration: datetime.timedelta):
+    @write_transaction
+    def add_tool_call(self, run_id: int, message_id: int, tool_call_id: str, function_name: str, arguments: str, result_text: str, duration: datetime.timedelta, finished_at: Optional[float] = None):
         self.cursor.execute(
-            "INSERT INTO tool_calls (run_id, message_id, id, function_name, arguments, result_text, duration) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (run_id, message_id, tool_call_id, function_name, arguments, result_text, duration.total_seconds()),
+            "INSERT INTO tool_calls (run_id, message_id, id, function_name, arguments, result_text, duration, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, message_id, tool_call_id, function_name, arguments, result_text, duration.total_seconds(), finished_at or time.time()),
         )
 
-    def handle_message_update(self, run_id: int, message_id: int, action: StreamAction, content: str):
+    @write_transaction
+    def handle_message_update(self, run_id: int, message_id: int, action: StreamAction, content: str) -> Optional[int]:
         if action != "append":
             raise ValueError("unsupported action" + action)
         self.cursor.execute(
             "UPDATE messages SET content = content || ?, version = version + 1 WHERE run_id = ? AND id = ?",
             (content, run_id, message_id),
         )
+        # the new version of the message, which allows readers to find out whether a stream part is already contained
+        # in a message they loaded
+        self.cursor.execute("SELECT version FROM messages WHERE run_id = ? AND id = ?", (run_id, message_id))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
 
+    @write_transaction
     def finalize_message(self, run_id: int, message_id: int, tokens_query: int, tokens_response: int, duration: datetime.timedelta, overwrite_finished_message: Optional[str] = None):
         if overwrite_finished_message:
             self.cursor.execute(
-                "UPDATE messages SET content = ?, tokens_query = ?, tokens_response = ?, duration = ? WHERE run_id = ? AND id = ?",
-                (overwrite_finished_message, tokens_query, tokens_response, duration.total_seconds(), run_id, message_id),
+                "UPDATE messages SET content = ?, tokens_query = ?, tokens_response = ?, duration = ?, finished_at = ? WHERE run_id = ? AND id = ?",
+                (overwrite_finished_message, tokens_query, tokens_response, duration.total_seconds(), time.time(), run_id, message_id),
             )
         else:
             self.cursor.execute(
-                "UPDATE messages SET tokens_query = ?, tokens_response = ?, duration = ? WHERE run_id = ? AND id = ?",
-                (tokens_query, tokens_response, duration.total_seconds(), run_id, message_id),
+                "UPDATE messages SET tokens_query = ?, tokens_response = ?, duration = ?, finished_at = ? WHERE run_id = ? AND id = ?",
+                (tokens_query, tokens_response, duration.total_seconds(), time.time(), run_id, message_id),
             )
 
+    @write_transaction
     def update_run(self, run_id: int, model: str, state: str, tag: str, started_at: datetime.datetime, stopped_at: datetime.datetime, configuration: str):
         self.cursor.execute(
             "UPDATE runs SET model = ?, state = ?, tag = ?, started_at = ?, stopped_at = ?, configuration = ? WHERE id = ?",
             (model, state, tag, started_at, stopped_at, configuration, run_id),
         )
 
+    @write_transaction
+    def save_checkpoint(self, run_id: int, turn: int, state: str):
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO checkpoints (run_id, turn, state, saved_at) VALUES (?, ?, ?, ?)",
+            (run_id, turn, state, time.time()),
+        )
+
+    @write_transaction
+    def run_was_resumed(self, run_id: int):
+        self.cursor.execute("update runs set state=?, stopped_at=NULL where id = ?", ("in progress", run_id))
+
+    @write_transaction
     def run_was_success(self, run_id):
         self.cursor.execute(
             "update runs set state=?,stopped_at=datetime('now') where id = ?",
             ("got root", run_id),
         )
-        self.db.commit()
 
+    @write_transaction
     def run_was_failure(self, run_id: int, reason: str):
         self.cursor.execute(
             "update runs set state=?, stopped_at=datetime('now') where id = ?",
             (reason, run_id),
         )
-        self.db.commit()
 
 
 DbStorage = Global(RawDbStorage)
@@ -0,0 +1,171 @@
+"""
+Stand-ins for the LLM and the SSH connection, which run the agents without any network access. They are used by the
+tests and by the Benchmark use case, which measures the overhead of the agent loop itself.
+"""
+
+import itertools
+import re
+import threading
+from typing import Optional, Tuple
+
+from hackingBuddyGPT.utils.llm_util import LLM, LLMResult
+
+# the command that gets a root shell on the fake target
+ROOT_COMMAND = "/usr/bin/python3.11 -c 'import os; os.setuid(0); os.system(\"/bin/sh\")'"
+
+
+class FakeSSHConnection:
+    username: str = "lowpriv"
+    password: str = "toomanysecrets"
+    hostname: str = "theoneandonly"
+
+    results = {
+        "id": "uid=1001(lowpriv) gid=1001(lowpriv) groups=1001(lowpriv)",
+        "sudo -l": "Sorry, user lowpriv may not run sudo on test-1.",
+        "find / -perm -4000 2>/dev/null": """
+/usr/bin/newgrp
+/usr/bin/gpasswd
+/usr/bin/su
+│ /usr/bin/find
+│ /usr/bin/chfn
+│ /usr/bin/passwd
+│ /usr/bin/python3.11
+│ /usr/bin/chsh
+│ /usr/bin/umount
+│ /usr/bin/sudo
+│ /usr/bin/mount
+│ /usr/lib/dbus-1.0/dbus-daemon-launch-helper
+│ /usr/lib/openssh/ssh-keysign
+""",
+        ROOT_COMMAND: "# ",
+    }
+
+    def run(self, cmd, *args, **kwargs) -> Tuple[str, str, int]:
+        out_stream = kwargs.get("out_stream", None)
+
+        if cmd in self.results:
+            out_stream.write(self.results[cmd])
+            return self.results[cmd], "", 0
+        else:
+            return "", "Command not found", 1
+
+
+class FakeLLM(LLM):
+    model: str = "fake_model"
+    context_size: int = 4096
+
+    counter: int = 0
+    responses = [
+        "id",
+        "sudo -l",
+        "find / -perm -4000 2>/dev/null",
+        ROOT_COMMAND,
+    ]
+
+    def get_response(self, prompt, *, capabilities=None, **kwargs) -> LLMResult:
+        response = self.responses[self.counter]
+        self.counter += 1
+
+        return LLMResult(result=response, prompt="this would be the prompt", answer=response)
+
+    def encode(self, query) -> list[int]:
+        return [0]
+
+
+class SessionFakeSSHConnection(FakeSSHConnection):
+    """
+    A fake target on which every `new_with` opens a new session (collected in `sessions`), like the agents that explore
+    in parallel do. `sleep` blocks until the session is closed, or for at most `sleep_timeout` seconds.
+    """
+
+    def __init__(self, sessions: Optional[list] = None, sleep_timeout: float = 5):
+        self.sessions = sessions if sessions is not None else []
+        self.sleep_timeout = sleep_timeout
+        self.closed = threading.Event()
+
+    def new_with(self, **kwargs) -> "SessionFakeSSHConnection":
+        session = SessionFakeSSHConnection(self.sessions, self.sleep_timeout)
+        self.sessions.append(session)
+        return session
+
+    def init(self):
+        pass
+
+    def close(self):
+        self.closed.set()
+
+    def run(self, cmd, *args, **kwargs) -> Tuple[str, str, int]:
+        if cmd == "sleep":
+            if self.closed.wait(self.sleep_timeout):
+                raise OSError("connection closed")
+            return "", "", 0
+        return super().run(cmd, *args, **kwargs)
+
+
+class HintedFakeLLM(FakeLLM):
+    """
+    Answers with the commands that are listed for the hint of the prompt one after another (and `id` afterwards). It
+    can be shared by agents that run in parallel.
+    """
+
+    def __init__(self, commands_by_hint: dict[str, list[str]]):
+        self.commands_by_hint = {hint: list(commands) for hint, commands in commands_by_hint.items()}
+        self.lock = threading.Lock()
+
+    def get_response(self, prompt, *, capabilities=None, **kwargs) -> LLMResult:
+        with self.lock:
+            commands = self.commands_by_hint[kwargs["hint"]]
+            response = commands.pop(0) if commands else "id"
+            self.counter += 1
+        return LLMResult(result=response, prompt="this would be the prompt", answer=response)
+
+
+# commands that never get root, which the enumeration of a long run cycles through
+ENUMERATION_COMMANDS = [
+    "id",
+    "sudo -l",
+    "find / -perm -4000 2>/dev/null",
+    "cat /etc/passwd",
+    "ls -la /home",
+    "ps aux",
+    "uname -a",
+    "cat /etc/crontab",
+]
+
+
+class EndlessFakeLLM(FakeLLM):
+    """
+    Proposes the enumeration commands over and over, after rendering the prompt like a real LLM connection does, and
+    counts tokens roughly like a real tokenizer (words and punctuation), so that their cost is part of a benchmark.
+    """
+
+    def __init__(self, context_size: int = 4096):
+        self.context_size = context_size
+        self._commands = itertools.cycle(ENUMERATION_COMMANDS)
+
+    def get_response(self, prompt, **kwargs) -> LLMResult:
+        # the templates of the agents take the capabilities as parameter as well
+        if hasattr(prompt, "render"):
+            prompt = prompt.render(**kwargs)
+        response = next(self._commands)
+        self.counter += 1
+        return LLMResult(result=response, prompt=prompt, answer=response, tokens_query=self.count_tokens(prompt), tokens_response=self.count_tokens(response))
+
+    def encode(self, query) -> list[int]:
+        return [0] * len(re.findall(r"\w+|[^\w\s]", query))
+
+
+class GeneratedOutputSSHConnection(FakeSSHConnection):
+    """
+    Answers every command with output_size characters of generated output, which never looks like a root shell.
+    """
+
+    def __init__(self, output_size: int = 2000):
+        line = "-rw-r--r-- 1 lowpriv lowpriv 4096 Jan  1 00:00 somefile\n"
+        self.output = (line * (output_size // len(line) + 1))[:output_size]
+
+    def run(self, cmd, *args, **kwargs) -> Tuple[str, str, int]:
+        out_stream = kwargs.get("out_stream", None)
+        if out_stream is not None:
+            out_stream.write(self.output)
+        return self.output, "", 0
@@ -2,15 +2,17 @@ import abc
 import datetime
 import re
 import typing
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
-from openai.types.chat import (
-    ChatCompletionAssistantMessageParam,
-    ChatCompletionFunctionMessageParam,
-    ChatCompletionSystemMessageParam,
-    ChatCompletionToolMessageParam,
-    ChatCompletionUserMessageParam,
-)
+if typing.TYPE_CHECKING:  # openai is slow to import and only needed for the annotations here
+    from openai.types.chat import (
+        ChatCompletionAssistantMessageParam,
+        ChatCompletionFunctionMessageParam,
+        ChatCompletionSystemMessageParam,
+        ChatCompletionToolMessageParam,
+        ChatCompletionUserMessageParam,
+    )
 
 SAFETY_MARGIN = 128
 STEP_CUT_TOKENS = 128
@@ -36,6 +38,16 @@ class LLM(abc.ABC):
         """
         pass
 
+    def get_responses(self, prompt, n: int, **kwargs) -> list[LLMResult]:
+        """
+        Returns n completions of the prompt. By default they are requested in parallel, LLMs whose API can return
+        several completions for a single request override this.
+        """
+        if n <= 1:
+            return [self.get_response(prompt, **kwargs)]
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            return list(executor.map(lambda _: self.get_response(prompt, **kwargs), range(n)))
+
     @abc.abstractmethod
     def encode(self, query) -> list[int]:
         pass
@@ -44,23 +56,23 @@ class LLM(abc.ABC):
         return len(self.encode(query))
 
 
-def system_message(content: str) -> ChatCompletionSystemMessageParam:
+def system_message(content: str) -> "ChatCompletionSystemMessageParam":
     return {"role": "system", "content": content}
 
 
-def user_message(content: str) -> ChatCompletionUserMessageParam:
+def user_message(content: str) -> "ChatCompletionUserMessageParam":
     return {"role": "user", "content": content}
 
 
-def assistant_message(content: str) -> ChatCompletionAssistantMessageParam:
+def assistant_message(content: str) -> "ChatCompletionAssistantMessageParam":
     return {"role": "assistant", "content": content}
 
 
-def tool_message(content: str, tool_call_id: str) -> ChatCompletionToolMessageParam:
+def tool_message(content: str, tool_call_id: str) -> "ChatCompletionToolMessageParam":
     return {"role": "tool", "content": content, "tool_call_id": tool_call_id}
 
 
-def function_message(content: str, name: str) -> ChatCompletionFunctionMessageParam:
+def function_message(content: str, name: str) -> "ChatCompletionFunctionMessageParam":
     return {"role": "function", "content": content, "name": name}
 
 
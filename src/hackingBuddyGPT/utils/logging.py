@@ -1,4 +1,5 @@
 import datetime
+import json
 from enum import Enum
 import time
 from dataclasses import dataclass, field
@@ -11,11 +12,14 @@ from dataclasses_json.api import dataclass_json
 from hackingBuddyGPT.utils import Console, DbStorage, LLMResult, configurable, parameter
 from hackingBuddyGPT.utils.db_storage.db_storage import StreamAction
 from hackingBuddyGPT.utils.configurable import Global, Transparent
-from rich.console import Group
-from rich.panel import Panel
 from websockets.sync.client import ClientConnection, connect as ws_connect
 
 from hackingBuddyGPT.utils.db_storage.db_storage import Run, Section, Message, MessageStreamPart, ToolCall, ToolCallStreamPart
+from hackingBuddyGPT.utils.trace_export import TraceWriter
+
+# runs in these states were interrupted, all others are finished (or, if they are still in progress, either running in
+# another process or interrupted by killing their process, which is only assumed once they were inactive for a while)
+RESUMABLE_STATES = ("exception occurred",)
 
 
 def log_section(name: str, logger_field_name: str = "log"):
@@ -77,6 +81,18 @@ class ControlMessage:
         return cls(type=type_, data=data_instance)
 
 
+def start_trace(trace_file: str, run: Run) -> Optional[TraceWriter]:
+    if not trace_file:
+        return None
+    return TraceWriter(trace_file.format(run_id=run.id), run.id, f"run {run.id} ({run.model})")
+
+
+def trace_llm_call(trace: Optional[TraceWriter], message_id: int, conversation: Optional[str], finished_at: float, duration: datetime.timedelta, tokens_query: int, tokens_response: int):
+    # only messages that took time are LLM calls, status and system messages are logged without a duration
+    if trace is not None and duration.total_seconds() > 0:
+        trace.llm_call(message_id, conversation, finished_at, duration.total_seconds(), tokens_query, tokens_response)
+
+
 @configurable("local_logger", "Local Logger")
 @dataclass
 class LocalLogger:
@@ -84,12 +100,15 @@ class LocalLogger:
     console: Console
 
     tag: str = parameter(desc="Tag for your current run", default="")
+    trace_file: str = parameter(desc="if set, a chrome trace of the run is written to this file while it runs ({run_id} is replaced by the id of the run)", default="")
 
     run: Run = field(init=False, default=None)  # field and not a parameter, since this can not be user configured
+    resumed: bool = field(init=False, default=False)  # whether the run was continued from a checkpoint
 
     _last_message_id: int = 0
     _last_section_id: int = 0
     _current_conversation: Optional[str] = None
+    _trace: Optional[TraceWriter] = None
 
     def start_run(self, name: str, configuration: str):
         if self.run is not None:
@@ -97,20 +116,58 @@ class LocalLogger:
         start_time = datetime.datetime.now()
         run_id = self.log_db.create_run(name, self.tag, start_time , configuration)
         self.run = Run(run_id, name, "", self.tag, start_time, None, configuration)
+        self._trace = start_trace(self.trace_file, self.run)
+
+    def resume_run(self, run_id: int, name: str, stale_after: float) -> Optional[tuple[int, str]]:
+        """
+        Continues logging into an existing run of the use case `name` that was interrupted (by an exception or by
+        killing the process), after the messages and sections that it already has, and returns its last checkpoint as
+        (turn, state), if one was saved. A run that is still in progress is only taken over once nothing was written
+        to it for `stale_after` seconds, as it might otherwise still be running in another process.
+        """
+        if self.run is not None:
+            raise ValueError("Run already started")
+        run = self.log_db.get_run(run_id)
+        if run is None:
+            raise ValueError(f"Run {run_id} does not exist")
+        if run.model != name:
+            raise ValueError(f"Run {run_id} is a run of {run.model} and not of {name}")
+        if run.state == "in progress":
+            last_activity = self.log_db.get_last_activity(run_id)
+            if last_activity is None:
+                last_activity = run.started_at.timestamp()
+            inactive = time.time() - last_activity
+            if inactive < stale_after:
+                raise ValueError(f"Run {run_id} is still in progress (last activity {inactive:.0f}s ago), it can only be resumed after {stale_after}s without activity")
+        elif run.state not in RESUMABLE_STATES:
+            raise ValueError(f"Run {run_id} is already finished ({run.state}), only interrupted runs can be resumed")
+        self.run = run
+        self.resumed = True
+        self._last_message_id, self._last_section_id = self.log_db.get_next_ids(run_id)
+        self.log_db.run_was_resumed(run_id)
+        self._trace = start_trace(self.trace_file, self.run)
+        return self.log_db.get_checkpoint(run_id)
+
+    def save_checkpoint(self, turn: int, state: str):
+        self.log_db.save_checkpoint(self.run.id, turn, state)
 
     def section(self, name: str) -> "LogSectionContext":
         return LogSectionContext(self, name, self._last_message_id)
 
-    def log_section(self, name: str, from_message: int, to_message: int, duration: datetime.timedelta):
+    def log_section(self, name: str, from_message: int, to_message: int, duration: datetime.timedelta, conversation: Optional[str] = None):
         section_id = self._last_section_id
         self._last_section_id += 1
 
-        self.log_db.add_section(self.run.id, section_id, name, from_message, to_message, duration)
+        self.log_db.add_section(self.run.id, section_id, name, from_message, to_message, duration, conversation=conversation)
+        if self._trace is not None:
+            self._trace.begin_section(name, time.time())
 
         return section_id
 
-    def finalize_section(self, section_id: int, name: str, from_message: int, duration: datetime.timedelta):
-        self.log_db.add_section(self.run.id, section_id, name, from_message, self._last_message_id, duration)
+    def finalize_section(self, section_id: int, name: str, from_message: int, duration: datetime.timedelta, conversation: Optional[str] = None):
+        self.log_db.add_section(self.run.id, section_id, name, from_message, self._last_message_id, duration, conversation=conversation)
+        if self._trace is not None:
+            self._trace.end_section(name, time.time())
 
     def conversation(self, conversation: str, start_section: bool = False) -> "LogConversationContext":
         return LogConversationContext(self, start_section, conversation, self._current_conversation)
@@ -120,30 +177,33 @@ class LocalLogger:
         self._last_message_id += 1
 
         self.log_db.add_message(self.run.id, message_id, self._current_conversation, role, content, tokens_query, tokens_response, duration)
-        self.console.print(Panel(content, title=(("" if self._current_conversation is None else f"{self._current_conversation} - ") + role)))
+        trace_llm_call(self._trace, message_id, self._current_conversation, time.time(), duration, tokens_query, tokens_response)
+        self.console.print_message(("" if self._current_conversation is None else f"{self._current_conversation} - ") + role, content)
 
         return message_id
 
     def _add_or_update_message(self, message_id: int, conversation: Optional[str], role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta):
         self.log_db.add_or_update_message(self.run.id, message_id, conversation, role, content, tokens_query, tokens_response, duration)
+        trace_llm_call(self._trace, message_id, conversation, time.time(), duration, tokens_query, tokens_response)
 
     def add_tool_call(self, message_id: int, tool_call_id: str, function_name: str, arguments: str, result_text: str, duration: datetime.timedelta):
-        self.console.print(Panel(
-            Group(
-                Panel(arguments, title="arguments"),
-                Panel(result_text, title="result"),
-            ),
-            title=f"Tool Call: {function_name}"))
+        self.console.print_tool_call(function_name, arguments, result_text)
         self.log_db.add_tool_call(self.run.id, message_id, tool_call_id, function_name, arguments, result_text, duration)
+        if self._trace is not None:
+            self._trace.tool_call(message_id, function_name, arguments, time.time(), duration.total_seconds(), len(result_text or ""))
 
     def run_was_success(self):
         self.status_message("Run finished successfully")
         self.log_db.run_was_success(self.run.id)
+        if self._trace is not None:
+            self._trace.close(time.time(), "got root")
 
     def run_was_failure(self, reason: str, details: Optional[str] = None):
         full_reason = reason + ("" if details is None else f": {details}")
         self.status_message(f"Run failed: {full_reason}")
         self.log_db.run_was_failure(self.run.id, reason)
+        if self._trace is not None:
+            self._trace.close(time.time(), reason)
 
     def status_message(self, message: str):
         self.add_message("status", message, 0, 0, datetime.timedelta(0))
@@ -172,13 +232,16 @@ class RemoteLogger:
     log_server_address: str = parameter(desc="address:port of the log server to be used", default="localhost:4444")
 
     tag: str = parameter(desc="Tag for your current run", default="")
+    trace_file: str = parameter(desc="if set, a chrome trace of the run is written to this file while it runs ({run_id} is replaced by the id of the run)", default="")
 
     run: Run = field(init=False, default=None)  # field and not a parameter, since this can not be user configured
+    resumed: bool = field(init=False, default=False)  # whether the run was continued from a checkpoint
 
     _last_message_id: int = 0
     _last_section_id: int = 0
     _current_conversation: Optional[str] = None
     _upstream_websocket: ClientConnection = None
+    _trace: Optional[TraceWriter] = None
 
     def __del__(self):
         if self._upstream_websocket:
@@ -190,6 +253,12 @@ class RemoteLogger:
     def send(self, type: MessageType, data: MessageData):
         self._upstream_websocket.send(ControlMessage(type, data).to_json())
 
+    def send_batch(self, messages: list[dict]):
+        """
+        Sends multiple already serialized control messages (dicts with type and data) in a single websocket frame.
+        """
+        self._upstream_websocket.send(json.dumps(messages))
+
     def start_run(self, name: str, configuration: str, tag: Optional[str] = None, start_time: Optional[datetime.datetime] = None, end_time: Optional[datetime.datetime] = None):
         if self._upstream_websocket is None:
             self.init_websocket()
@@ -206,21 +275,33 @@ class RemoteLogger:
         self.run = Run(None, name, None, tag, start_time, None, configuration)
         self.send(MessageType.RUN, self.run)
         self.run = Run.from_json(self._upstream_websocket.recv())
+        self._trace = start_trace(self.trace_file, self.run)
+
+    def resume_run(self, run_id: int, name: str, stale_after: float) -> Optional[tuple[int, str]]:
+        raise ValueError("Resuming a run is only supported with the local_logger")
+
+    def save_checkpoint(self, turn: int, state: str):
+        pass  # the log server does not keep checkpoints, so runs that are logged remotely can not be resumed
 
     def section(self, name: str) -> "LogSectionContext":
         return LogSectionContext(self, name, self._last_message_id)
 
-    def log_section(self, name: str, from_message: int, to_message: int, duration: datetime.timedelta):
+    def log_section(self, name: str, from_message: int, to_message: int, duration: datetime.timedelta, conversation: Optional[str] = None):
         section_id = self._last_section_id
         self._last_section_id += 1
 
-        section = Section(self.run.id, section_id, name, from_message, to_message, duration)
+        section = Section(self.run.id, section_id, name, from_message, to_message, duration, time.time(), conversation)
         self.send(MessageType.SECTION, section)
+        if self._trace is not None:
+            self._trace.begin_section(name, section.finished_at)
 
         return section_id
 
-    def finalize_section(self, section_id: int, name: str, from_message: int, duration: datetime.timedelta):
-        self.send(MessageType.SECTION, Section(self.run.id, section_id, name, from_message, self._last_message_id, duration))
+    def finalize_section(self, section_id: int, name: str, from_message: int, duration: datetime.timedelta, conversation: Optional[str] = None):
+        section = Section(self.run.id, section_id, name, from_message, self._last_message_id, duration, time.time(), conversation)
+        self.send(MessageType.SECTION, section)
+        if self._trace is not None:
+            self._trace.end_section(name, section.finished_at)
 
     def conversation(self, conversation: str, start_section: bool = False) -> "LogConversationContext":
         return LogConversationContext(self, start_section, conversation, self._current_conversation)
@@ -229,25 +310,24 @@ class RemoteLogger:
         message_id = self._last_message_id
         self._last_message_id += 1
 
-        msg = Message(self.run.id, message_id, version=1, conversation=self._current_conversation, role=role, content=content, duration=duration, tokens_query=tokens_query, tokens_response=tokens_response)
+        msg = Message(self.run.id, message_id, version=1, conversation=self._current_conversation, role=role, content=content, duration=duration, tokens_query=tokens_query, tokens_response=tokens_response, finished_at=time.time())
         self.send(MessageType.MESSAGE, msg)
-        self.console.print(Panel(content, title=(("" if self._current_conversation is None else f"{self._current_conversation} - ") + role)))
+        trace_llm_call(self._trace, message_id, self._current_conversation, msg.finished_at, duration, tokens_query, tokens_response)
+        self.console.print_message(("" if self._current_conversation is None else f"{self._current_conversation} - ") + role, content)
 
         return message_id
 
     def _add_or_update_message(self, message_id: int, conversation: Optional[str], role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta):
-        msg = Message(self.run.id, message_id, version=0, conversation=conversation, role=role, content=content, duration=duration, tokens_query=tokens_query, tokens_response=tokens_response)
+        msg = Message(self.run.id, message_id, version=0, conversation=conversation, role=role, content=content, duration=duration, tokens_query=tokens_query, tokens_response=tokens_response, finished_at=time.time())
         self.send(MessageType.MESSAGE, msg)
+        trace_llm_call(self._trace, message_id, conversation, msg.finished_at, duration, tokens_query, tokens_response)
 
     def add_tool_call(self, message_id: int, tool_call_id: str, function_name: str, arguments: str, result_text: str, duration: datetime.timedelta):
-        self.console.print(Panel(
-            Group(
-                Panel(arguments, title="arguments"),
-                Panel(result_text, title="result"),
-            ),
-            title=f"Tool Call: {function_name}"))
-        tc = ToolCall(self.run.id, message_id, tool_call_id, 0, function_name, arguments, "success", result_text, duration)
+        self.console.print_tool_call(function_name, arguments, result_text)
+        tc = ToolCall(self.run.id, message_id, tool_call_id, 0, function_name, arguments, "success", result_text, duration, time.time())
         self.send(MessageType.TOOL_CALL, tc)
+        if self._trace is not None:
+            self._trace.tool_call(message_id, function_name, arguments, tc.finished_at, duration.total_seconds(), len(result_text or ""))
 
     def run_was_success(self):
         self.status_message("Run finished successfully")
@@ -255,6 +335,8 @@ class RemoteLogger:
         self.run.state = "success"
         self.send(MessageType.RUN, self.run)
         self.run = Run.from_json(self._upstream_websocket.recv())
+        if self._trace is not None:
+            self._trace.close(time.time(), self.run.state)
 
     def run_was_failure(self, reason: str, details: Optional[str] = None):
         full_reason = reason + ("" if details is None else f": {details}")
@@ -263,6 +345,8 @@ class RemoteLogger:
         self.run.state = reason
         self.send(MessageType.RUN, self.run)
         self.run = Run.from_json(self._upstream_websocket.recv())
+        if self._trace is not None:
+            self._trace.close(time.time(), self.run.state)
 
     def status_message(self, message: str):
         self.add_message("status", message, 0, 0, datetime.timedelta(0))
@@ -285,6 +369,94 @@ class RemoteLogger:
         self.send(MessageType.MESSAGE_STREAM_PART, part)
 
 
+@dataclass
+class LoggerBranch:
+    """
+    A logger for a branch of a run that is executed in its own thread, in parallel to other branches (eg. the sub-agents
+    of ExPrivEscLinuxLSE that explore several hints at the same time). Everything is logged to the run of the wrapped
+    logger, with the messages of the branch in their own conversation. The loggers are not thread-safe, so the accesses
+    of all branches of a logger are serialized through the lock that they share.
+    """
+
+    logger: Union[LocalLogger, RemoteLogger]
+    name: str
+    lock: threading.Lock
+
+    _current_conversation: Optional[str] = None
+
+    @property
+    def console(self) -> Console:
+        return self.logger.console
+
+    @property
+    def run(self) -> Run:
+        return self.logger.run
+
+    @property
+    def resumed(self) -> bool:
+        return self.logger.resumed
+
+    @property
+    def _last_message_id(self) -> int:
+        with self.lock:
+            return self.logger._last_message_id
+
+    @property
+    def _conversation(self) -> str:
+        return self.name if self._current_conversation is None else f"{self.name} - {self._current_conversation}"
+
+    def _call(self, method: str, *args, **kwargs):
+        with self.lock:
+            previous_conversation = self.logger._current_conversation
+            self.logger._current_conversation = self._conversation
+            try:
+                return getattr(self.logger, method)(*args, **kwargs)
+            finally:
+                self.logger._current_conversation = previous_conversation
+
+    def section(self, name: str) -> "LogSectionContext":
+        return LogSectionContext(self, name, self._last_message_id)
+
+    # the message range of a section of the branch also contains the messages of the other branches, so its sections
+    # are limited to the conversations of the branch
+    def log_section(self, name: str, from_message: int, to_message: int, duration: datetime.timedelta):
+        return self._call("log_section", name, from_message, to_message, duration, self.name)
+
+    def finalize_section(self, section_id: int, name: str, from_message: int, duration: datetime.timedelta):
+        return self._call("finalize_section", section_id, name, from_message, duration, self.name)
+
+    def conversation(self, conversation: str, start_section: bool = False) -> "LogConversationContext":
+        return LogConversationContext(self, start_section, conversation, self._current_conversation)
+
+    def add_message(self, role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta) -> int:
+        return self._call("add_message", role, content, tokens_query, tokens_response, duration)
+
+    def _add_or_update_message(self, message_id: int, conversation: Optional[str], role: str, content: str, tokens_query: int, tokens_response: int, duration: datetime.timedelta):
+        return self._call("_add_or_update_message", message_id, conversation, role, content, tokens_query, tokens_response, duration)
+
+    def add_tool_call(self, message_id: int, tool_call_id: str, function_name: str, arguments: str, result_text: str, duration: datetime.timedelta):
+        return self._call("add_tool_call", message_id, tool_call_id, function_name, arguments, result_text, duration)
+
+    def status_message(self, message: str):
+        self.add_message("status", message, 0, 0, datetime.timedelta(0))
+
+    def system_message(self, message: str):
+        self.add_message("system", message, 0, 0, datetime.timedelta(0))
+
+    def call_response(self, llm_result: LLMResult) -> int:
+        return self._call("call_response", llm_result)
+
+    def stream_message(self, role: str):
+        with self.lock:
+            message_id = self.logger._last_message_id
+            self.logger._last_message_id += 1
+
+        return MessageStreamLogger(self, message_id, self._conversation, role)
+
+    def add_message_update(self, message_id: int, action: StreamAction, content: str):
+        return self._call("add_message_update", message_id, action, content)
+
+
 GlobalLocalLogger = Global(LocalLogger)
 GlobalRemoteLogger = Global(RemoteLogger)
 Logger = Union[GlobalRemoteLogger, GlobalLocalLogger]
@@ -0,0 +1,68 @@
+"""
+Detection of commands that an agent already executed shortly before, as models often propose the same command again
+after a few rounds, which costs an LLM call, the execution and history tokens for an output that is already known.
+"""
+
+import json
+import shlex
+from collections import OrderedDict
+from typing import Optional
+
+
+def fingerprint(command: str) -> str:
+    """
+    Normalizes a command, so that commands that only differ in whitespace, quoting or a trailing ';' are the same. The
+    words are quoted again where needed, so that eg. `grep "a b" f` and `grep a b f` stay different.
+    """
+    command = command.strip().rstrip(";").strip()
+    try:
+        return shlex.join(shlex.split(command))
+    except ValueError:  # eg. unbalanced quotes
+        return " ".join(command.split())
+
+
+def tool_call_fingerprint(function_name: str, arguments: str) -> str:
+    try:
+        arguments = json.dumps(json.loads(arguments), sort_keys=True)
+    except ValueError:
+        arguments = arguments.strip()
+    return f"{function_name} {arguments}"
+
+
+class LoopDetector:
+    """
+    Remembers the results of the last `window` distinct commands (by their fingerprint, see `fingerprint` and
+    `tool_call_fingerprint`), and how many of the commands in a row were repeats of one of them.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.repeats = 0
+        self._recent: OrderedDict[str, str] = OrderedDict()
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        Returns the result of the command if it was executed within the window, which counts as a repeat.
+        """
+        result = self._recent.get(key)
+        if result is not None:
+            self.repeats += 1
+        return result
+
+    def __contains__(self, key: str) -> bool:
+        # unlike `lookup`, checking whether a command was executed within the window does not count as a repeat
+        return key in self._recent
+
+    def record(self, key: str, result: str):
+        self._recent[key] = result
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.window:
+            self._recent.popitem(last=False)
+        self.repeats = 0
+
+    def checkpoint(self) -> dict:
+        return {"recent": list(self._recent.items()), "repeats": self.repeats}
+
+    def restore(self, checkpoint: dict):
+        self._recent = OrderedDict((key, result) for key, result in checkpoint["recent"])
+        self.repeats = checkpoint["repeats"]
@@ -0,0 +1,245 @@
+"""
+A minimal metrics registry, which is rendered in the Prometheus text exposition format.
+
+All metrics of hackingBuddyGPT are defined at the bottom of this module, so that it is easy to see what is available.
+The Viewer serves them at `/metrics`, standalone agents can serve them with `start_metrics_server` (see the
+`metrics_address` parameter of the AutonomousUseCase).
+"""
+
+import abc
+import bisect
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+DB_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(abc.ABC):
+    type_name = ""
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.label_names)
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {self.label_names}, got {values}")
+
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self) -> "_Metric":
+        pass
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterable[tuple[str, str, float]]:
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.description)}", f"# TYPE {self.name} {self.type_name}"]
+        children = [((), self)] if not self.label_names else sorted(self._children.items())
+        for values, child in children:
+            for suffix, extra_label, value in child._samples():
+                lines.append(f"{self.name}{suffix}{_format_labels(self.label_names, values, extra_label)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        super().__init__(name, description, labels)
+        self._value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.description)
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self):
+        yield "", "", self._value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        super().__init__(name, description, labels)
+        self._value = 0.0
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.description)
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self):
+        yield "", "", self._value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self._sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.description, buckets=self.buckets)
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def _samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self._counts, strict=True):
+            cumulative += count
+            yield "_bucket", f'le="{_format_value(bound)}"', cumulative
+        yield "_sum", "", self._sum
+        yield "_count", "", cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in list(self._metrics.values())) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes should not clutter the console of the agent
+
+
+def start_metrics_server(address: str) -> Optional[ThreadingHTTPServer]:
+    """
+    Serves the metrics at http://<address>/metrics from a background thread, address is given as `host:port`.
+    """
+    if not address:
+        return None
+    host, port = address.rsplit(":", 1)
+    server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+# LLM connections
+llm_request_duration = REGISTRY.histogram("hackingbuddy_llm_request_duration_seconds", "Duration of successful LLM requests", ["model"])
+llm_tokens = REGISTRY.counter("hackingbuddy_llm_tokens_total", "Tokens sent to (query) and received from (response) the LLM", ["model", "direction"])
+llm_retries = REGISTRY.counter("hackingbuddy_llm_retries_total", "LLM requests that were retried", ["model", "reason"])
+llm_rate_limited = REGISTRY.counter("hackingbuddy_llm_rate_limited_total", "LLM requests that were answered with 429 (rate limit)", ["model"])
+
+# capabilities
+capability_duration = REGISTRY.histogram("hackingbuddy_capability_duration_seconds", "Duration of capability executions", ["capability"])
+capability_output_bytes = REGISTRY.counter("hackingbuddy_capability_output_bytes_total", "Size of the output of capability executions", ["capability"])
+
+# log database
+db_write_duration = REGISTRY.histogram("hackingbuddy_db_write_duration_seconds", "Duration of writes to the log database", ["method"], buckets=DB_LATENCY_BUCKETS)
+db_write_queue_depth = REGISTRY.gauge("hackingbuddy_db_write_queue_depth", "Writes waiting for the database writer thread")
+
+# viewer
+viewer_clients = REGISTRY.gauge("hackingbuddy_viewer_clients", "Connected viewer clients")
+viewer_ingested_messages = REGISTRY.counter("hackingbuddy_viewer_ingested_messages_total", "Messages received by the viewer ingress", ["type"])
+viewer_fanout_lag = REGISTRY.histogram("hackingbuddy_viewer_fanout_lag_seconds", "Time messages wait in client queues before they are sent", buckets=DB_LATENCY_BUCKETS + (2.5, 5.0, 10.0))
+
+
+def record_llm_request(model: str, duration: float, tokens_query: int, tokens_response: int):
+    llm_request_duration.labels(model).observe(duration)
+    llm_tokens.labels(model, "query").inc(tokens_query or 0)
+    llm_tokens.labels(model, "response").inc(tokens_response or 0)
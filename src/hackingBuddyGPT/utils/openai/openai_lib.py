@@ -1,4 +1,5 @@
 import datetime
+import json
 from dataclasses import dataclass
 from typing import Dict, Iterable, Optional, Union
 
@@ -15,12 +16,13 @@ from openai.types.chat import (
 )
 from openai.types.chat.chat_completion_chunk import ChoiceDelta
 from openai.types.chat.chat_completion_message_tool_call import Function
-from rich.console import Console
 
 from hackingBuddyGPT.capabilities import Capability
 from hackingBuddyGPT.capabilities.capability import capabilities_to_tools
-from hackingBuddyGPT.utils import LLM, LLMResult, configurable
+from hackingBuddyGPT.utils import LLM, Console, LLMResult, configurable, metrics, rate_limiter
 from hackingBuddyGPT.utils.configurable import parameter
+from hackingBuddyGPT.utils.context_window import ContextWindow
+from hackingBuddyGPT.utils.llm_util import SAFETY_MARGIN
 
 
 @configurable("openai-lib", "OpenAI Library based connection")
@@ -51,6 +53,22 @@ class OpenAILib(LLM):
     def instructor(self) -> instructor.Instructor:
         return instructor.from_openai(self.client)
 
+    def _create_completion(self, **kwargs):
+        rate_limiter.before_llm_request()
+        # the client retries on its own, so only the requests that failed even after retrying are visible here
+        try:
+            return self._client.chat.completions.create(**kwargs)
+        except openai.RateLimitError:
+            metrics.llm_rate_limited.labels(self.model).inc()
+            raise
+
+    def _fit_prompt(self, prompt, tools) -> list:
+        # a ContextWindow is cut down to its newest messages that fit into the context together with the tools
+        if not isinstance(prompt, ContextWindow):
+            return prompt
+        tools_size = self.count_tokens(json.dumps(tools)) if tools else 0
+        return prompt.window(self.context_size - SAFETY_MARGIN - tools_size)
+
     def get_response(self, prompt, *, capabilities: Optional[Dict[str, Capability] ] = None, **kwargs) -> LLMResult:
         """  # TODO: re-enable compatibility layer
         if isinstance(prompt, str) or hasattr(prompt, "render"):
@@ -68,13 +86,12 @@ class OpenAILib(LLM):
         if capabilities:
             tools = capabilities_to_tools(capabilities)
 
+        prompt = self._fit_prompt(prompt, tools)
         tic = datetime.datetime.now()
-        response = self._client.chat.completions.create(
-            model=self.model,
-            messages=prompt,
-            tools=tools,
-        )
+        response = self._create_completion(model=self.model, messages=prompt, tools=tools)
         duration = datetime.datetime.now() - tic
+        metrics.record_llm_request(self.model, duration.total_seconds(), response.usage.prompt_tokens, response.usage.completion_tokens)
+        rate_limiter.after_llm_request(response.usage.prompt_tokens, response.usage.completion_tokens)
         message = response.choices[0].message
 
         return LLMResult(
@@ -99,8 +116,9 @@ class OpenAILib(LLM):
         if capabilities:
             tools = capabilities_to_tools(capabilities)
 
+        prompt = self._fit_prompt(prompt, tools)
         tic = datetime.datetime.now()
-        chunks = self._client.chat.completions.create(
+        chunks = self._create_completion(
             model=self.model,
             messages=prompt,
             tools=tools,
@@ -126,8 +144,8 @@ class OpenAILib(LLM):
                     message.content += delta.content
                     if state != "content":
                         state = "content"
-                        console.print("\n\n[bold blue]ASSISTANT:[/bold blue]")
-                    console.print(delta.content, end="")
+                        console.stream_header("\n\n[bold blue]ASSISTANT:[/bold blue]")
+                    console.stream(delta.content)
                     outputs += 1
 
                 if delta.tool_calls is not None and len(delta.tool_calls) > 0:
@@ -140,7 +158,7 @@ class OpenAILib(LLM):
                                     f"WARNING: Got a tool call with index {tool_call.index} but expected {len(message.tool_calls)}"
                                 )
                                 return
-                            console.print(f"\n\n[bold red]TOOL CALL - {tool_call.function.name}:[/bold red]")
+                            console.stream_header(f"\n\n[bold red]TOOL CALL - {tool_call.function.name}:[/bold red]")
                             message.tool_calls.append(
                                 ChatCompletionMessageToolCall(
                                     id=tool_call.id,
@@ -150,7 +168,7 @@ class OpenAILib(LLM):
                                     type="function",
                                 )
                             )
-                        console.print(tool_call.function.arguments, end="")
+                        console.stream(tool_call.function.arguments)
                         message.tool_calls[tool_call.index].function.arguments += tool_call.function.arguments
                         outputs += 1
 
@@ -162,7 +180,7 @@ class OpenAILib(LLM):
             if outputs > 1:
                 print("WARNING: Got more than one output in the stream response")
 
-        console.print()
+        console.end_stream()
         if usage is None:
             print("WARNING: Did not get usage information in the stream response")
             usage = CompletionUsage(completion_tokens=0, prompt_tokens=0, total_tokens=0)
@@ -171,6 +189,8 @@ class OpenAILib(LLM):
             message.tool_calls = None
 
         toc = datetime.datetime.now()
+        metrics.record_llm_request(self.model, (toc - tic).total_seconds(), usage.prompt_tokens, usage.completion_tokens)
+        rate_limiter.after_llm_request(usage.prompt_tokens, usage.completion_tokens)
         yield LLMResult(
             message,
             str(prompt),
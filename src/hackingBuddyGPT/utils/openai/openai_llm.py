@@ -6,6 +6,7 @@ import requests
 import tiktoken
 from urllib.parse import urlparse
 
+from hackingBuddyGPT.utils import metrics, rate_limiter
 from hackingBuddyGPT.utils.configurable import configurable, parameter
 from hackingBuddyGPT.utils.llm_util import LLM, LLMResult
 
@@ -33,6 +34,13 @@ class OpenAIConnection(LLM):
     api_retries: int = parameter(desc="Number of retries when running into rate-limits", default=3)
 
     def get_response(self, prompt, *, retry: int = 0,azure_retry: int = 0, **kwargs) -> LLMResult:
+        return self._get_responses(prompt, 1, retry=retry, azure_retry=azure_retry, **kwargs)[0]
+
+    def get_responses(self, prompt, n: int, **kwargs) -> list[LLMResult]:
+        # all completions are returned by a single request, so the prompt is only sent (and paid for) once
+        return self._get_responses(prompt, n, **kwargs)
+
+    def _get_responses(self, prompt, n: int, *, retry: int = 0, azure_retry: int = 0, **kwargs) -> list[LLMResult]:
         if retry >= self.api_retries:
             raise Exception("Failed to get response from OpenAI API")
 
@@ -47,20 +55,26 @@ class OpenAIConnection(LLM):
             headers = {"Authorization": f"Bearer {self.api_key}"}
 
         data = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+        if n > 1:  # not every OpenAI-compatible API knows the parameter
+            data["n"] = n
 
+        rate_limiter.before_llm_request()
         try:
             tic = datetime.datetime.now()
             response = requests.post(f'{self.api_url}{self.api_path}', headers=headers, json=data, timeout=self.api_timeout)
 
             if response.status_code == 429:
                 print(f"[RestAPI-Connector] running into rate-limits, waiting for {self.api_backoff} seconds")
+                metrics.llm_rate_limited.labels(self.model).inc()
+                metrics.llm_retries.labels(self.model, "rate_limit").inc()
                 time.sleep(self.api_backoff)
-                return self.get_response(prompt, retry=retry + 1)
+                return self._get_responses(prompt, n, retry=retry + 1)
 
             if response.status_code == 408:
                 if azure_retry < self.api_retries:
                     print("Received 408 Status Code, trying again.")
-                    return self.get_response(prompt, azure_retry = azure_retry + 1)
+                    metrics.llm_retries.labels(self.model, "gateway_timeout").inc()
+                    return self._get_responses(prompt, n, azure_retry = azure_retry + 1)
                 else:
                     raise Exception(f"Error from Gateway ({response.status_code})")
 
@@ -69,22 +83,31 @@ class OpenAIConnection(LLM):
 
         except requests.exceptions.ConnectionError:
             print("Connection error! Retrying in 5 seconds..")
+            metrics.llm_retries.labels(self.model, "connection_error").inc()
             time.sleep(5)
-            return self.get_response(prompt, retry=retry + 1)
+            return self._get_responses(prompt, n, retry=retry + 1)
 
         except requests.exceptions.Timeout:
             print("Timeout while contacting LLM REST endpoint")
-            return self.get_response(prompt, retry=retry + 1)
+            metrics.llm_retries.labels(self.model, "timeout").inc()
+            return self._get_responses(prompt, n, retry=retry + 1)
 
         # now extract the JSON status message
         # TODO: error handling..
         response = response.json()
-        result = response["choices"][0]["message"]["content"]
         tok_query = response["usage"]["prompt_tokens"]
         tok_res = response["usage"]["completion_tokens"]
         duration = datetime.datetime.now() - tic
-
-        return LLMResult(result, prompt, result, duration, tok_query, tok_res)
+        metrics.record_llm_request(self.model, duration.total_seconds(), tok_query, tok_res)
+        rate_limiter.after_llm_request(tok_query, tok_res)
+
+        # the usage of the request is attributed to the first completion, so that the results can be summed up
+        results = []
+        for choice in response["choices"]:
+            result = choice["message"]["content"]
+            results.append(LLMResult(result, prompt, result, duration, tok_query, tok_res))
+            tok_query, tok_res = 0, 0
+        return results
 
     def encode(self, query) -> list[int]:
         # I know this is crappy for all non-openAI models but sadly this
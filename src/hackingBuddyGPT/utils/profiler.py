@@ -0,0 +1,234 @@
+"""
+Profiling of the rounds of an agent, to find out where the time of `perform_round` goes without attaching external
+tools (see the `profile` parameter of the AutonomousUseCase).
+
+Two modes are available:
+ - `cprofile` uses the deterministic profiler of the standard library. Every round is written as `round_<n>.prof`,
+   which can be opened with `python -m pstats` or snakeviz. It is exact, but slows down code with many small calls.
+ - `sampling` records the stack of the agent thread every `interval` seconds from a background thread, which has a
+   low and constant overhead. Every round is written as `round_<n>.folded` (collapsed stacks), which can be opened
+   with speedscope or flamegraph.pl.
+
+In both modes the rounds are aggregated over the whole run into `summary.txt`, which lists the top functions by
+cumulative time, and the time that went into the framework (tokenization, pydantic, rich, the log database).
+"""
+
+import abc
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+PROFILE_MODES = ("", "cprofile", "sampling")
+
+# functions are attributed to a framework component by the path of their source file
+FRAMEWORK_COMPONENTS = {
+    "tokenization": ("tiktoken", "llm_util.py"),
+    "pydantic": ("pydantic", "instructor"),
+    "rich rendering": (f"{os.sep}rich{os.sep}",),
+    "log database": ("sqlite3", "db_storage.py"),
+    "http / llm client": ("httpx", "httpcore", "requests", "openai"),
+    "ssh": ("paramiko", "fabric", "invoke"),
+}
+
+FunctionKey = tuple[str, int, str]  # (filename, line, function name), as used by pstats
+
+
+def framework_component(filename: str) -> Optional[str]:
+    for component, patterns in FRAMEWORK_COMPONENTS.items():
+        if any(pattern in filename for pattern in patterns):
+            return component
+    return None
+
+
+def format_function(key: FunctionKey) -> str:
+    filename, line, name = key
+    if filename == "~":
+        return name  # builtins
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class RoundProfiler(abc.ABC):
+    """
+    Profiles the rounds of a single run, `start_round` and `end_round` have to be called from the thread that runs
+    the rounds.
+    """
+
+    def __init__(self, directory: str, top: int = 25):
+        self.directory = directory
+        self.top = top
+        self.rounds = 0
+        self.profiled_time = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    @abc.abstractmethod
+    def start_round(self, turn: int):
+        pass
+
+    @abc.abstractmethod
+    def end_round(self, turn: int):
+        pass
+
+    @abc.abstractmethod
+    def top_functions(self) -> list[tuple[FunctionKey, float, float]]:
+        """
+        Returns the top functions of the run as (function, cumulative seconds, own seconds), by cumulative time.
+        """
+        pass
+
+    @abc.abstractmethod
+    def component_times(self) -> dict[str, float]:
+        """
+        Returns the seconds that were spent in each framework component over the run.
+        """
+        pass
+
+    def summary(self) -> str:
+        lines = [f"{self.rounds} rounds, {self.profiled_time:.3f}s profiled", "", "framework components:"]
+        for component, seconds in sorted(self.component_times().items(), key=lambda item: -item[1]):
+            share = seconds / self.profiled_time * 100 if self.profiled_time else 0
+            lines.append(f"  {component:<20} {seconds:>10.3f}s {share:>6.1f}%")
+
+        lines += ["", f"top {self.top} functions by cumulative time:", f"  {'cumulative':>12} {'own':>10}  function"]
+        for key, cumulative, own in self.top_functions():
+            lines.append(f"  {cumulative:>11.3f}s {own:>9.3f}s  {format_function(key)}")
+        return "\n".join(lines) + "\n"
+
+    def finish(self) -> str:
+        """
+        Writes the summary of the run and returns it.
+        """
+        summary = self.summary()
+        with open(os.path.join(self.directory, "summary.txt"), "w") as f:
+            f.write(summary)
+        return summary
+
+
+class CProfileRoundProfiler(RoundProfiler):
+    def __init__(self, directory: str, top: int = 25):
+        super().__init__(directory, top)
+        self._profile: Optional[cProfile.Profile] = None
+        self._stats: Optional[pstats.Stats] = None
+        self._started = 0.0
+
+    def start_round(self, turn: int):
+        self._profile = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profile.enable()
+
+    def end_round(self, turn: int):
+        self._profile.disable()
+        self.profiled_time += time.perf_counter() - self._started
+        self.rounds += 1
+
+        path = os.path.join(self.directory, f"round_{turn}.prof")
+        self._profile.dump_stats(path)
+        if self._stats is None:
+            self._stats = pstats.Stats(path)
+        else:
+            self._stats.add(path)
+        self._profile = None
+
+    def top_functions(self) -> list[tuple[FunctionKey, float, float]]:
+        if self._stats is None:
+            return []
+        # (primitive calls, total calls, own time, cumulative time, callers)
+        functions = [(key, values[3], values[2]) for key, values in self._stats.stats.items()]
+        functions.sort(key=lambda item: -item[1])
+        return functions[: self.top]
+
+    def component_times(self) -> dict[str, float]:
+        # own times add up without counting nested calls twice, unlike cumulative times
+        times: Counter[str] = Counter()
+        if self._stats is not None:
+            for key, values in self._stats.stats.items():
+                component = framework_component(key[0])
+                if component is not None:
+                    times[component] += values[2]
+        return dict(times)
+
+
+class SamplingRoundProfiler(RoundProfiler):
+    def __init__(self, directory: str, top: int = 25, interval: float = 0.005):
+        super().__init__(directory, top)
+        self.interval = interval
+        self._thread_id = threading.get_ident()
+        self._round_stacks: Counter[tuple[FunctionKey, ...]] = Counter()
+        self._cumulative: Counter[FunctionKey] = Counter()
+        self._own: Counter[FunctionKey] = Counter()
+        self._components: Counter[str] = Counter()
+        self._samples = 0
+        self._base_depth = 0
+        self._stop: Optional[threading.Event] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def _sample(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            # the frames of the caller of start_round are the same in all samples and are left out, as are samples of
+            # the profiler itself (when the round already ended)
+            stack = stack[::-1][self._base_depth:]
+            if stack and stack[0][0] != __file__:
+                self._round_stacks[tuple(stack)] += 1
+
+    def start_round(self, turn: int):
+        self._thread_id = threading.get_ident()
+        frame, self._base_depth = sys._getframe(1), 0
+        while frame is not None:
+            frame, self._base_depth = frame.f_back, self._base_depth + 1
+        self._round_stacks = Counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, args=(self._stop,), name="round-profiler", daemon=True)
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def end_round(self, turn: int):
+        self._stop.set()
+        self._sampler.join()
+        self.profiled_time += time.perf_counter() - self._started
+        self.rounds += 1
+
+        with open(os.path.join(self.directory, f"round_{turn}.folded"), "w") as f:
+            for stack, count in self._round_stacks.items():
+                f.write(";".join(format_function(key) for key in stack) + f" {count}\n")
+
+        for stack, count in self._round_stacks.items():
+            self._samples += count
+            self._own[stack[-1]] += count
+            for key in set(stack):  # recursive functions are counted once per sample
+                self._cumulative[key] += count
+            for component in {framework_component(key[0]) for key in stack} - {None}:
+                self._components[component] += count
+
+    @property
+    def _seconds_per_sample(self) -> float:
+        # the sampler does not wake up exactly every interval, so the samples are scaled to the profiled time
+        return self.profiled_time / self._samples if self._samples else self.interval
+
+    def top_functions(self) -> list[tuple[FunctionKey, float, float]]:
+        scale = self._seconds_per_sample
+        return [(key, count * scale, self._own[key] * scale) for key, count in self._cumulative.most_common(self.top)]
+
+    def component_times(self) -> dict[str, float]:
+        scale = self._seconds_per_sample
+        return {component: count * scale for component, count in self._components.items()}
+
+
+def create_round_profiler(mode: str, directory: str, top: int = 25, interval: float = 0.005) -> Optional[RoundProfiler]:
+    if mode == "":
+        return None
+    if mode == "cprofile":
+        return CProfileRoundProfiler(directory, top)
+    if mode == "sampling":
+        return SamplingRoundProfiler(directory, top, interval)
+    raise ValueError(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}")
@@ -1,10 +1,11 @@
 from dataclasses import dataclass
-from typing import Tuple
-
-from pypsexec.client import Client
+from typing import TYPE_CHECKING, Tuple
 
 from hackingBuddyGPT.utils.configurable import configurable
 
+if TYPE_CHECKING:  # pypsexec is only imported when a connection is made, as it is slow to import
+    from pypsexec.client import Client
+
 
 @configurable("psexec", "connects to a remote host via PSExec")
 @dataclass
@@ -15,9 +16,11 @@ class PSExecConnection:
     password: str
     port: int = 445
 
-    _conn: Client = None
+    _conn: "Client" = None
 
     def init(self):
+        from pypsexec.client import Client
+
         self._conn = Client(self.host, username=self.username, password=self.password, port=self.port)
         self._conn.connect()
         self._conn.create_service()
@@ -0,0 +1,97 @@
+"""
+A rate limiter and token budget for LLM requests, which can be shared between processes (eg. the workers of a
+campaign, see hackingBuddyGPT.usecases.campaign).
+
+The LLM connections call `before_llm_request` and `after_llm_request` around every request, which do nothing unless a
+limiter was installed in the process with `install_rate_limiter`.
+"""
+
+import multiprocessing
+import time
+from typing import Optional
+
+# indices into the shared state
+_REQUESTS, _TOKENS, _REFILLED_AT, _USED_TOKENS = range(4)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class SharedRateLimiter:
+    """
+    Token buckets for requests and tokens per minute (0 disables a limit), refilled continuously. As the tokens of a
+    request are only known after it, they are taken from the bucket afterwards, which can make it negative so that the
+    following requests wait until the usage is paid back.
+
+    The state lives in shared memory, so a limiter that is passed to worker processes (when they are started, eg.
+    through the initializer of a pool) limits all of them together.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, token_budget: int = 0, context=None):
+        context = context or multiprocessing.get_context()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.token_budget = token_budget
+        self._state = context.Array("d", [requests_per_minute, tokens_per_minute, time.time(), 0], lock=False)
+        self._lock = context.Lock()
+
+    @property
+    def used_tokens(self) -> int:
+        return int(self._state[_USED_TOKENS])
+
+    @property
+    def budget_exceeded(self) -> bool:
+        return self.token_budget > 0 and self._state[_USED_TOKENS] >= self.token_budget
+
+    def _refill(self, now: float):
+        elapsed_minutes = (now - self._state[_REFILLED_AT]) / 60
+        self._state[_REFILLED_AT] = now
+        if self.requests_per_minute > 0:
+            self._state[_REQUESTS] = min(self.requests_per_minute, self._state[_REQUESTS] + elapsed_minutes * self.requests_per_minute)
+        if self.tokens_per_minute > 0:
+            self._state[_TOKENS] = min(self.tokens_per_minute, self._state[_TOKENS] + elapsed_minutes * self.tokens_per_minute)
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent, raises BudgetExceeded once the token budget is used up.
+        """
+        while True:
+            with self._lock:
+                if self.budget_exceeded:
+                    raise BudgetExceeded(f"token budget of {self.token_budget} is used up ({self.used_tokens} tokens)")
+
+                self._refill(time.time())
+                wait = 0.0
+                if self.requests_per_minute > 0 and self._state[_REQUESTS] < 1:
+                    wait = (1 - self._state[_REQUESTS]) / self.requests_per_minute * 60
+                if self.tokens_per_minute > 0 and self._state[_TOKENS] <= 0:
+                    wait = max(wait, (1 - self._state[_TOKENS]) / self.tokens_per_minute * 60)
+                if wait == 0:
+                    if self.requests_per_minute > 0:
+                        self._state[_REQUESTS] -= 1
+                    return
+            time.sleep(wait)
+
+    def record(self, tokens: int):
+        with self._lock:
+            self._state[_TOKENS] -= tokens
+            self._state[_USED_TOKENS] += tokens
+
+
+_limiter: Optional[SharedRateLimiter] = None
+
+
+def install_rate_limiter(limiter: Optional[SharedRateLimiter]):
+    global _limiter
+    _limiter = limiter
+
+
+def before_llm_request():
+    if _limiter is not None:
+        _limiter.acquire()
+
+
+def after_llm_request(tokens_query: int, tokens_response: int):
+    if _limiter is not None:
+        _limiter.record((tokens_query or 0) + (tokens_response or 0))
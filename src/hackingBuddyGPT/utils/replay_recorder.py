@@ -0,0 +1,98 @@
+import gzip
+import itertools
+import os
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Optional
+
+
+class ReplayRecorder:
+    """
+    Records the events of runs into one `<run_id>.jsonl` file per run (as read by the Replayer).
+
+    Files are kept open with a large write buffer while a run is active, so recording an event usually does not cause
+    any system call. Buffers are written out by `flush` (which the owner is expected to call periodically) and when a
+    run is finished. Only `max_open_files` files are kept open, the least recently used one is closed when another run
+    needs its file (and re-opened for appending if the run continues).
+
+    With `compress` the recording of a finished run is gzip-compressed to `<run_id>.jsonl.gz` in a background thread.
+    Should events of a run arrive after it was compressed, they are appended as another gzip member, which gzip readers
+    transparently concatenate.
+
+    Not thread-safe, all methods are expected to be called from the same thread (eg. the event loop of the Viewer).
+    """
+
+    def __init__(self, directory: str, max_open_files: int = 64, buffer_size: int = 256 * 1024, compress: bool = False):
+        self.directory = directory
+        self.max_open_files = max_open_files
+        self.buffer_size = buffer_size
+        self.compress = compress
+
+        os.makedirs(directory, exist_ok=True)
+        self._files: OrderedDict[int, IO[str]] = OrderedDict()
+        self._dirty: set[int] = set()
+        self._compressor: Optional[ThreadPoolExecutor] = None
+        self._pending = itertools.count()
+
+    def path_for(self, run_id: int) -> str:
+        return os.path.join(self.directory, f"{run_id}.jsonl")
+
+    def _file_for(self, run_id: int) -> IO[str]:
+        file = self._files.get(run_id)
+        if file is not None:
+            self._files.move_to_end(run_id)
+            return file
+
+        while len(self._files) >= self.max_open_files:
+            oldest_run_id, oldest_file = self._files.popitem(last=False)
+            oldest_file.close()
+            self._dirty.discard(oldest_run_id)
+
+        file = open(self.path_for(run_id), "a", buffering=self.buffer_size, encoding="utf-8")
+        self._files[run_id] = file
+        return file
+
+    def record(self, run_id: int, line: str):
+        """
+        Appends the (already serialized, single line) event to the recording of the run.
+        """
+        self._file_for(run_id).write(line + "\n")
+        self._dirty.add(run_id)
+
+    def flush(self):
+        for run_id in self._dirty:
+            self._files[run_id].flush()
+        self._dirty.clear()
+
+    def finish_run(self, run_id: int):
+        """
+        Closes the recording of a run that has ended, and compresses it if enabled.
+        """
+        file = self._files.pop(run_id, None)
+        self._dirty.discard(run_id)
+        if file is not None:
+            file.close()
+
+        if self.compress and os.path.exists(self.path_for(run_id)):
+            if self._compressor is None:
+                self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replay-compressor")
+            # the recording is renamed first, so that events arriving during compression go to a new file, the single
+            # compressor thread keeps the order of the gzip members
+            pending_path = f"{self.path_for(run_id)}.{next(self._pending)}.pending"
+            os.replace(self.path_for(run_id), pending_path)
+            self._compressor.submit(self._compress, pending_path, self.path_for(run_id) + ".gz")
+
+    @staticmethod
+    def _compress(source: str, target: str):
+        with open(source, "rb") as src, gzip.open(target, "ab") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+        self._dirty.clear()
+        if self._compressor is not None:
+            self._compressor.shutdown(wait=True)
@@ -0,0 +1,126 @@
+"""
+Compaction of long chat prompt histories: the older turns are summarized into a single message by a (usually cheaper)
+LLM in the background, while the agent continues with its next rounds, so that the prompt size stays roughly flat
+instead of growing with every round.
+"""
+
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+
+from hackingBuddyGPT.utils.llm_util import LLM, LLMResult, system_message, user_message
+
+SUMMARY_INSTRUCTIONS = (
+    "You are maintaining the memory of a penetration tester. Summarize the following transcript of their previous "
+    "steps, which might start with the summary of even earlier steps, into a concise memory. Keep everything that is "
+    "needed to continue the work: discovered endpoints, parameters, credentials, flags and other findings, what was "
+    "tried and did not work, and open leads. Leave out raw responses and repetitions."
+)
+SUMMARY_PREFIX = "Summary of the earlier rounds:\n"
+
+
+def _get(message: Any, key: str) -> Any:
+    if isinstance(message, dict):
+        return message.get(key)
+    return getattr(message, key, None)
+
+
+def transcript(messages: list[Any]) -> str:
+    lines = []
+    for message in messages:
+        content = _get(message, "content")
+        if content:
+            lines.append(f"{_get(message, 'role')}: {content if isinstance(content, str) else json.dumps(content, default=str)}")
+        for tool_call in _get(message, "tool_calls") or []:
+            function = _get(tool_call, "function")
+            lines.append(f"tool call: {_get(function, 'name')}({_get(function, 'arguments')})")
+    return "\n".join(lines)
+
+
+class RollingSummary:
+    """
+    Keeps track of the turns of a prompt history (which starts with `pinned` messages that are always kept, like the
+    system prompt) and summarizes the older turns, keeping the most recent `keep_recent_turns` verbatim.
+
+    As soon as `summarize_every_turns` turns are older than that, a summary of them (and of the previous summary) is
+    requested in the background. `apply` swaps the summary into the history once it is ready, replacing everything
+    that was summarized with one message in a single modification, so the history is never seen half-compacted. All
+    methods are called from the thread of the agent, only the LLM call runs in the background.
+
+    After a failed summary the next one is only requested after another `summarize_every_turns` turns, doubling with
+    every failure in a row, and after `max_failures` failures in a row summarizing is given up (see `disabled`).
+    """
+
+    def __init__(self, llm: LLM, keep_recent_turns: int, summarize_every_turns: int, pinned: int = 1, max_failures: int = 3):
+        self.llm = llm
+        self.keep_recent_turns = keep_recent_turns
+        self.summarize_every_turns = summarize_every_turns
+        self.pinned = pinned
+        self.max_failures = max_failures
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        self._turn_starts: list[int] = []
+        self._has_summary = False
+        # the summary that is being requested, with the index of the first message that is not part of it, and the
+        # number of turns that it covers
+        self._pending: Optional[tuple[Future, int, int]] = None
+        self._failures = 0
+        self._retry_at = 0  # number of turns from which on a summary is requested again after a failure
+
+    @property
+    def disabled(self) -> bool:
+        return self._failures >= self.max_failures
+
+    def checkpoint(self) -> dict:
+        # a summary that is still being requested is not part of it, it is requested again after restoring
+        return {"turn_starts": list(self._turn_starts), "has_summary": self._has_summary, "failures": self._failures, "retry_at": self._retry_at}
+
+    def restore(self, checkpoint: dict):
+        self._turn_starts = list(checkpoint["turn_starts"])
+        self._has_summary = checkpoint["has_summary"]
+        self._failures = checkpoint.get("failures", 0)
+        self._retry_at = checkpoint.get("retry_at", 0)
+
+    def start_turn(self, history: list[Any]):
+        self._turn_starts.append(len(history))
+
+    def maybe_start(self, history: list[Any]):
+        if self._pending is not None or self.disabled or len(self._turn_starts) < self._retry_at:
+            return
+        turns = len(self._turn_starts) - self.keep_recent_turns
+        if turns < self.summarize_every_turns + self._has_summary:  # the previous summary counts as one turn
+            return
+        end = self._turn_starts[turns]
+        self._pending = (self._executor.submit(self.summarize, list(history[self.pinned:end])), end, turns)
+
+    def summarize(self, messages: list[Any]) -> LLMResult:
+        return self.llm.get_response([system_message(SUMMARY_INSTRUCTIONS), user_message(transcript(messages))])
+
+    def apply(self, history: list[Any], wait: bool = False) -> Optional[LLMResult]:
+        """
+        Swaps the summary into the history if it is ready (or waits for it), and returns the LLM result of it. Raises
+        the exception of the summarization if it failed, in which case the history is left as it is.
+        """
+        if self._pending is None or not (wait or self._pending[0].done()):
+            return None
+
+        future, end, turns = self._pending
+        self._pending = None
+        try:
+            result = future.result()
+        except Exception:
+            self._failures += 1
+            self._retry_at = len(self._turn_starts) + self.summarize_every_turns * 2 ** (self._failures - 1)
+            raise
+        self._failures = 0
+        self._retry_at = 0
+
+        history[self.pinned:end] = [system_message(SUMMARY_PREFIX + result.answer)]
+        # the summary takes the place of the first turn that it covers
+        shift = end - self.pinned - 1
+        self._turn_starts = [self.pinned] + [start - shift for start in self._turn_starts[turns:]]
+        self._has_summary = True
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
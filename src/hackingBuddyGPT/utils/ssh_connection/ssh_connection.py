@@ -44,6 +44,10 @@ class SSHConnection:
             port=port or self.port,
         )
 
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
     def run(self, cmd, *args, **kwargs) -> Tuple[str, str, int]:
         res: Optional[invoke.Result] = self._conn.run(cmd, *args, **kwargs)
         return res.stdout, res.stderr, res.return_code
@@ -0,0 +1,129 @@
+"""
+Exports the timing of runs in the Chrome trace-event format (https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU),
+which can be opened in chrome://tracing, https://ui.perfetto.dev or https://www.speedscope.app.
+
+Every run is a process, whose sections, LLM calls (messages with a duration) and tool calls are slices on a single
+thread, so that their nesting can be seen in a flame chart.
+"""
+
+import json
+from typing import Any, Optional
+
+from .db_storage.db_storage import RawDbStorage
+
+TRACE_THREAD_ID = 1
+MAX_ARGUMENT_LENGTH = 200
+
+
+def _us(seconds: float) -> int:
+    return int(seconds * 1_000_000)
+
+
+def _shorten(text: Optional[str]) -> Optional[str]:
+    if text is not None and len(text) > MAX_ARGUMENT_LENGTH:
+        return text[:MAX_ARGUMENT_LENGTH] + "..."
+    return text
+
+
+def process_name_event(run_id: int, name: str) -> dict[str, Any]:
+    return {"name": "process_name", "ph": "M", "pid": run_id, "tid": TRACE_THREAD_ID, "args": {"name": name}}
+
+
+def section_event(run_id: int, name: str, start: float, duration: float) -> dict[str, Any]:
+    return {"name": name, "cat": "section", "ph": "X", "pid": run_id, "tid": TRACE_THREAD_ID, "ts": _us(start), "dur": _us(duration)}
+
+
+def llm_call_event(run_id: int, message_id: int, conversation: Optional[str], start: float, duration: float, tokens_query: int, tokens_response: int) -> dict[str, Any]:
+    return {
+        "name": f"LLM: {conversation}" if conversation else "LLM",
+        "cat": "llm",
+        "ph": "X",
+        "pid": run_id,
+        "tid": TRACE_THREAD_ID,
+        "ts": _us(start),
+        "dur": _us(duration),
+        "args": {"message_id": message_id, "tokens_query": tokens_query, "tokens_response": tokens_response},
+    }
+
+
+def tool_call_event(run_id: int, message_id: int, function_name: str, arguments: str, start: float, duration: float, result_size: int) -> dict[str, Any]:
+    return {
+        "name": f"tool: {function_name}" if function_name else "tool",
+        "cat": "tool",
+        "ph": "X",
+        "pid": run_id,
+        "tid": TRACE_THREAD_ID,
+        "ts": _us(start),
+        "dur": _us(duration),
+        "args": {"message_id": message_id, "arguments": _shorten(arguments), "result_size": result_size},
+    }
+
+
+def export_run_trace(db: RawDbStorage, run_id: int) -> dict[str, Any]:
+    """
+    Builds the trace of a run from the log database. Entries that were written before their finishing time was
+    recorded can not be placed on the timeline and are skipped.
+    """
+    cursor = db.read_cursor
+    cursor.execute("SELECT model, tag FROM runs WHERE id = ?", (run_id,))
+    run = cursor.fetchone()
+    if run is None:
+        raise ValueError(f"Run {run_id} does not exist")
+
+    events = [process_name_event(run_id, f"run {run_id} ({run['model']}{', ' + run['tag'] if run['tag'] else ''})")]
+
+    cursor.execute("SELECT name, duration, finished_at FROM sections WHERE run_id = ? AND finished_at IS NOT NULL AND to_message IS NOT NULL", (run_id,))
+    events.extend(section_event(run_id, row["name"], row["finished_at"] - row["duration"], row["duration"]) for row in cursor.fetchall())
+
+    cursor.execute("SELECT id, conversation, duration, tokens_query, tokens_response, finished_at FROM messages WHERE run_id = ? AND finished_at IS NOT NULL AND duration > 0", (run_id,))
+    events.extend(
+        llm_call_event(run_id, row["id"], row["conversation"], row["finished_at"] - row["duration"], row["duration"], row["tokens_query"] or 0, row["tokens_response"] or 0)
+        for row in cursor.fetchall()
+    )
+
+    cursor.execute("SELECT message_id, function_name, arguments, length(result_text) AS result_size, duration, finished_at FROM tool_calls WHERE run_id = ? AND finished_at IS NOT NULL", (run_id,))
+    events.extend(
+        tool_call_event(run_id, row["message_id"], row["function_name"], row["arguments"], row["finished_at"] - (row["duration"] or 0), row["duration"] or 0, row["result_size"] or 0)
+        for row in cursor.fetchall()
+    )
+
+    # viewers expect the events of a thread in order, enclosing slices before the ones they contain
+    events[1:] = sorted(events[1:], key=lambda event: (event["ts"], -event["dur"]))
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class TraceWriter:
+    """
+    Writes the trace of a run while it happens. The file is written in the JSON array format, which trace viewers also
+    accept without the closing bracket, so the trace can be opened while the run is still going (or after it crashed).
+    """
+
+    def __init__(self, path: str, run_id: int, name: str):
+        self.run_id = run_id
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[\n")
+        self._write(process_name_event(run_id, name))
+
+    def _write(self, event: dict[str, Any]):
+        self._file.write(json.dumps(event) + ",\n")
+
+    def begin_section(self, name: str, at: float):
+        self._write({"name": name, "cat": "section", "ph": "B", "pid": self.run_id, "tid": TRACE_THREAD_ID, "ts": _us(at)})
+
+    def end_section(self, name: str, at: float):
+        self._write({"name": name, "cat": "section", "ph": "E", "pid": self.run_id, "tid": TRACE_THREAD_ID, "ts": _us(at)})
+        # sections are where the time of a run goes, so this is when it is worth to make the trace visible
+        self._file.flush()
+
+    def llm_call(self, message_id: int, conversation: Optional[str], finished_at: float, duration: float, tokens_query: int, tokens_response: int):
+        self._write(llm_call_event(self.run_id, message_id, conversation, finished_at - duration, duration, tokens_query, tokens_response))
+
+    def tool_call(self, message_id: int, function_name: str, arguments: str, finished_at: float, duration: float, result_size: int):
+        self._write(tool_call_event(self.run_id, message_id, function_name, arguments, finished_at - duration, duration, result_size))
+
+    def close(self, at: float, state: str):
+        if not self._file.closed:
+            # the end of the run is written without a trailing comma, so that the finished trace is strict JSON
+            end = {"name": state, "cat": "run", "ph": "i", "s": "p", "pid": self.run_id, "tid": TRACE_THREAD_ID, "ts": _us(at)}
+            self._file.write(json.dumps(end) + "\n]\n")
+            self._file.close()
@@ -3,10 +3,7 @@ from rich.table import Table
 from .db_storage.db_storage import DbStorage
 
 
-# helper to fill the history table with data from the db
-def get_history_table(
-    enable_explanation: bool, enable_update_state: bool, run_id: int, db: DbStorage, turn: int
-) -> Table:
+def create_history_table(enable_explanation: bool, enable_update_state: bool) -> Table:
     table = Table(title="Executed Command History", show_header=True, show_lines=True)
     table.add_column("ThinkTime", style="dim")
     table.add_column("Tokens", style="dim")
@@ -19,8 +16,20 @@ def get_history_table(
     if enable_update_state:
         table.add_column("StateUpdTime", style="dim")
         table.add_column("StateUpdTokens", style="dim")
+    return table
+
 
+# helper to fill the history table with data from the db
+def get_history_table(
+    enable_explanation: bool, enable_update_state: bool, run_id: int, db: DbStorage, turn: int
+) -> Table:
+    table = create_history_table(enable_explanation, enable_update_state)
     for i in range(1, turn + 1):
         table.add_row(*db.get_round_data(run_id, i, enable_explanation, enable_update_state))
 
     return table
+
+
+# adds the row of a single round to a table that is kept over the whole run, so that each round only reads its own statistics
+def add_history_row(table: Table, enable_explanation: bool, enable_update_state: bool, run_id: int, db: DbStorage, turn: int):
+    table.add_row(*db.get_round_data(run_id, turn, enable_explanation, enable_update_state))
@@ -0,0 +1,42 @@
+"""
+The use case that the worker processes of the end-to-end test of the Campaign (see test_campaign.py) run, which they
+import through the `imports` of the campaign file. The tests do not import it themselves, so that it is not registered
+next to the use cases of hackingBuddyGPT.
+"""
+
+from dataclasses import dataclass
+
+from hackingBuddyGPT.usecases.base import AutonomousUseCase, use_case
+from hackingBuddyGPT.utils.configurable import configurable, parameter
+
+open_connections = 0
+
+
+@configurable("fake_conn", "a connection to a target that does not exist")
+@dataclass
+class FakeTargetConnection:
+    host: str = parameter(desc="host", default="")
+    hostname: str = parameter(desc="hostname", default="")
+    port: int = parameter(desc="port", default=22)
+
+    def init(self):
+        global open_connections
+        open_connections += 1
+
+    def close(self):
+        global open_connections
+        open_connections -= 1
+
+
+@use_case("Gets root on the targets whose name starts with 'root'")
+class FakeCampaignJobUseCase(AutonomousUseCase):
+    conn: FakeTargetConnection = None
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def perform_round(self, turn: int) -> bool:
+        # the worker processes run one job after another, which must not leave their connections open
+        if open_connections != 1:
+            raise RuntimeError(f"{open_connections} connections are open")
+        return self.conn.hostname.startswith("root")
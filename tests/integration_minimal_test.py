@@ -1,5 +1,8 @@
+import time
 from typing import Tuple
 
+import pytest
+
 from hackingBuddyGPT.utils.logging import LocalLogger
 from hackingBuddyGPT.usecases.examples.agent import (
     ExPrivEscLinux,
@@ -12,65 +15,8 @@ from hackingBuddyGPT.usecases.examples.agent_with_state import (
 from hackingBuddyGPT.usecases.privesc.linux import LinuxPrivesc, LinuxPrivescUseCase
 from hackingBuddyGPT.utils.console.console import Console
 from hackingBuddyGPT.utils.db_storage.db_storage import DbStorage
-from hackingBuddyGPT.utils.llm_util import LLM, LLMResult
-
-
-class FakeSSHConnection:
-    username: str = "lowpriv"
-    password: str = "toomanysecrets"
-    hostname: str = "theoneandonly"
-
-    results = {
-        "id": "uid=1001(lowpriv) gid=1001(lowpriv) groups=1001(lowpriv)",
-        "sudo -l": "Sorry, user lowpriv may not run sudo on test-1.",
-        "find / -perm -4000 2>/dev/null": """
-/usr/bin/newgrp
-/usr/bin/gpasswd
-/usr/bin/su
-│ /usr/bin/find
-│ /usr/bin/chfn
-│ /usr/bin/passwd
-│ /usr/bin/python3.11
-│ /usr/bin/chsh
-│ /usr/bin/umount
-│ /usr/bin/sudo
-│ /usr/bin/mount
-│ /usr/lib/dbus-1.0/dbus-daemon-launch-helper
-│ /usr/lib/openssh/ssh-keysign
-""",
-        "/usr/bin/python3.11 -c 'import os; os.setuid(0); os.system(\"/bin/sh\")'": "# ",
-    }
-
-    def run(self, cmd, *args, **kwargs) -> Tuple[str, str, int]:
-        out_stream = kwargs.get("out_stream", None)
-
-        if cmd in self.results:
-            out_stream.write(self.results[cmd])
-            return self.results[cmd], "", 0
-        else:
-            return "", "Command not found", 1
-
-
-class FakeLLM(LLM):
-    model: str = "fake_model"
-    context_size: int = 4096
-
-    counter: int = 0
-    responses = [
-        "id",
-        "sudo -l",
-        "find / -perm -4000 2>/dev/null",
-        "/usr/bin/python3.11 -c 'import os; os.setuid(0); os.system(\"/bin/sh\")'",
-    ]
-
-    def get_response(self, prompt, *, capabilities=None, **kwargs) -> LLMResult:
-        response = self.responses[self.counter]
-        self.counter += 1
-
-        return LLMResult(result=response, prompt="this would be the prompt", answer=response)
-
-    def encode(self, query) -> list[int]:
-        return [0]
+from hackingBuddyGPT.utils.fakes import FakeLLM, FakeSSHConnection
+from hackingBuddyGPT.utils.llm_util import LLMResult
 
 
 def test_linuxprivesc():
@@ -104,6 +50,270 @@ def test_linuxprivesc():
     assert result is True
 
 
+class SlowExplanationLLM(FakeLLM):
+    def get_response(self, prompt, *, capabilities=None, **kwargs) -> LLMResult:
+        if "resp" in kwargs:  # the prompt that asks for an explanation of the result
+            time.sleep(0.2)
+            return LLMResult(result="explanation", prompt="this would be the prompt", answer="explanation")
+        return super().get_response(prompt, capabilities=capabilities, **kwargs)
+
+
+def test_linuxprivesc_background_explanations():
+    llm = SlowExplanationLLM()
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_background_explanations")
+    priv_esc = LinuxPrivescUseCase(
+        agent=LinuxPrivesc(conn=FakeSSHConnection(), enable_explanation=True, llm=llm, log=log, max_background_explanations=4),
+        log=log,
+        max_turns=len(llm.responses),
+    )
+
+    priv_esc.init()
+    started = time.monotonic()
+    assert priv_esc.run({}) is True
+    # the rounds do not wait for the explanations, which run concurrently
+    assert time.monotonic() - started < 0.2 * len(llm.responses)
+
+    explanations = [message for message in log_db.get_messages_by_run(log.run.id) if message.conversation == "Analyze its result..." and message.role == "assistant"]
+    assert len(explanations) == len(llm.responses)
+    # every explanation is shown in the history row of the round that requested it
+    for turn in range(1, len(llm.responses) + 1):
+        assert log_db.get_round_data(log.run.id, turn, True, False)[4] == "explanation"
+
+
+class FailingExplanationLLM(SlowExplanationLLM):
+    def get_response(self, prompt, *, capabilities=None, **kwargs) -> LLMResult:
+        if kwargs.get("cmd") == "sudo -l":
+            raise ConnectionError("the API is not reachable")
+        return super().get_response(prompt, capabilities=capabilities, **kwargs)
+
+
+def test_linuxprivesc_background_explanation_failure():
+    llm = FailingExplanationLLM()
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_background_explanation_failure")
+    priv_esc = LinuxPrivescUseCase(
+        agent=LinuxPrivesc(conn=FakeSSHConnection(), enable_explanation=True, llm=llm, log=log, max_background_explanations=4),
+        log=log,
+        max_turns=len(llm.responses),
+    )
+
+    priv_esc.init()
+    assert priv_esc.run({}) is True
+
+    status_messages = [message.content for message in log_db.get_messages_by_run(log.run.id) if message.role == "status"]
+    assert any("Explaining the result of round 2 failed: ConnectionError" in message for message in status_messages)
+    assert log_db.get_round_data(log.run.id, 2, True, False)[4] == ""
+    assert log_db.get_round_data(log.run.id, 3, True, False)[4] == "explanation"
+
+
+class OutageLLM(FakeLLM):
+    fail_at: int = 2
+
+    def get_response(self, prompt, *, capabilities=None, **kwargs) -> LLMResult:
+        if self.counter == self.fail_at:
+            raise ConnectionError("the API is not reachable")
+        return super().get_response(prompt, capabilities=capabilities, **kwargs)
+
+
+def test_linuxprivesc_resume():
+    log_db = DbStorage(":memory:")
+    log_db.init()
+
+    def use_case(llm, log, resume=0):
+        return LinuxPrivescUseCase(
+            agent=LinuxPrivesc(conn=FakeSSHConnection(), llm=llm, log=log, hint="try suid binaries"),
+            log=log,
+            max_turns=len(llm.responses),
+            resume=resume,
+        )
+
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+    interrupted = use_case(OutageLLM(), log)
+    interrupted.init()
+    try:
+        interrupted.run({})
+        raise AssertionError("the outage should have stopped the run")
+    except ConnectionError:
+        pass
+    run_id = log.run.id
+    assert log_db.get_checkpoint(run_id)[0] == 2
+
+    llm = FakeLLM()
+    llm.counter = 2  # the first two responses were already paid for
+    resumed_log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+    resumed = use_case(llm, resumed_log, resume=run_id)
+    resumed.init()
+    assert resumed.run({}) is True
+
+    assert resumed_log.run.id == run_id
+    assert log_db.get_run(run_id).state == "got root"
+    assert llm.counter == len(llm.responses)
+    # the history of the rounds before the outage was restored
+    assert "$ id\n" in resumed.agent._sliding_history.sliding_history
+    # all messages went into the same run, without overwriting each other
+    message_ids = [message.id for message in log_db.get_messages_by_run(run_id)]
+    assert message_ids == list(range(len(message_ids)))
+    assert [stats.round for stats in log_db.get_round_stats(run_id)].count(4) == 1
+    # the hint is only logged when the run starts
+    assert [message.content for message in log_db.get_messages_by_run(run_id)].count("[bold green]Using the following hint: 'try suid binaries'") == 1
+
+    # the run is finished now
+    with pytest.raises(ValueError, match="already finished"):
+        use_case(FakeLLM(), LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume"), resume=run_id).run({})
+
+
+def test_resume_is_refused_for_other_use_cases():
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+    log.start_run("WindowsPrivesc", "{}")
+    log.run_was_failure("exception occurred")
+
+    linux_log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+    linux = LinuxPrivescUseCase(agent=LinuxPrivesc(conn=FakeSSHConnection(), llm=FakeLLM(), log=linux_log), log=linux_log, resume=log.run.id)
+    linux.init()
+    with pytest.raises(ValueError, match="is a run of WindowsPrivesc"):
+        linux.run({})
+
+    # the example agent does not save its history in checkpoints
+    example_log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+    example = ExPrivEscLinuxUseCase(agent=ExPrivEscLinux(conn=FakeSSHConnection(), llm=FakeLLM(), log=example_log), log=example_log, resume=log.run.id)
+    example.init()
+    with pytest.raises(ValueError, match="can not be resumed"):
+        example.run({})
+    assert log_db.get_run(log.run.id).state == "exception occurred"
+
+
+def test_resume_of_a_run_in_progress_waits_until_it_is_stale():
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+    log.start_run("LinuxPrivescUseCase", "{}")
+    log.status_message("the run might still be going on in another process")
+
+    def use_case(resume_stale_after):
+        linux_log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+        linux = LinuxPrivescUseCase(
+            agent=LinuxPrivesc(conn=FakeSSHConnection(), llm=FakeLLM(), log=linux_log),
+            log=linux_log,
+            resume=log.run.id,
+            resume_stale_after=resume_stale_after,
+        )
+        linux.init()
+        return linux
+
+    with pytest.raises(ValueError, match="is still in progress"):
+        use_case(600).run({})
+    assert log_db.get_run(log.run.id).state == "in progress"
+
+    # once nothing was logged for the configured time, the process of the run is assumed to be gone
+    assert use_case(0).run({}) is True
+    assert log_db.get_run(log.run.id).state == "got root"
+
+
+def test_checkpoints_are_only_saved_by_resumable_use_cases():
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_resume")
+    example = ExPrivEscLinuxUseCase(agent=ExPrivEscLinux(conn=FakeSSHConnection(), llm=FakeLLM(), log=log), log=log, max_turns=len(FakeLLM().responses))
+    example.init()
+    assert example.run({}) is True
+    assert log_db.get_checkpoint(log.run.id) is None
+
+
+class RepeatingLLM(FakeLLM):
+    responses = ["id", "id", "sudo -l", "id ;", "id", "id", "whoami"]
+
+
+class CountingSSHConnection(FakeSSHConnection):
+    def __init__(self):
+        self.executed = []
+
+    def run(self, cmd, *args, **kwargs) -> Tuple[str, str, int]:
+        self.executed.append(cmd)
+        return super().run(cmd, *args, **kwargs)
+
+
+def run_repeating_linuxprivesc(loop_policy: str) -> Tuple[LinuxPrivescUseCase, CountingSSHConnection, DbStorage]:
+    conn = CountingSSHConnection()
+    llm = RepeatingLLM()
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_loop_policy")
+    priv_esc = LinuxPrivescUseCase(
+        agent=LinuxPrivesc(conn=conn, llm=llm, log=log, loop_policy=loop_policy, loop_max_repeats=3),
+        log=log,
+        max_turns=len(llm.responses),
+    )
+    priv_esc.init()
+    assert priv_esc.run({}) is False
+    return priv_esc, conn, log_db
+
+
+def test_linuxprivesc_loop_policy_cache():
+    priv_esc, conn, _log_db = run_repeating_linuxprivesc("cache")
+
+    assert conn.executed == ["id", "sudo -l", "whoami"]
+    assert "(this is the output of an earlier execution of `id ;`" in priv_esc.agent._sliding_history.sliding_history
+
+
+def test_linuxprivesc_loop_policy_hint():
+    priv_esc, conn, _log_db = run_repeating_linuxprivesc("hint")
+
+    assert conn.executed == ["id", "sudo -l", "whoami"]
+    assert "You already ran `id`" in priv_esc.agent._sliding_history.sliding_history
+
+
+def test_linuxprivesc_loop_policy_stop():
+    priv_esc, conn, log_db = run_repeating_linuxprivesc("stop")
+
+    assert conn.executed == ["id", "sudo -l"]
+    # the third repeat in a row ends the run, before the last round
+    assert len(log_db.get_round_stats(priv_esc.log.run.id)) == 6
+    assert log_db.get_run(priv_esc.log.run.id).state.startswith("no progress")
+
+
+class CandidateLLM(FakeLLM):
+    candidates = [
+        ["id", "id ;", "sudo -l"],
+        ["id", "find / -perm -4000 2>/dev/null", "/usr/bin/python3.11 -c 'import os; os.setuid(0); os.system(\"/bin/sh\")'"],
+    ]
+
+    def get_responses(self, prompt, n: int, **kwargs) -> list[LLMResult]:
+        candidates = self.candidates[self.counter]
+        self.counter += 1
+        assert len(candidates) == n
+        return [LLMResult(result=candidate, prompt="this would be the prompt", answer=candidate, tokens_query=10, tokens_response=1) for candidate in candidates]
+
+
+def test_linuxprivesc_candidates():
+    conn = CountingSSHConnection()
+    llm = CandidateLLM()
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(), tag="integration_test_candidates")
+    priv_esc = LinuxPrivescUseCase(
+        agent=LinuxPrivesc(conn=conn, llm=llm, log=log, candidates=3, execute_candidates=2),
+        log=log,
+        max_turns=len(llm.candidates),
+    )
+
+    priv_esc.init()
+    assert priv_esc.run({}) is True
+
+    # the duplicate is dropped, the seen command goes last, the read-only command first and then the known escalation
+    assert conn.executed == ["id", "sudo -l", llm.candidates[1][1], llm.candidates[1][2]]
+    stats = log_db.get_round_stats(log.run.id)
+    assert [round.tool_calls for round in stats] == [2, 2]
+    assert stats[0].tokens_query == 30
+    # the ranking is logged as the answer of the round
+    answers = [message.content for message in log_db.get_messages_by_run(log.run.id) if message.role == "assistant"]
+    assert answers[0] == "1. id\n2. sudo -l"
+
+
 def test_minimal_agent():
     conn = FakeSSHConnection()
     llm = FakeLLM()
@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+
+from hackingBuddyGPT.usecases.benchmark import Benchmark, StageTimer, compare
+from hackingBuddyGPT.utils import Console, DbStorage
+from hackingBuddyGPT.utils.logging import LocalLogger
+
+
+class Work:
+    def outer(self):
+        time.sleep(0.01)
+        self.inner()
+
+    def inner(self):
+        time.sleep(0.02)
+
+
+def test_stage_timer_attributes_nested_time_once():
+    timer = StageTimer()
+    work = Work()
+    timer.instrument("outer", work, "outer")
+    timer.instrument("inner", work, "inner")
+
+    work.outer()
+    timer.restore()
+
+    assert 0.01 <= timer.totals["outer"] < 0.02
+    assert timer.totals["inner"] >= 0.02
+    assert "outer" not in vars(work) and "inner" not in vars(work)
+
+
+def create_benchmark(**kwargs) -> Benchmark:
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    benchmark = Benchmark(log=LocalLogger(log_db=log_db, console=Console(mode="headless")), **kwargs)
+    benchmark.init()
+    return benchmark
+
+
+@pytest.mark.parametrize("agent", ["LinuxPrivesc", "ExPrivEscLinux", "ExPrivEscLinuxTemplated"])
+def test_benchmark_writes_result(agent, tmp_path):
+    output = tmp_path / "benchmark.json"
+    result = create_benchmark(agent=agent, rounds=20, history_size=1000, output_size=500, memory_samples=4, output=str(output)).run({})
+
+    assert json.loads(output.read_text()) == json.loads(json.dumps(result))
+    assert result["rounds_per_second"] > 0
+    stages = result["stages_ms_per_round"]
+    for stage in ("template rendering", "token counting", "capabilities", "logging", "db writes", "llm (fake)", "target (fake)"):
+        assert stages[stage] > 0, stage
+    assert [sample["round"] for sample in result["memory"]["samples"]] == [0, 5, 10, 15, 20]
+
+
+def test_benchmark_fails_on_regression(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"rounds_per_second": 1e9, "overhead_ms_per_round": 1e-9}))
+
+    with pytest.raises(SystemExit):
+        create_benchmark(rounds=5, baseline=str(baseline)).run({})
+
+
+def test_compare():
+    baseline = {"rounds_per_second": 100.0, "overhead_ms_per_round": 10.0}
+    assert compare({"rounds_per_second": 95.0, "overhead_ms_per_round": 10.5}, baseline, 0.1) == []
+    assert len(compare({"rounds_per_second": 80.0, "overhead_ms_per_round": 12.5}, baseline, 0.1)) == 2
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+
+import pytest
+
+from hackingBuddyGPT.usecases.campaign import (
+    Campaign,
+    CampaignProgress,
+    Job,
+    Target,
+    plan_jobs,
+    read_group_descriptions,
+    read_inventory,
+    run_job,
+)
+from hackingBuddyGPT.utils import Console, DbStorage
+from hackingBuddyGPT.utils.logging import LocalLogger
+from hackingBuddyGPT.utils.rate_limiter import BudgetExceeded, SharedRateLimiter
+
+SCRIPTS = os.path.join(os.path.dirname(__file__), "..", "scripts")
+
+
+def test_read_inventory(tmp_path):
+    inventory = tmp_path / "hosts.ini"
+    inventory.write_text(
+        "# comment\n"
+        "10.0.0.1\n"
+        "10.0.0.9\n"
+        "\n"
+        "[vuln_suid_gtfo]\n"
+        "10.0.0.1\n"
+        "suid-box ansible_host=10.0.0.2 ansible_port=2222\n"
+        "\n"
+        "[vuln_sudo_no_password]\n"
+        "10.0.0.3\n"
+        "\n"
+        "[vuln_sudo_no_password:vars]\n"
+        "ansible_user=root\n"
+    )
+
+    assert read_inventory(str(inventory)) == [
+        Target("10.0.0.9", "ungrouped", "10.0.0.9"),
+        Target("10.0.0.1", "vuln_suid_gtfo", "10.0.0.1"),
+        Target("suid-box", "vuln_suid_gtfo", "10.0.0.2", 2222),
+        Target("10.0.0.3", "vuln_sudo_no_password", "10.0.0.3"),
+    ]
+    assert [target.name for target in read_inventory(str(inventory), ["vuln_sudo_no_password"])] == ["10.0.0.3"]
+
+
+def test_shipped_inventory_and_tasks():
+    targets = read_inventory(os.path.join(SCRIPTS, "hosts.ini"))
+    assert [target.group for target in targets] == ["vuln_suid_gtfo"]
+
+    descriptions = read_group_descriptions(os.path.join(SCRIPTS, "tasks.yaml"))
+    assert descriptions["vuln_suid_gtfo"] == "suid allow access to gtfo bins"
+    assert "all" not in descriptions
+
+
+def test_plan_jobs():
+    targets = [Target("a", "vuln_suid_gtfo", "10.0.0.1"), Target("b", "other", "10.0.0.2", 2222)]
+    jobs = plan_jobs(targets, {"max_turns": 20}, {"llm.model": ["gpt-4o", "gpt-4o-mini"], "hint": [True, False]}, 2)
+    assert len(jobs) == 2 * 2 * 2 * 2
+    assert len({job.key for job in jobs}) == len(jobs)
+
+    job = Job(targets[1], {"llm.model": "gpt-4o", "hint": True}, 1, {"max_turns": 20})
+    assert job.key == "other/b llm.model=gpt-4o hint=true rep=1"
+    assert job.arguments({"other": "sudo without password"}) == [
+        "--conn.host=10.0.0.2",
+        "--conn.hostname=b",
+        "--conn.port=2222",
+        "--max_turns=20",
+        "--llm.model=gpt-4o",
+        "--hint=sudo without password",
+    ]
+    assert Job(targets[0], {"hint": False}, 1).arguments({"vuln_suid_gtfo": "suid"})[-1] == "--hint="
+
+
+def test_progress_resume(tmp_path):
+    path = str(tmp_path / "campaign.progress.jsonl")
+    done, failed, pending = [Job(Target(name, "group", name), {}, 1) for name in ("done", "failed", "pending")]
+
+    progress = CampaignProgress(path)
+    progress.record(done, {"result": False, "run_id": 1, "error": None, "budget_exceeded": False})
+    progress.record(failed, {"result": None, "run_id": 2, "error": "ConnectionError: refused", "budget_exceeded": False})
+
+    resumed = CampaignProgress(path)
+    assert resumed.is_finished(done)
+    assert not resumed.is_finished(failed)
+    assert not resumed.is_finished(pending)
+
+
+def test_run_job_reports_errors():
+    result = run_job("NoSuchUseCase", [])
+    assert result["result"] is None
+    assert result["error"] is not None
+    assert not result["budget_exceeded"]
+
+
+def test_campaign_run(tmp_path):
+    (tmp_path / "hosts.ini").write_text("[vuln]\nroot-box\nuser-box\n")
+    campaign_file = tmp_path / "campaign.json"
+    campaign_file.write_text(json.dumps({
+        "name": "test",
+        "use_case": "FakeCampaignJob",
+        "imports": ["tests.campaign_fake_use_case"],
+        "inventory": "hosts.ini",
+        "repetitions": 2,
+        "parameters": {"max_turns": 2},
+    }))
+
+    log_db = DbStorage(str(tmp_path / "campaign.sqlite3"))
+    log_db.init()
+    # a single worker runs all jobs, so that leaked connections of a job are noticed by the next one
+    campaign = Campaign(log=LocalLogger(log_db=log_db, console=Console(mode="headless")), campaign_file=str(campaign_file), workers=1)
+    campaign.init()
+    assert campaign.run({}) is True
+
+    progress = CampaignProgress(campaign.progress_file)
+    assert sorted(progress.finished) == ["vuln/root-box rep=1", "vuln/root-box rep=2", "vuln/user-box rep=1", "vuln/user-box rep=2"]
+    for job, entry in progress.finished.items():
+        assert entry["result"] is job.startswith("vuln/root-box")
+        assert log_db.get_run(entry["run_id"]).tag == f"test {job}"
+
+
+def test_rate_limiter_budget():
+    limiter = SharedRateLimiter(token_budget=100)
+    limiter.acquire()
+    limiter.record(60)
+    limiter.acquire()
+    limiter.record(60)
+    assert limiter.used_tokens == 120
+    with pytest.raises(BudgetExceeded):
+        limiter.acquire()
+
+
+def test_rate_limiter_requests_per_minute():
+    limiter = SharedRateLimiter(requests_per_minute=600)  # a request every 0.1s once the burst is used up
+    for _ in range(600):
+        limiter.acquire()
+    started = time.monotonic()
+    limiter.acquire()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.1
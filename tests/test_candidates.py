@@ -0,0 +1,26 @@
+from hackingBuddyGPT.usecases.privesc.candidates import is_gtfobins, is_read_only, rank_candidates
+from hackingBuddyGPT.utils.loop_detector import fingerprint
+
+
+def test_classification():
+    assert is_read_only("cat /etc/passwd")
+    assert is_read_only("/usr/bin/find / -perm -4000")
+    assert is_read_only("sudo -l")
+    assert not is_read_only("chmod +s /bin/bash")
+    assert is_gtfobins("/usr/bin/python3.11 -c 'import os; os.setuid(0); os.system(\"/bin/sh\")'")
+    assert is_gtfobins("sudo vim -c ':!/bin/sh'")
+    assert not is_gtfobins("sudo -l")
+
+
+def test_ranking_prefers_unseen_then_read_only_then_gtfobins():
+    candidates = [
+        "id",
+        "chmod +s /tmp/x",
+        "ls  -la /root",
+        "id ;",
+        "find . -exec /bin/sh -p \\; -quit",
+        "ls -la /root",
+    ]
+    ranked = rank_candidates(candidates, seen={fingerprint("id")})
+
+    assert ranked == ["ls  -la /root", "find . -exec /bin/sh -p \\; -quit", "chmod +s /tmp/x", "id"]
@@ -0,0 +1,75 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import hackingBuddyGPT
+from hackingBuddyGPT.usecases.base import use_cases
+from hackingBuddyGPT.usecases.manifest import USE_CASES
+
+HEAVY_MODULES = ["openai", "instructor", "langchain_core", "chromadb", "nltk", "fastapi", "uvicorn", "bs4", "pypsexec"]
+
+
+def test_manifest_matches_registered_use_cases():
+    for module, _ in set(USE_CASES.values()):
+        importlib.import_module(module)
+
+    assert {name: (use_case.__module__, use_case.description) for name, use_case in use_cases.items()} == USE_CASES
+
+
+def imported_heavy_modules(code: str) -> list[str]:
+    script = f"""
+import json, sys
+{code}
+print(json.dumps(sorted(name for name in sys.modules if name.split(".")[0] in {HEAVY_MODULES!r})))
+"""
+    # the tests might run without the package being installed
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(hackingBuddyGPT.__file__)))
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, env=env).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_cli_startup_does_not_import_use_cases():
+    modules = imported_heavy_modules("""
+from hackingBuddyGPT.cli.wintermute import main
+sys.argv = ["wintermute", "--help"]
+try:
+    main()
+except SystemExit:
+    pass
+""")
+    assert modules == []
+
+
+def test_use_case_only_imports_its_dependencies():
+    modules = imported_heavy_modules("""
+from hackingBuddyGPT.usecases.base import load_use_case
+load_use_case("LinuxPrivesc")
+""")
+    assert modules == []
+
+
+def test_cli_import_time(record_property):
+    # measures how long importing the cli takes (which every process of a campaign pays), it is only reported and not
+    # checked against a limit, as that depends too much on the machine
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(hackingBuddyGPT.__file__)))
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from hackingBuddyGPT.cli.wintermute import main"],
+        capture_output=True, text=True, check=True, env=env,
+    ).stderr
+
+    # lines look like "import time:       self [us] |       cumulative | imported package", nested imports are indented
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, total, package = line[len("import time:"):].split("|")
+        if not package.startswith("  "):
+            cumulative[package.strip()] = int(total)
+
+    total_ms = sum(cumulative.values()) / 1000
+    slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:5]
+    record_property("cli_import_time_ms", total_ms)
+    print(f"importing the cli took {total_ms:.1f}ms, slowest: " + ", ".join(f"{name} {us / 1000:.1f}ms" for name, us in slowest))
+    assert "hackingBuddyGPT.cli.wintermute" in cumulative
@@ -0,0 +1,71 @@
+from hackingBuddyGPT.utils.cli_history import SlidingCliHistory
+from hackingBuddyGPT.utils.llm_util import LLM
+
+
+class CharacterLLM(LLM):
+    """
+    Every character is a token, and all counted characters are tracked.
+    """
+
+    model: str = "characters"
+    context_size: int = 100
+
+    def __init__(self):
+        self.counted = 0
+
+    def get_response(self, prompt, **kwargs):
+        raise NotImplementedError()
+
+    def encode(self, query) -> list[int]:
+        self.counted += len(query)
+        return [ord(c) for c in query]
+
+
+def test_history_keeps_newest_commands():
+    history = SlidingCliHistory(CharacterLLM())
+    history.add_command("id", "uid=1001\n")  # 14 tokens
+    history.add_command("whoami", "lowpriv\n")  # 17 tokens
+
+    assert history.get_history(100) == "$ id\nuid=1001\n$ whoami\nlowpriv\n"
+    assert history.get_history(17) == "$ whoami\nlowpriv\n"
+    # the oldest segment that only partially fits keeps its command and the end of its output
+    assert history.get_history(17 + 8) == "$ id\n01\n$ whoami\nlowpriv\n"
+    assert history.get_history(3) == ""
+
+
+def test_history_slides_at_maximum_size():
+    history = SlidingCliHistory(CharacterLLM())
+    for i in range(20):
+        history.add_command(f"echo {i}", f"{i:>4}\n")  # 14 tokens each
+
+    assert history.total_tokens <= 100
+    assert history.total_tokens == len(history.sliding_history)
+    assert history.sliding_history.endswith("$ echo 19\n  19\n")
+    assert "echo 12\n" not in history.sliding_history
+
+
+def test_history_cost_does_not_grow_with_history():
+    llm = CharacterLLM()
+    history = SlidingCliHistory(llm)
+    history.add_command("ls", "x" * 30)
+
+    llm.counted = 0
+    history.add_command("id", "uid=1001\n")
+    history.get_history(50)
+    cost_of_small_history = llm.counted
+
+    for _ in range(10):
+        history.add_command("ls", "x" * 30)
+    llm.counted = 0
+    history.add_command("id", "uid=1001\n")
+    history.get_history(50)
+    assert llm.counted <= cost_of_small_history + 50
+
+
+def test_commands_and_last_output():
+    history = SlidingCliHistory(CharacterLLM())
+    history.add_command_only("id", "uid=1001\n")
+    history.add_command_only("whoami", "lowpriv\n")
+
+    assert history.get_commands_and_last_output(100) == "$ id\n$ whoami\nlowpriv\n"
+    assert history.get_commands_and_last_output(4) == "riv\n"
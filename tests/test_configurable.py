@@ -0,0 +1,132 @@
+import os
+import threading
+from dataclasses import dataclass
+
+import pytest
+
+from hackingBuddyGPT.utils.configurable import Parseable, configurable, get_environment_variables, parameter
+
+
+@configurable("connection", "a connection")
+@dataclass
+class Connection:
+    host: str = parameter(desc="host to connect to", default="localhost")
+    port: int = parameter(desc="port to connect to", default=22)
+
+
+@configurable("tool", "a tool")
+@dataclass
+class Tool:
+    conn: Connection
+    max_turns: int = parameter(desc="turns", default=10)
+
+    def run(self):
+        pass
+
+
+def test_name_index():
+    parseable = Parseable(Tool, "a tool")
+    assert parseable.name_index == {
+        "conn.host": ["conn", "host"],
+        "conn.port": ["conn", "port"],
+        "max_turns": ["max_turns"],
+    }
+
+
+def test_environment_variables(monkeypatch):
+    parseable = Parseable(Tool, "a tool")
+    for key in list(os.environ):
+        monkeypatch.delenv(key)
+    monkeypatch.setenv("conn.host", "target")
+    monkeypatch.setenv("conn_port", "2222")  # legacy spellings
+    monkeypatch.setenv("MAX_TURNS", "3")
+    monkeypatch.setenv("unrelated", "value")
+
+    parsing_results = {}
+    _, env_results = get_environment_variables(parsing_results, parseable.parameter_collection, parseable.name_index)
+    assert env_results == {"conn": {"host": "target", "port": "2222"}, "max_turns": "3"}
+    assert parsing_results == env_results
+
+
+# only reached if the services are not initialized concurrently, in which case the barrier breaks
+BARRIER_TIMEOUT = 10
+init_order = []
+# the independent services (database, ssh and llm) can only pass it if they are initialized at the same time
+services_barrier = threading.Barrier(3, timeout=BARRIER_TIMEOUT)
+
+
+@configurable("slow_service", "a service that takes a while to connect")
+@dataclass
+class SlowService:
+    name: str = parameter(desc="name", default="service")
+    fail: bool = parameter(desc="fail instead of connecting", default=False)
+
+    def init(self):
+        if self.fail:
+            raise ConnectionError(f"{self.name} is down")
+        services_barrier.wait()
+        init_order.append(self.name)
+
+
+@configurable("client", "uses a service")
+@dataclass
+class ServiceClient:
+    service: SlowService
+
+    def init(self):
+        assert self.service.name in init_order  # dependencies are initialized first
+        init_order.append("client")
+
+
+@configurable("agent", "an agent with several independent services")
+@dataclass
+class Agent:
+    database: SlowService
+    ssh: SlowService
+    client: ServiceClient
+
+    def run(self):
+        pass
+
+
+def instantiate_agent(**values):
+    parseable = Parseable(Agent, "an agent")
+    collection = {
+        "database": {"name": "database", "fail": values.get("database_fails", False)},
+        "ssh": {"name": "ssh", "fail": False},
+        "client": {"service": {"name": "llm", "fail": False}},
+    }
+    return parseable(collection)
+
+
+def test_independent_configurables_are_initialized_concurrently():
+    init_order.clear()
+    services_barrier.reset()
+    agent = instantiate_agent()
+
+    assert agent.client.service.name == "llm"
+    assert set(init_order) == {"database", "ssh", "llm", "client"}
+    assert init_order.index("llm") < init_order.index("client")
+
+
+def test_initialization_fails_fast():
+    init_order.clear()
+    services_barrier.reset()
+    try:
+        # ssh and llm wait at the barrier for the database, which fails, so the error has to be raised while they wait
+        with pytest.raises(ConnectionError, match="database is down"):
+            instantiate_agent(database_fails=True)
+        assert init_order == []
+    finally:
+        services_barrier.abort()
+
+
+def test_bool_parameters():
+    @configurable("flags", "flags")
+    @dataclass
+    class Flags:
+        enabled: bool = parameter(desc="enabled", default=True)
+
+    for value, expected in [("false", False), ("0", False), ("no", False), ("true", True), ("1", True)]:
+        definition = Parseable(Flags, "flags").parameter_collection["enabled"]
+        assert definition({"enabled": value}) is expected
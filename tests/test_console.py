@@ -0,0 +1,55 @@
+from hackingBuddyGPT.utils import Console
+
+
+def recording_console(**kwargs) -> Console:
+    console = Console(**kwargs)
+    console.record = True
+    console.width = 80
+    return console
+
+
+def test_full_mode_truncates_panels():
+    console = recording_console(max_panel_chars=10)
+    console.print_message("assistant", "0123456789abcdefghij")
+    console.print_tool_call("exec_command", "id", "")
+
+    output = console.export_text()
+    assert "0123456789" in output
+    assert "abcdefghij" not in output
+    assert "[10 more characters truncated]" in output
+    assert "Tool Call: exec_command" in output
+
+
+def test_summary_mode():
+    console = recording_console(mode="summary")
+    console.print_message("system", "first line [red]\nsecond line")
+    console.print_tool_call("exec_command", "id", "uid=0(root)")
+    console.stream_header("ASSISTANT:")
+    console.stream("streamed")
+    console.end_stream()
+
+    assert console.export_text().splitlines() == [
+        "system: first line [red] (28 chars)",
+        "Tool Call: exec_command id (2 chars) -> uid=0(root) (11 chars)",
+    ]
+
+
+def test_headless_mode():
+    console = recording_console(mode="headless")
+    console.print_message("system", "content")
+    console.log("log message")
+    assert console.export_text() == ""
+
+
+def test_streaming_is_throttled():
+    console = recording_console(stream_fps=1)
+    writes = []
+    console.flush_stream = lambda now=None, flush=console.flush_stream: (writes.append(list(console._stream_buffer)), flush(now))
+
+    for token in ["a", "b", "c"]:
+        console.stream(token)
+    assert writes == [["a"]]  # the first token is written right away, the others are held back
+
+    console.end_stream()
+    assert writes[-1] == ["b", "c"]
+    assert console.export_text() == "abc\n"
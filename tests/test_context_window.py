@@ -0,0 +1,73 @@
+from hackingBuddyGPT.utils.context_window import MESSAGE_OVERHEAD, ContextWindow
+
+
+class CountingTokenizer:
+    """
+    Every character is a token, the counted characters are tracked.
+    """
+
+    def __init__(self):
+        self.counted = 0
+
+    def __call__(self, text: str) -> int:
+        self.counted += len(text)
+        return len(text)
+
+
+def user(content: str) -> dict:
+    return {"role": "user", "content": content}
+
+
+def tool_call(call_id: str, arguments: str) -> dict:
+    return {"role": "assistant", "content": None, "tool_calls": [{"id": call_id, "type": "function", "function": {"name": "f", "arguments": arguments}}]}
+
+
+def tool_result(call_id: str, content: str) -> dict:
+    return {"role": "tool", "tool_call_id": call_id, "content": content}
+
+
+def test_counts_each_message_once():
+    tokenizer = CountingTokenizer()
+    window = ContextWindow(tokenizer, [{"role": "system", "content": "s" * 10}])
+    for _ in range(50):
+        window.append(user("x" * 10))
+    assert window.total_tokens == 51 * (10 + MESSAGE_OVERHEAD)
+    assert tokenizer.counted == 51 * 10
+
+    window.window(100)
+    assert tokenizer.counted == 51 * 10
+
+
+def test_window_keeps_system_prompt_and_newest_messages():
+    window = ContextWindow(len, [{"role": "system", "content": "system"}])
+    for i in range(10):
+        window.append(user(f"message {i}"))  # 13 tokens each
+
+    assert window.window(1000) == list(window)
+    selected = window.window(10 + 3 * 13)
+    assert selected == [window[0], window[8], window[9], window[10]]
+
+
+def test_window_does_not_separate_tool_calls_from_results():
+    window = ContextWindow(len, [{"role": "system", "content": "system"}, user("go")])
+    window.append(tool_call("1", "a" * 20))
+    window.append(tool_result("1", "r" * 20))
+    window.append(tool_call("2", "b" * 20))
+    window.append(tool_result("2", "r" * 20))
+    window.append(tool_result("2", "r" * 20))
+
+    # the last group (call 2 and its results) is 25 + 3 * 24 tokens, which leaves no room for the first one
+    selected = window.window(10 + 25 + 3 * 24 + 10)
+    assert selected == [window[0], window[4], window[5], window[6]]
+    assert selected[1]["role"] == "assistant"
+
+    # the newest group is always sent, even if it does not fit
+    assert window.window(1) == [window[0], window[4], window[5], window[6]]
+
+
+def test_modifications_keep_the_index_consistent():
+    window = ContextWindow(len, [user("a"), user("bb"), user("ccc")])
+    window.pop(0)
+    window.insert(0, user("dddd"))
+    window[1] = user("e")
+    assert window.total_tokens == sum(len(message["content"]) + MESSAGE_OVERHEAD for message in window)
@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import multiprocessing
+
+from hackingBuddyGPT.utils.db_storage.db_executor import DbExecutor
+from hackingBuddyGPT.utils.db_storage.db_storage import RawDbStorage
+
+
+def create_db_with_run(path: str, messages: int = 10) -> tuple[RawDbStorage, int]:
+    db = RawDbStorage(path)
+    db.init()
+    run_id = db.create_run("fake_model", "test", datetime.datetime.now(), "{}")
+    for i in range(messages):
+        db.add_message(run_id, i, None, "user", f"message {i}", 0, 0, datetime.timedelta(0))
+    return db, run_id
+
+
+def test_paged_history(tmp_path):
+    db, run_id = create_db_with_run(str(tmp_path / "log.sqlite3"))
+    db.add_tool_call(run_id, 3, "0", "exec_command", "id", "uid=0(root)", datetime.timedelta(seconds=1))
+    db.add_section(run_id, 0, "round 1", 2, 5, datetime.timedelta(seconds=1))
+
+    page = db.get_messages_by_run(run_id, after_id=3, limit=4)
+    assert [m.id for m in page] == [4, 5, 6, 7]
+
+    assert len(db.get_tool_calls_by_run(run_id, message_after=None, message_until=3)) == 1
+    assert len(db.get_tool_calls_by_run(run_id, message_after=3)) == 0
+    assert len(db.get_sections_by_run(run_id, from_message_after=1, from_message_until=2)) == 1
+    assert len(db.get_sections_by_run(run_id, from_message_after=2)) == 0
+
+
+def test_history_pages_from_the_end(tmp_path):
+    db, run_id = create_db_with_run(str(tmp_path / "log.sqlite3"))
+    db.add_section(run_id, 0, "round 1", 0, None, datetime.timedelta(0))
+
+    assert [m.id for m in db.get_latest_messages_by_run(run_id, limit=4)] == [6, 7, 8, 9]
+    assert [m.id for m in db.get_latest_messages_by_run(run_id, before_id=2, limit=4)] == [0, 1]
+    assert len(db.get_sections_overlapping(run_id, 6)) == 1
+
+    assert db.handle_message_update(run_id, 9, "append", " continued") == 1
+    assert db.handle_message_update(run_id, 9, "append", " more") == 2
+    assert db.get_latest_messages_by_run(run_id, limit=1)[0].content == "message 9 continued more"
+
+
+def test_db_executor(tmp_path):
+    db, run_id = create_db_with_run(str(tmp_path / "log.sqlite3"))
+
+    async def access():
+        executor = DbExecutor(db, readers=2)
+        try:
+            await executor.write("add_message", run_id, 10, None, "assistant", "hello", 1, 1, datetime.timedelta(0))
+            return await executor.read("get_messages_by_run", run_id)
+        finally:
+            executor.shutdown()
+
+    messages = asyncio.run(access())
+    assert len(messages) == 11
+    assert messages[-1].content == "hello"
+
+
+def test_db_executor_in_memory():
+    db, run_id = create_db_with_run(":memory:", messages=3)
+
+    async def access():
+        executor = DbExecutor(db)
+        try:
+            return await executor.read("get_messages_by_run", run_id)
+        finally:
+            executor.shutdown()
+
+    assert len(asyncio.run(access())) == 3
+
+
+def test_search(tmp_path):
+    db, run_id = create_db_with_run(str(tmp_path / "log.sqlite3"), messages=0)
+    db.add_message(run_id, 0, None, "assistant", "/usr/bin/python3.11 -c 'import os'", 0, 0, datetime.timedelta(0))
+    db.add_tool_call(run_id, 0, "0", "exec_command", "sudo -l", "Sorry, user lowpriv may not run sudo", datetime.timedelta(0))
+
+    # streamed messages are indexed once they are finalized
+    db.add_or_update_message(run_id, 1, None, "assistant", "", 0, 0, datetime.timedelta(0))
+    db.handle_message_update(run_id, 1, "append", "the password is trustno1")
+    assert db.search("trustno1") == []
+    db.add_or_update_message(run_id, 1, None, "assistant", "", 10, 5, datetime.timedelta(0))
+
+    [result] = db.search("trustno1")
+    assert (result.message_id, result.tool_call_id) == (1, None)
+    assert "\x02trustno1\x03" in result.snippet
+
+    [result] = db.search("lowpriv")
+    assert result.tool_call_id == "0"
+
+    assert len(db.search("/usr/bin/python3.11")) == 1
+
+
+def write_round(db: RawDbStorage, run_id: int, round: int, first_message: int):
+    db.add_section(run_id, round, f"round {round}", first_message, None, datetime.timedelta(0))
+    db.add_section(run_id, 100 + round, "Executing that command...", first_message, None, datetime.timedelta(0))
+    db.add_message(run_id, first_message, "Asking LLM for a new command...", "assistant", "id", 20, 2, datetime.timedelta(seconds=2))
+    db.add_tool_call(run_id, first_message, "0", "exec_command", "id", "uid=1000(lowpriv)", datetime.timedelta(seconds=1))
+    db.add_or_update_message(run_id, first_message + 1, "Analyze its result...", "assistant", "", 0, 0, datetime.timedelta(0))
+    db.add_or_update_message(run_id, first_message + 1, "Analyze its result...", "assistant", "not root", 30, 3, datetime.timedelta(seconds=3))
+    db.add_section(run_id, round, f"round {round}", first_message, first_message + 2, datetime.timedelta(seconds=10))
+
+
+def test_statistics(tmp_path):
+    db, run_id = create_db_with_run(str(tmp_path / "log.sqlite3"), messages=0)
+    write_round(db, run_id, 1, 0)
+    write_round(db, run_id, 2, 2)
+
+    first, second = db.get_round_stats(run_id)
+    assert (first.round, first.command, first.llm_calls, first.tool_calls, first.response_size) == (1, "id", 2, 1, 17)
+    assert (first.tokens_query, first.tokens_response, first.llm_time) == (50, 5, 5.0)
+    assert first.overhead == 4.0
+    assert second.from_message == 2
+
+    [run] = db.get_run_stats(run_id)
+    assert (run.rounds, run.messages, run.llm_calls, run.tool_calls, run.duration) == (2, 4, 4, 2, 20.0)
+
+    assert db.get_round_data(run_id, 2, True, True) == ["2.0000", "20/2", "id", "17", "not root", "3.0000", "30/3", "", ""]
+    assert db.get_round_data(run_id, 3, False, False) == ["", "", "", ""]
+
+
+def test_statistics_backfill(tmp_path):
+    path = str(tmp_path / "log.sqlite3")
+    db, run_id = create_db_with_run(path, messages=0)
+    write_round(db, run_id, 1, 0)
+    expected_rounds, expected_runs = db.get_round_stats(run_id), db.get_run_stats()
+
+    db.cursor.executescript("DROP TABLE run_stats; DROP TABLE round_stats; DROP TABLE round_conversation_stats;")
+    db = RawDbStorage(path)
+    db.init()
+    assert db.get_round_stats(run_id) == expected_rounds
+    assert db.get_run_stats() == expected_runs
+    assert db.get_round_data(run_id, 1, True, False)[4] == "not root"
+
+
+def write_run_from_process(path: str, messages: int) -> int:
+    db, run_id = create_db_with_run(path, messages=messages)
+    db.add_section(run_id, 0, "round 1", 0, messages, datetime.timedelta(0))
+    db.run_was_success(run_id)
+    return run_id
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / "log.sqlite3")
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        run_ids = pool.starmap(write_run_from_process, [(path, 50)] * 12)
+    assert len(set(run_ids)) == 12
+
+    db = RawDbStorage(path)
+    db.init()
+    assert db.read_cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert all(run.state == "got root" for run in db.get_runs())
+    assert [stats.messages for stats in db.get_run_stats()] == [50] * 12
@@ -58,6 +58,27 @@ class TestLLMHandler(unittest.TestCase):
         self.assertIn(created_object, created_objects[object_type])
         self.assertEqual(created_objects, self.llm_handler.created_objects)
 
+    def test_adjust_prompt_keeps_tool_results_with_their_call(self):
+        prompt = [
+            {"role": "system", "content": "system"},
+            {"role": "user", "content": "go"},
+            {"role": "assistant", "content": None, "tool_calls": [{"id": "1", "type": "function", "function": {"name": "f", "arguments": "{}"}}]},
+            {"role": "tool", "tool_call_id": "1", "content": "first"},
+            {"role": "tool", "tool_call_id": "1", "content": "second"},
+        ]
+
+        self.assertEqual(self.llm_handler.adjust_prompt(prompt, num_prompts=1), prompt[2:])
+        self.assertEqual(self.llm_handler.adjust_prompt(prompt, num_prompts=4), prompt[1:])
+
+    def test_adjust_prompt_based_on_token(self):
+        self.llm_mock.count_tokens = len
+        prompt = [{"role": "system", "content": "system"}] + [{"role": "user", "content": f"message {i}"} for i in range(10)]
+
+        adjusted = self.llm_handler.adjust_prompt_based_on_token(prompt, max_tokens=10 + 2 * 13)
+
+        self.assertEqual(adjusted, [prompt[0], prompt[9], prompt[10]])
+        self.assertEqual(len(prompt), 11)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,44 @@
+from hackingBuddyGPT.utils.loop_detector import LoopDetector, fingerprint, tool_call_fingerprint
+
+
+def test_fingerprint_ignores_whitespace_quoting_and_trailing_semicolon():
+    assert fingerprint("cat  '/etc/passwd' ;") == fingerprint('cat "/etc/passwd"') == "cat /etc/passwd"
+    assert fingerprint("echo 'unbalanced") == "echo 'unbalanced"
+    assert fingerprint("ls -la") != fingerprint("ls -l")
+
+
+def test_fingerprint_keeps_the_words_of_a_command_apart():
+    assert fingerprint("sh -c 'id; whoami'") != fingerprint("sh -c id; whoami")
+    assert fingerprint('grep "a b" f') != fingerprint("grep a b f")
+    assert fingerprint('grep "a b"  f') == fingerprint("grep 'a b' f")
+
+
+def test_tool_call_fingerprint_ignores_argument_order():
+    assert tool_call_fingerprint("http", '{"url": "/", "method": "GET"}') == tool_call_fingerprint("http", '{"method":"GET","url":"/"}')
+    assert tool_call_fingerprint("http", '{"url": "/"}') != tool_call_fingerprint("submit", '{"url": "/"}')
+
+
+def test_detector_counts_repeats_within_window():
+    detector = LoopDetector(window=2)
+    detector.record("id", "uid=1001")
+    detector.record("whoami", "lowpriv")
+
+    assert detector.lookup("id") == "uid=1001"
+    assert detector.lookup("whoami") == "lowpriv"
+    assert detector.repeats == 2
+
+    detector.record("sudo -l", "no sudo")
+    assert detector.repeats == 0
+    # only the last two distinct commands are remembered
+    assert detector.lookup("id") is None
+
+
+def test_detector_checkpoint():
+    detector = LoopDetector(window=3)
+    detector.record("id", "uid=1001")
+    detector.lookup("id")
+
+    restored = LoopDetector(window=3)
+    restored.restore(detector.checkpoint())
+    assert restored.lookup("id") == "uid=1001"
+    assert restored.repeats == 2
@@ -0,0 +1,34 @@
+import time
+
+from hackingBuddyGPT.usecases.examples.lse import ExPrivEscLinuxLSEUseCase
+from hackingBuddyGPT.utils.console.console import Console
+from hackingBuddyGPT.utils.db_storage.db_storage import DbStorage
+from hackingBuddyGPT.utils.fakes import ROOT_COMMAND, HintedFakeLLM, SessionFakeSSHConnection
+from hackingBuddyGPT.utils.logging import LocalLogger
+
+
+def test_parallel_hints_stop_at_first_root():
+    sessions = []
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(mode="headless"), tag="lse")
+    llm = HintedFakeLLM({"wait": ["sleep", "sleep"], "enumerate": ["id", "id", "id"], "python": ["id", ROOT_COMMAND]})
+    use_case = ExPrivEscLinuxLSEUseCase(conn=SessionFakeSSHConnection(sessions), llm=llm, log=log, max_turns=9, parallel=True)
+    log.start_run(use_case.get_name(), "{}")
+
+    started = time.monotonic()
+    assert use_case.run_in_parallel(["wait", "enumerate", "python"], 3) is True
+    # the agent that is blocked in a command is interrupted instead of running into its timeout
+    assert time.monotonic() - started < 4
+    assert len(sessions) == 3
+    assert all(session.closed.is_set() for session in sessions)
+
+    sections = {section.name: section for section in log_db.get_sections_by_run(log.run.id)}
+    assert {"exploring 3 hints in parallel", "hint 1: wait", "hint 2: enumerate", "hint 3: python"} <= sections.keys()
+    conversations = {message.conversation for message in log_db.get_messages_by_run(log.run.id)}
+    assert any(conversation and conversation.startswith("hint 3") for conversation in conversations)
+
+    # the message ranges of the branches overlap, so their sections are limited to the conversations of the branch
+    assert sections["exploring 3 hints in parallel"].conversation is None
+    assert [sections[f"hint {i}: {hint}"].conversation for i, hint in enumerate(["wait", "enumerate", "python"], start=1)] == ["hint 1", "hint 2", "hint 3"]
+    assert all(section.conversation is not None for name, section in sections.items() if name.startswith("turn "))
@@ -0,0 +1,73 @@
+import datetime
+import urllib.request
+from typing import Tuple
+
+from hackingBuddyGPT.capabilities import Capability
+from hackingBuddyGPT.utils import DbStorage, metrics
+from hackingBuddyGPT.utils.metrics import MetricsRegistry, start_metrics_server
+
+
+def test_rendering():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["model"])
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.gauge("clients", "Clients").set(3)
+
+    requests.labels("gpt-4o").inc()
+    requests.labels(model='say "hi"').inc(2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{model="gpt-4o"} 1' in text
+    assert 'requests_total{model="say \\"hi\\""} 2' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "latency_seconds_count 3" in text
+    assert "clients 3" in text
+
+
+class Echo(Capability):
+    def describe(self) -> str:
+        return "echoes the text"
+
+    def __call__(self, text: str) -> Tuple[str, bool]:
+        return text, False
+
+
+def test_capability_instrumentation():
+    duration = metrics.capability_duration.labels("Echo")
+    size = metrics.capability_output_bytes.labels("Echo")
+    count, output = duration.count, size.value
+
+    assert Echo()("äbc") == ("äbc", False)
+    assert duration.count == count + 1
+    assert size.value == output + 4
+
+    # the signature is still visible for function calling
+    assert list(Echo().to_model().model_fields) == ["text"]
+
+
+def test_db_write_duration():
+    duration = metrics.db_write_duration.labels("create_run")
+    count = duration.count
+
+    db = DbStorage(":memory:")
+    db.init()
+    db.create_run("model", "tag", datetime.datetime.now(), "{}")
+    assert duration.count == count + 1
+
+
+def test_metrics_server():
+    server = start_metrics_server("127.0.0.1:0")
+    try:
+        host, port = server.server_address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert "# TYPE hackingbuddy_llm_request_duration_seconds histogram" in response.read().decode()
+    finally:
+        server.shutdown()
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from hackingBuddyGPT.usecases.base import AutonomousUseCase
+from hackingBuddyGPT.utils import Console
+from hackingBuddyGPT.utils.db_storage.db_storage import DbStorage
+from hackingBuddyGPT.utils.logging import LocalLogger
+
+
+def busy_work(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class BusyUseCase(AutonomousUseCase):
+    def get_name(self) -> str:
+        return "busy"
+
+    def perform_round(self, turn: int):
+        busy_work(0.05)
+        return False
+
+
+@pytest.mark.parametrize("mode, extension", [("cprofile", "prof"), ("sampling", "folded")])
+def test_round_profiles(tmp_path, mode, extension):
+    db = DbStorage(":memory:")
+    db.init()
+    log = LocalLogger(log_db=db, console=Console(), tag="profile")
+    use_case = BusyUseCase(log=log, max_turns=2, profile=mode, profile_dir=str(tmp_path), profile_interval=0.001)
+    use_case.init()
+    use_case.run({})
+
+    run_dir = tmp_path / f"run_{log.run.id}"
+    assert (run_dir / f"round_1.{extension}").exists()
+    assert (run_dir / f"round_2.{extension}").exists()
+
+    summary = (run_dir / "summary.txt").read_text()
+    assert summary.startswith("2 rounds")
+    assert "busy_work (test_profiler.py:" in summary
@@ -0,0 +1,127 @@
+import datetime
+import json
+import time
+
+from openai.types.chat import ChatCompletionMessage
+
+from hackingBuddyGPT.usecases.web.with_explanation import WebTestingWithExplanation
+from hackingBuddyGPT.utils import Console, DbStorage, LLMResult
+from hackingBuddyGPT.utils.logging import LocalLogger
+from hackingBuddyGPT.utils.rolling_summary import SUMMARY_PREFIX, RollingSummary
+
+
+class FakeChatLLM:
+    model = "fake_model"
+    context_size = 100000
+
+    def __init__(self):
+        self.prompt_sizes = []
+        self.summarized = []
+
+    def count_tokens(self, text: str) -> int:
+        return len(text)
+
+    def stream_response(self, prompt, console, capabilities=None, get_individual_updates=False):
+        self.prompt_sizes.append(len(prompt))
+        time.sleep(0.005)  # leaves the summary some time to finish
+        message = ChatCompletionMessage(role="assistant", content=f"round {len(self.prompt_sizes)}")
+        return iter([LLMResult(message, str(prompt), message.content, datetime.timedelta(0), 10, 10)])
+
+    def get_response(self, prompt, **kwargs) -> LLMResult:
+        self.summarized.append(prompt[1]["content"])
+        return LLMResult(None, str(prompt), f"summary {len(self.summarized)}", datetime.timedelta(0), 10, 10)
+
+
+def test_prompt_size_stays_flat():
+    llm = FakeChatLLM()
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(mode="headless"), tag="rolling_summary")
+    log.start_run("test", "{}")
+    agent = WebTestingWithExplanation(llm=llm, log=log, keep_recent_turns=3, summarize_every_turns=5)
+    agent.init()
+    agent.before_run()
+
+    for turn in range(1, 101):
+        agent.perform_round(turn)
+    agent.after_run()
+    agent.cleanup()
+
+    assert len(llm.summarized) >= 10
+    # system prompt, summary, the turns that are summarized next, the recent turns and one more while it is requested
+    assert max(llm.prompt_sizes[20:]) <= 1 + 1 + 5 + 3 + 1
+    assert agent._prompt_history[1]["content"].startswith(SUMMARY_PREFIX)
+    # every summary builds on the previous one
+    assert "summary 1" in llm.summarized[1]
+
+
+def test_summary_keeps_recent_turns_and_turn_boundaries():
+    llm = FakeChatLLM()
+    summary = RollingSummary(llm, keep_recent_turns=2, summarize_every_turns=2)
+    history = [{"role": "system", "content": "system"}]
+    for turn in range(4):
+        summary.start_turn(history)
+        history.append({"role": "assistant", "content": f"call {turn}", "tool_calls": [{"id": str(turn), "function": {"name": "f", "arguments": "{}"}}]})
+        history.append({"role": "tool", "tool_call_id": str(turn), "content": f"result {turn}"})
+        summary.maybe_start(history)
+
+    assert summary.apply(history, wait=True).answer == "summary 1"
+    assert [message["content"] for message in history] == ["system", SUMMARY_PREFIX + "summary 1", "call 2", "result 2", "call 3", "result 3"]
+    assert "result 1" in llm.summarized[0] and "call 2" not in llm.summarized[0]
+
+
+class FailingSummaryLLM(FakeChatLLM):
+    def get_response(self, prompt, **kwargs) -> LLMResult:
+        self.summarized.append(prompt[1]["content"])
+        raise ConnectionError("the API is not reachable")
+
+
+def test_failed_summaries_back_off_and_give_up():
+    llm = FailingSummaryLLM()
+    summary = RollingSummary(llm, keep_recent_turns=1, summarize_every_turns=2, max_failures=3)
+    history = [{"role": "system", "content": "system"}]
+    attempts = []
+    for turn in range(1, 31):
+        summary.start_turn(history)
+        history.append({"role": "assistant", "content": f"call {turn}"})
+        summary.maybe_start(history)
+        try:
+            summary.apply(history, wait=True)
+        except ConnectionError:
+            attempts.append(turn)
+
+    # the first attempt once 2 turns are older than the recent one, then after 2, 4 and no more turns
+    assert attempts == [3, 5, 9]
+    assert summary.disabled
+    assert len(history) == 31
+    summary.close()
+
+
+def test_checkpoint_restores_history_summary_and_flags():
+    log_db = DbStorage(":memory:")
+    log_db.init()
+    log = LocalLogger(log_db=log_db, console=Console(mode="headless"), tag="rolling_summary")
+    log.start_run("test", "{}")
+
+    def create_agent():
+        agent = WebTestingWithExplanation(llm=FakeChatLLM(), log=log, keep_recent_turns=3, summarize_every_turns=5, flags="a,b")
+        agent.init()
+        agent.before_run()
+        return agent
+
+    agent = create_agent()
+    for turn in range(1, 13):
+        agent.perform_round(turn)
+    agent.get_capability("SubmitFlag")("FLAG.a.GALF")
+    checkpoint = json.loads(json.dumps(agent.checkpoint()))
+    agent.after_run()
+    agent.cleanup()
+
+    restored = create_agent()
+    restored.restore(checkpoint)
+    assert [message["content"] for message in restored._prompt_history] == [message["content"] for message in checkpoint["prompt_history"]]
+    assert restored._prompt_history.total_tokens > 0
+    assert restored._summary.checkpoint() == checkpoint["summary"]
+    assert restored.get_capability("SubmitFlag")("FLAG.a.GALF") == "Flag already submitted"
+    restored.after_run()
+    restored.cleanup()
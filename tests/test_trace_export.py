@@ -0,0 +1,41 @@
+import datetime
+import json
+import time
+
+from hackingBuddyGPT.utils import Console
+from hackingBuddyGPT.utils.db_storage.db_storage import RawDbStorage
+from hackingBuddyGPT.utils.logging import LocalLogger
+from hackingBuddyGPT.utils.trace_export import export_run_trace
+
+
+def test_trace_of_a_round(tmp_path):
+    db = RawDbStorage(":memory:")
+    db.init()
+    log = LocalLogger(log_db=db, console=Console(), trace_file=str(tmp_path / "run_{run_id}.json"))
+    log.start_run("fake_model", "{}")
+
+    with log.section("round 1"):
+        with log.conversation("Asking LLM for a new command...", start_section=True):
+            time.sleep(0.01)  # the LLM call and tool call are logged when they are done
+            log.add_message("assistant", "id", 10, 2, datetime.timedelta(milliseconds=5))
+        with log.section("Executing that command..."):
+            time.sleep(0.01)
+            log.add_tool_call(0, "0", "exec_command", "id", "uid=1000(lowpriv)", datetime.timedelta(milliseconds=2))
+    log.run_was_success()
+
+    with open(tmp_path / f"run_{log.run.id}.json") as f:
+        live_events = json.load(f)
+    assert [e["ph"] for e in live_events] == ["M", "B", "B", "X", "E", "B", "X", "E", "E", "i"]
+
+    exported = export_run_trace(db, log.run.id)["traceEvents"]
+    slices = [(e["cat"], e["name"]) for e in exported if e["ph"] == "X"]
+    assert slices == [
+        ("section", "round 1"),
+        ("section", "Asking LLM for a new command..."),
+        ("llm", "LLM: Asking LLM for a new command..."),
+        ("section", "Executing that command..."),
+        ("tool", "tool: exec_command"),
+    ]
+    round_slice, tool_slice = exported[1], exported[-1]
+    assert round_slice["ts"] <= tool_slice["ts"] and tool_slice["ts"] + tool_slice["dur"] <= round_slice["ts"] + round_slice["dur"]
+    assert exported[3]["args"]["tokens_query"] == 10
@@ -0,0 +1,191 @@
+import asyncio
+import datetime
+import gzip
+import json
+import os
+import time
+
+from hackingBuddyGPT.usecases.viewer import (
+    Client,
+    ControlMessage,
+    MessageType,
+    Replayer,
+    ReplayImporter,
+    RunSubscriptions,
+)
+from hackingBuddyGPT.utils.db_storage.db_storage import Message, MessageStreamPart, RawDbStorage, Run, Section, ToolCall
+from hackingBuddyGPT.utils.replay_recorder import ReplayRecorder
+
+
+def stream_part(run_id: int, message_id: int, content: str, version: int = None) -> ControlMessage:
+    return ControlMessage(MessageType.MESSAGE_STREAM_PART, MessageStreamPart(version, run_id, message_id, "append", content))
+
+
+def test_subscription_routing_and_coalescing():
+    async def scenario():
+        subscriptions = RunSubscriptions()
+        following = Client(None, None, subscriptions, queue_size=3)
+        idle = Client(None, None, subscriptions, queue_size=3)
+        subscriptions.add(following)
+        subscriptions.add(idle)
+        subscriptions.follow(following, 1)
+
+        for i in range(10):
+            assert subscriptions.publish(stream_part(1, 5, str(i))) == []
+        assert [m.data.content for m in following.queue._queue] == ["0", "123456789"]
+        assert idle.queue.empty()
+
+        run = Run(2, "fake_model", "in progress", "", datetime.datetime.now(), None, "{}")
+        subscriptions.publish(ControlMessage(MessageType.RUN, run))
+        assert idle.queue.qsize() == 1
+
+        # messages of other parts can not be merged, so the client eventually overflows
+        assert subscriptions.publish(stream_part(1, 6, "x")) == [following]
+
+    asyncio.run(scenario())
+
+
+def test_shared_messages_are_not_mutated():
+    async def scenario():
+        subscriptions = RunSubscriptions()
+        client = Client(None, None, subscriptions, queue_size=10)
+        subscriptions.add(client)
+        subscriptions.follow(client, 1)
+
+        first, second, third = stream_part(1, 5, "a"), stream_part(1, 5, "b"), stream_part(1, 5, "c")
+        for message in (first, second, third):
+            subscriptions.publish(message)
+
+        assert (first.data.content, second.data.content, third.data.content) == ("a", "b", "c")
+        assert [m.data.content for m in client.queue._queue] == ["a", "bc"]
+
+    asyncio.run(scenario())
+
+
+def unseen_content(part: MessageStreamPart, snapshot_version: int) -> str:
+    # what the client appends of a part to a message that it loaded in snapshot_version (see handleMessageStreamPart
+    # in client.js)
+    if part.id <= snapshot_version:
+        return ""
+    if part.merged_lengths is None:
+        return part.content
+    first_version = part.id - len(part.merged_lengths) + 1
+    known = sum(part.merged_lengths[: max(0, snapshot_version - first_version + 1)])
+    return part.content.encode("utf-16-le")[2 * known :].decode("utf-16-le")
+
+
+def test_coalesced_parts_are_not_skipped_by_the_snapshot():
+    async def scenario():
+        subscriptions = RunSubscriptions()
+        client = Client(None, None, subscriptions, queue_size=10)
+        subscriptions.add(client)
+        subscriptions.follow(client, 1)
+
+        for version, content in enumerate("abcd", start=1):
+            subscriptions.publish(stream_part(1, 5, content, version))
+
+        # the history snapshot already contains the message in version 1, the client skips parts up to that version
+        snapshot_version = 1
+        delivered = [m.data for m in client.queue._queue]
+        assert [(part.id, part.content) for part in delivered] == [(1, "a"), (4, "bcd")]
+        assert "".join(unseen_content(part, snapshot_version) for part in delivered) == "bcd"
+
+    asyncio.run(scenario())
+
+
+def test_snapshot_within_coalesced_parts():
+    async def scenario():
+        subscriptions = RunSubscriptions()
+        client = Client(None, None, subscriptions, queue_size=10)
+        subscriptions.add(client)
+        subscriptions.follow(client, 1)
+
+        for version, content in enumerate(["a", "bb", "\U0001f600", "d"], start=1):
+            subscriptions.publish(stream_part(1, 5, content, version))
+
+        delivered = [m.data for m in client.queue._queue]
+        assert [(part.id, part.content, part.merged_lengths) for part in delivered] == [(1, "a", None), (4, "bb\U0001f600d", [2, 2, 1])]
+        # the history snapshot was loaded while the parts 2 to 4 were merged, so it already has some of them
+        assert "".join(unseen_content(part, 2) for part in delivered) == "\U0001f600d"
+        assert "".join(unseen_content(part, 3) for part in delivered) == "d"
+        assert "".join(unseen_content(part, 4) for part in delivered) == ""
+
+    asyncio.run(scenario())
+
+
+def test_replay_recorder(tmp_path):
+    recorder = ReplayRecorder(str(tmp_path), max_open_files=2, compress=True)
+    for run_id in (1, 2, 3, 1):
+        recorder.record(run_id, f'{{"run": {run_id}}}')
+    assert list(recorder._files) == [3, 1]
+
+    recorder.flush()
+    with open(recorder.path_for(1)) as f:
+        assert f.read() == '{"run": 1}\n{"run": 1}\n'
+
+    recorder.finish_run(1)
+    recorder.record(1, '{"late": true}')
+    recorder.finish_run(1)
+    recorder.close()
+
+    with gzip.open(recorder.path_for(1) + ".gz", "rt") as f:
+        assert f.read() == '{"run": 1}\n{"run": 1}\n{"late": true}\n'
+    assert sorted(os.listdir(tmp_path)) == ["1.jsonl.gz", "2.jsonl", "3.jsonl"]
+
+
+def write_recording(path: str, run_id: int, rounds: int):
+    def event(message_type: MessageType, data) -> str:
+        return json.dumps({"at": time.time(), "message": {"type": message_type.value, "data": data.to_dict()}})
+
+    run = Run(run_id, "fake_model", "in progress", "", datetime.datetime.now(), None, "{}")
+    lines = [event(MessageType.RUN, run)]
+    for i in range(rounds):
+        lines.append(event(MessageType.SECTION, Section(run_id, i, f"round {i + 1}", 2 * i, None, datetime.timedelta(0))))
+        lines.append(event(MessageType.MESSAGE, Message(run_id, 2 * i, 0, None, "assistant", "", datetime.timedelta(0), 0, 0)))
+        lines.extend(event(MessageType.MESSAGE_STREAM_PART, MessageStreamPart(None, run_id, 2 * i, "append", c)) for c in "whoami")
+        lines.append(event(MessageType.MESSAGE, Message(run_id, 2 * i, 0, None, "assistant", "", datetime.timedelta(seconds=1), 10, 2)))
+        lines.append(event(MessageType.TOOL_CALL, ToolCall(run_id, 2 * i, "0", 0, "exec_command", "whoami", "success", "lowpriv", datetime.timedelta(seconds=1))))
+        lines.append(event(MessageType.MESSAGE, Message(run_id, 2 * i + 1, 0, None, "status", "done", datetime.timedelta(0), 0, 0)))
+        lines.append(event(MessageType.SECTION, Section(run_id, i, f"round {i + 1}", 2 * i, 2 * i + 2, datetime.timedelta(seconds=2))))
+    run.state, run.stopped_at = "got root", datetime.datetime.now()
+    lines.append(event(MessageType.RUN, run))
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def test_replay_importer(tmp_path):
+    for run_id in range(3):
+        write_recording(str(tmp_path / f"{run_id}.jsonl"), run_id, rounds=3)
+    db = RawDbStorage(":memory:")
+    db.init()
+    ReplayImporter(log_db=db, replay_file=str(tmp_path), batch_size=7).run({})
+
+    runs = db.get_runs()
+    assert [run.state for run in runs] == ["got root"] * 3
+    messages = db.get_messages_by_run(runs[0].id)
+    assert [m.content for m in messages[:2]] == ["whoami", "done"]
+    [stats] = db.get_run_stats(runs[2].id)
+    assert (stats.rounds, stats.tool_calls, stats.tokens_query) == (3, 3, 30)
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.run = None
+        self.batches = []
+
+    def start_run(self, name, configuration, tag=None, start_time=None):
+        self.run = Run(42, name, "in progress", tag, start_time, None, configuration)
+
+    def send_batch(self, messages):
+        self.batches.append(messages)
+
+
+def test_replayer_batches_messages(tmp_path):
+    write_recording(str(tmp_path / "1.jsonl"), 1, rounds=2)
+    log = RecordingLogger()
+    Replayer(log=log, replay_file=str(tmp_path / "1.jsonl"), max_pause=0).replay(str(tmp_path / "1.jsonl"))
+
+    [batch] = log.batches
+    assert len(batch) == 2 * 12 + 1
+    assert {message["data"].get("run_id", message["data"].get("id")) for message in batch} == {42}